@@ -0,0 +1,457 @@
+import os
+import json
+import logging
+import argparse
+import threading
+import numpy as np
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+META_FILE = 'meta.json'
+QUANTIZER_FILE = 'quantizer.npz'
+# 写入(追加与切换主段)的进程间锁, 以及同一时间只允许一次合并的锁
+WRITE_LOCK_FILE = 'write.lock'
+COMPACT_LOCK_FILE = 'compact.lock'
+
+# 每个子量化器的中心数, 编码为 1 字节
+PQ_CENTROIDS = 256
+
+# 索引中编号的含义: analyses 为分析记录 id(后端的相似病例索引), images 为图片目录中的序号(训练数据去重)
+KINDS = ('analyses', 'images')
+
+def _squared_distances(x, centroids):
+    """x [N, D] 与 centroids [K, D] 两两之间的平方欧氏距离"""
+    return (np.einsum('nd,nd->n', x, x)[:, None] - 2.0 * x @ centroids.T
+            + np.einsum('kd,kd->k', centroids, centroids)[None, :])
+
+def _assign(x, centroids, chunk_size=16384):
+    """分块计算每个向量最近的中心, 避免 [N, K] 距离矩阵一次占满内存"""
+    return np.concatenate([
+        _squared_distances(x[start:start + chunk_size], centroids).argmin(axis=1)
+        for start in range(0, len(x), chunk_size)
+    ]) if len(x) else np.empty(0, dtype=np.int64)
+
+@contextmanager
+def _file_lock(path):
+    """进程间互斥锁: 阻塞直到取得锁文件的独占锁"""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _kmeans(x, k, iterations=20, seed=0):
+    """
+    Lloyd k-means, 从随机样本初始化; 空簇重新取一个随机样本作为中心
+    """
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _assign(x, centroids)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, x)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        centroids[empty] = x[rng.choice(len(x), int(empty.sum()))]
+    return centroids
+
+class EmbeddingIndex:
+    """
+    图像嵌入的近似最近邻索引(IVF-PQ)
+
+    粗量化器把向量分到 nlist 个倒排列表, 向量与所属中心的残差按 m 段乘积量化为 m 个字节。
+    查询时只扫描最近的 nprobe 个列表, 用查表法(每段 256 个距离)计算近似平方欧氏距离。
+
+    磁盘上分两部分: 按列表排序的主段(.npy, 以 np.memmap 打开, 加载时不读入内存)
+    与只追加的增量段(新加入的向量, 每次 add 直接追加写盘)。增量段超过 compact_threshold
+    时在后台线程中合并进主段: 排序与写新主段时不持有锁, 查询照常进行, 只在开始取快照与
+    最后切换时短暂加锁; 新主段写完后原子更新 meta.json 切换到新一代文件, 中断不会损坏已有索引。
+    meta.json 中的 kind 记录编号的含义(见 KINDS), 不同含义的编号不能混放在同一个索引里。
+
+    多个进程(如多个服务工作进程)可以同时打开并写入同一目录: 追加与切换经锁文件互斥,
+    每次读写前检查 meta.json 与增量段文件, 读入其他进程的新记录或切换到新一代文件。
+    """
+
+    def __init__(self, directory, compact_threshold=50000):
+        self.directory = directory
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._compaction = None
+        self.meta = self._read_meta()
+        quantizer = np.load(os.path.join(directory, QUANTIZER_FILE))
+        self.coarse = quantizer['coarse']
+        self.pq = quantizer['pq']
+        self.dim = self.coarse.shape[1]
+        self.nlist = len(self.coarse)
+        self.m = len(self.pq)
+        self._coarse_norms = np.einsum('kd,kd->k', self.coarse, self.coarse)
+        self._pq_norms = np.einsum('mkd,mkd->mk', self.pq, self.pq)
+        self._delta_dtype = np.dtype([('id', '<i8'), ('list', '<i4'), ('codes', 'u1', (self.m,))])
+        self._open_generation(self.meta)
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, META_FILE))
+
+    @property
+    def kind(self):
+        return self.meta.get('kind', 'analyses')
+
+    @classmethod
+    def create(cls, directory, samples, nlist=1024, m=16, iterations=20, seed=0, kind='analyses', **kwargs):
+        """
+        用样本向量训练粗量化器与乘积量化器, 在 directory 下创建空索引
+
+        样本应与之后加入的向量同分布(如训练集图像的嵌入); m 须整除向量维度
+        """
+        if kind not in KINDS:
+            raise ValueError(f"不支持的编号类型: {kind}")
+        samples = np.ascontiguousarray(samples, dtype=np.float32)
+        dim = samples.shape[1]
+        if dim % m:
+            raise ValueError(f"向量维度 {dim} 不能被子量化器数 {m} 整除")
+        nlist = min(nlist, len(samples))
+        coarse = _kmeans(samples, nlist, iterations, seed)
+        residuals = (samples - coarse[_assign(samples, coarse)]).reshape(len(samples), m, dim // m)
+        ksub = min(PQ_CENTROIDS, len(samples))
+        pq = np.stack([_kmeans(np.ascontiguousarray(residuals[:, i]), ksub, iterations, seed + i)
+                       for i in range(m)])
+
+        os.makedirs(directory, exist_ok=True)
+        # 删除同一目录中旧索引的文件
+        for name in os.listdir(directory):
+            if name == META_FILE or name.split('-')[0] in ('codes', 'ids', 'offsets', 'delta'):
+                os.remove(os.path.join(directory, name))
+        np.savez(os.path.join(directory, QUANTIZER_FILE), coarse=coarse, pq=pq)
+        index = cls.__new__(cls)
+        index.directory = directory
+        index.meta = {'generation': 0, 'kind': kind, 'count': 0}
+        index._write_main(0, np.empty((0, m), np.uint8), np.empty(0, np.int64), np.zeros(nlist + 1, np.int64))
+        open(index._path('delta', 0) + '.bin', 'wb').close()
+        index._write_meta(index.meta)
+        return cls(directory, **kwargs)
+
+    def _path(self, name, generation=None):
+        return os.path.join(self.directory, f'{name}-{self.meta["generation"] if generation is None else generation}')
+
+    def _meta_stamp(self):
+        stat = os.stat(os.path.join(self.directory, META_FILE))
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _read_meta(self):
+        self._stamp = self._meta_stamp()
+        with open(os.path.join(self.directory, META_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_meta(self, meta):
+        tmp_path = os.path.join(self.directory, META_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.directory, META_FILE))
+
+    def _write_main(self, generation, codes, ids, offsets):
+        """写出一代主段(按列表排序的编码、编号与各列表起点)"""
+        np.save(self._path('codes', generation) + '.npy', codes)
+        np.save(self._path('ids', generation) + '.npy', ids)
+        np.save(self._path('offsets', generation) + '.npy', offsets)
+
+    def _open_generation(self, meta):
+        """打开 meta 指定的一代文件, 全部打开成功后才替换当前状态"""
+        path = lambda name: os.path.join(self.directory, f"{name}-{meta['generation']}")
+        codes = np.load(path('codes') + '.npy', mmap_mode='r')
+        ids = np.load(path('ids') + '.npy', mmap_mode='r')
+        offsets = np.load(path('offsets') + '.npy')
+        delta = np.fromfile(path('delta') + '.bin', dtype=self._delta_dtype)
+        self.meta = meta
+        self._codes, self._ids, self._offsets = codes, ids, offsets
+        self._delta_ids = delta['id']
+        self._delta_lists = delta['list']
+        self._delta_codes = delta['codes']
+        # 主段按编号排序的下标与排序后的编号, 首次 reconstruct 时建立
+        self._id_order = self._sorted_ids = None
+
+    def _append_delta(self, records):
+        self._delta_ids = np.concatenate([self._delta_ids, records['id']])
+        self._delta_lists = np.concatenate([self._delta_lists, records['list']])
+        self._delta_codes = np.concatenate([self._delta_codes, records['codes']])
+
+    def _sync(self):
+        """
+        读入其他进程或后台合并写入的变化: 切换到新一代文件, 或读取增量段末尾新追加的记录
+
+        调用方须持有 _lock; 与切换同时发生时旧文件可能刚被删除, 重新读取 meta.json 后再试
+        """
+        for attempt in range(3):
+            try:
+                if self._meta_stamp() != self._stamp:
+                    meta = self._read_meta()
+                    if meta['generation'] != self.meta['generation']:
+                        self._open_generation(meta)
+                        return
+                known = len(self._delta_ids) * self._delta_dtype.itemsize
+                count = (os.path.getsize(self._path('delta') + '.bin') - known) // self._delta_dtype.itemsize
+                if count > 0:
+                    self._append_delta(np.fromfile(self._path('delta') + '.bin', dtype=self._delta_dtype,
+                                                   count=count, offset=known))
+                return
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+
+    def __len__(self):
+        with self._lock:
+            self._sync()
+            return len(self._ids) + len(self._delta_ids)
+
+    def _encode(self, vectors):
+        lists = _assign(vectors, self.coarse)
+        residuals = (vectors - self.coarse[lists]).reshape(len(vectors), self.m, -1)
+        codes = np.stack([_assign(np.ascontiguousarray(residuals[:, i]), self.pq[i]) for i in range(self.m)], axis=1)
+        return lists.astype(np.int32), codes.astype(np.uint8)
+
+    def add(self, vectors, ids):
+        """
+        加入一批向量(ids 为 int64 编号, 如分析记录 id), 立即追加写盘
+
+        增量段达到 compact_threshold 时启动后台合并, 本次调用不等待合并完成
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        records = np.empty(len(vectors), dtype=self._delta_dtype)
+        records['id'] = ids
+        records['list'], records['codes'] = self._encode(vectors)
+        with _file_lock(os.path.join(self.directory, WRITE_LOCK_FILE)), self._lock:
+            self._sync()
+            with open(self._path('delta') + '.bin', 'ab') as f:
+                f.write(records.tobytes())
+            self._append_delta(records)
+            if len(self._delta_ids) >= self.compact_threshold and not self.compacting:
+                self._compaction = threading.Thread(target=self._compact_in_background, daemon=True)
+                self._compaction.start()
+
+    @property
+    def compacting(self):
+        return self._compaction is not None and self._compaction.is_alive()
+
+    def wait_for_compaction(self, timeout=None):
+        """等待进行中的后台合并完成"""
+        if self._compaction is not None:
+            self._compaction.join(timeout)
+
+    def compact(self):
+        """把增量段合并进按列表排序的主段, 完成后返回"""
+        self._compact(minimum=1)
+
+    def _compact_in_background(self):
+        try:
+            self._compact(minimum=self.compact_threshold)
+        except Exception:
+            logger.exception("嵌入索引合并失败, 增量段保持不变")
+
+    def _compact(self, minimum):
+        write_lock = os.path.join(self.directory, WRITE_LOCK_FILE)
+        # 同一时间只有一个合并; 其他进程的合并在此排队, 轮到时增量段已不足 minimum 则不再合并
+        with _file_lock(os.path.join(self.directory, COMPACT_LOCK_FILE)):
+            with _file_lock(write_lock), self._lock:
+                self._sync()
+                generation = self.meta['generation']
+                main_codes, main_ids, main_offsets = self._codes, self._ids, self._offsets
+                delta_ids, delta_lists, delta_codes = self._delta_ids, self._delta_lists, self._delta_codes
+            if len(delta_ids) < minimum:
+                return
+
+            # 排序与写新主段不持有锁, 查询与追加照常进行; 只有持有合并锁的一方会写下一代文件
+            lists = np.concatenate([np.repeat(np.arange(self.nlist), np.diff(main_offsets)), delta_lists])
+            order = np.argsort(lists, kind='stable')
+            codes = np.concatenate([main_codes, delta_codes])[order]
+            ids = np.concatenate([main_ids, delta_ids])[order]
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=self.nlist))]).astype(np.int64)
+            self._write_main(generation + 1, codes, ids, offsets)
+
+            with _file_lock(write_lock), self._lock:
+                self._sync()
+                # 快照之后追加的记录转入新一代的增量段
+                tail = np.empty(len(self._delta_ids) - len(delta_ids), dtype=self._delta_dtype)
+                tail['id'] = self._delta_ids[len(delta_ids):]
+                tail['list'] = self._delta_lists[len(delta_ids):]
+                tail['codes'] = self._delta_codes[len(delta_ids):]
+                tail.tofile(self._path('delta', generation + 1) + '.bin')
+                self._write_meta(dict(self.meta, generation=generation + 1, count=int(len(ids))))
+                self._open_generation(self._read_meta())
+            # 其他进程在下次读写时切换到新一代文件; 仍映射着旧文件的进程不受删除影响(Windows 上删除失败则保留)
+            for name in ('codes-{}.npy', 'ids-{}.npy', 'offsets-{}.npy', 'delta-{}.bin'):
+                try:
+                    os.remove(os.path.join(self.directory, name.format(generation)))
+                except OSError:
+                    pass
+        logger.info(f"嵌入索引已合并: {len(ids)} 个向量")
+
+    def _decode(self, lists, codes):
+        """由列表号与编码重建近似向量: 列表中心加各段码字"""
+        return self.coarse[lists] + np.concatenate([self.pq[i][codes[:, i]] for i in range(self.m)], axis=1)
+
+    def reconstruct(self, vector_id):
+        """
+        由存储的编码重建编号为 vector_id 的近似向量, 不在索引中时返回 None
+
+        用已入库的记录做查询时无需重新读图推理; 同一编号加入多次时取最后一次
+        """
+        with self._lock:
+            self._sync()
+            rows = np.flatnonzero(self._delta_ids == vector_id)
+            if len(rows):
+                row = rows[-1]
+                return self._decode(self._delta_lists[row:row + 1], self._delta_codes[row:row + 1])[0]
+            if self._id_order is None:
+                self._id_order = np.argsort(self._ids, kind='stable')
+                self._sorted_ids = np.asarray(self._ids)[self._id_order]
+            position = int(np.searchsorted(self._sorted_ids, vector_id, side='right')) - 1
+            if position < 0 or self._sorted_ids[position] != vector_id:
+                return None
+            row = int(self._id_order[position])
+            lists = np.searchsorted(self._offsets, [row], side='right') - 1
+            return self._decode(lists, np.asarray(self._codes[row:row + 1]))[0]
+
+    def search(self, query, k=10, nprobe=4):
+        """
+        返回与 query 最近的 k 个向量的 (编号, 近似平方欧氏距离), 按距离升序
+
+        nprobe 为扫描的倒排列表数, 越大召回率越高、查询越慢
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        if k <= 0:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        with self._lock:
+            self._sync()
+            # ||q||² 对所有中心相同, 选探测列表时可以省去
+            nprobe = min(nprobe, self.nlist)
+            probes = np.argpartition(self._coarse_norms - 2.0 * (self.coarse @ query), nprobe - 1)[:nprobe]
+
+            # 每段的距离表 [m, nprobe, 256]: ||r - p||² = ||r||² - 2 r·p + ||p||², r 为查询相对列表中心的残差
+            residuals = (query - self.coarse[probes]).reshape(nprobe, self.m, -1).transpose(1, 0, 2)
+            tables = (np.einsum('mpd,mpd->mp', residuals, residuals)[:, :, None]
+                      - 2.0 * np.matmul(residuals, self.pq.transpose(0, 2, 1)) + self._pq_norms[:, None, :])
+
+            # 主段中各列表是连续的记录, 增量段按列表号筛选
+            segments = [(self._codes[self._offsets[p]:self._offsets[p + 1]],
+                         self._ids[self._offsets[p]:self._offsets[p + 1]]) for p in probes]
+            probe_of_list = np.full(self.nlist, -1)
+            probe_of_list[probes] = np.arange(nprobe)
+            delta_rows = np.flatnonzero(probe_of_list[self._delta_lists] >= 0)
+            codes = np.concatenate([segment[0] for segment in segments] + [self._delta_codes[delta_rows]])
+            ids = np.concatenate([segment[1] for segment in segments] + [self._delta_ids[delta_rows]])
+            probe_index = np.concatenate([np.repeat(np.arange(nprobe), [len(segment[1]) for segment in segments]),
+                                          probe_of_list[self._delta_lists[delta_rows]]])
+
+        if len(ids) == 0:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        # 逐段查表累加: 第 i 段的表展平为 [nprobe * 256], 候选的下标为 所属探测序号 * 256 + 编码
+        ksub = tables.shape[2]
+        base = (probe_index * ksub).astype(np.int32)
+        tables = tables.reshape(self.m, -1)
+        distances = np.zeros(len(ids), dtype=np.float32)
+        for i in range(self.m):
+            distances += np.take(tables[i], base + codes[:, i])
+        k = min(k, len(ids))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return np.asarray(ids[top], dtype=np.int64), distances[top].astype(np.float32)
+
+def _image_files(image_dir):
+    return sorted(name for name in os.listdir(image_dir)
+                  if name.lower().endswith(('.jpg', '.jpeg', '.png')))
+
+def embed_files(analyzer, paths, roi_detector=None, batch_size=32):
+    """
+    逐批读取图片文件并计算嵌入, 每批产出 (可读取的文件在 paths 中的下标, 嵌入矩阵)
+
+    roi_detector 与 SkinAnalyzer.analyze_image_file 相同, 提供时先裁剪到皮肤区域
+    """
+    import cv2
+
+    for start in range(0, len(paths), batch_size):
+        positions, images = [], []
+        for position in range(start, min(start + batch_size, len(paths))):
+            image = cv2.imread(paths[position])
+            if image is None:
+                logger.warning(f"无法读取图像, 已跳过: {paths[position]}")
+                continue
+            if roi_detector is not None:
+                x, y, w, h = roi_detector(image)
+                image = image[y:y + h, x:x + w]
+            positions.append(position)
+            images.append(image)
+        if images:
+            yield positions, analyzer.embed_batch(images, bgr=True)
+
+def embed_directory(analyzer, image_dir, batch_size=32):
+    """计算目录中全部图片的嵌入, 返回 (文件名列表, 嵌入矩阵)"""
+    files = _image_files(image_dir)
+    names, embeddings = [], []
+    for positions, batch in embed_files(analyzer, [os.path.join(image_dir, name) for name in files],
+                                        batch_size=batch_size):
+        names += [files[position] for position in positions]
+        embeddings.append(batch)
+    return names, np.concatenate(embeddings)
+
+def main():
+    """
+    训练图片的嵌入索引(编号为图片目录中的序号, 文件名见 keys.json)与近似重复查找
+
+    后端的相似病例索引编号为分析记录 id, 由后端的 flask build-embedding-index 命令构建, 不与此处混用
+    """
+    parser = argparse.ArgumentParser(description='构建训练图片的嵌入索引 / 查找训练数据中的近似重复')
+    parser.add_argument('command', choices=['build', 'duplicates'])
+    parser.add_argument('--model', default='models/skin_analysis_model.h5')
+    parser.add_argument('--images', default='data/images', help='图片目录')
+    parser.add_argument('--index-dir', default='data/training_embedding_index')
+    parser.add_argument('--nlist', type=int, default=1024)
+    parser.add_argument('--m', type=int, default=16, help='乘积量化的子向量数')
+    parser.add_argument('--threshold', type=float, default=0.05, help='近似重复的平方距离阈值(嵌入已归一化)')
+    args = parser.parse_args()
+
+    from .model_inference import SkinAnalyzer
+
+    logging.basicConfig(level=logging.INFO)
+    analyzer = SkinAnalyzer(args.model, batch_size=32)
+    names, embeddings = embed_directory(analyzer, args.images)
+    index = EmbeddingIndex.create(args.index_dir, embeddings, nlist=args.nlist, m=args.m, kind='images')
+    index.add(embeddings, np.arange(len(names)))
+    index.compact()
+    with open(os.path.join(args.index_dir, 'keys.json'), 'w', encoding='utf-8') as f:
+        json.dump(names, f)
+    logger.info(f"已为 {len(names)} 张图片建立索引: {args.index_dir}")
+
+    if args.command == 'duplicates':
+        pairs = set()
+        for row, embedding in enumerate(embeddings):
+            ids, distances = index.search(embedding, k=5)
+            for other, distance in zip(ids, distances):
+                if other != row and distance <= args.threshold:
+                    pairs.add((min(row, int(other)), max(row, int(other))))
+        for a, b in sorted(pairs):
+            print(f"{names[a]}\t{names[b]}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import cv2
+import numpy as np
+
+
+class InputBuffer:
+    """
+    预分配的模型输入缓冲区
+
+    每个批次槽位对应 batch 中的一块固定内存, resize / 颜色转换 / 归一化
+    全部直接写入预分配的数组, 单次预处理不再产生整图大小的临时数组。
+    同一个 InputBuffer 不是线程安全的, 每个工作线程应持有自己的实例。
+    """
+
+    def __init__(self, batch_size=1, input_size=(224, 224), dtype=np.float32):
+        self.input_size = input_size
+        self.dtype = np.dtype(dtype)
+        width, height = input_size
+
+        # uint8 中转区: resize 与颜色转换的输出直接写入这里
+        self._resized = np.empty((height, width, 3), dtype=np.uint8)
+        self._resized_gray = np.empty((height, width), dtype=np.uint8)
+        self._resized_alpha = np.empty((height, width, 4), dtype=np.uint8)
+        self._rgb = np.empty((height, width, 3), dtype=np.uint8)
+
+        self.batch = None
+        self.resize(batch_size)
+
+    @property
+    def batch_size(self):
+        return self.batch.shape[0]
+
+    def resize(self, batch_size):
+        """调整批次容量, 仅在容量不足时重新分配"""
+        if self.batch is not None and self.batch.shape[0] >= batch_size:
+            return
+        width, height = self.input_size
+        self.batch = np.empty((batch_size, height, width, 3), dtype=self.dtype)
+
+    def fill(self, slot, image, bgr=False):
+        """
+        将一张图像写入指定槽位并返回该槽位的视图
+
+        bgr=True 时在缩小后的图像上做 BGR→RGB 转换, 避免对原图整幅转换。
+        """
+        rgb = self._to_rgb(image, bgr)
+        target = self.batch[slot]
+
+        if self.dtype == np.uint8:
+            np.copyto(target, rgb)
+        else:
+            # 原地归一化, 不产生float64中间结果
+            np.copyto(target, rgb, casting='unsafe')
+            np.divide(target, self.dtype.type(255.0), out=target)
+
+        return target
+
+    def fill_batch(self, images, bgr=False):
+        """将一组图像依次写入槽位, 返回有效部分的批次视图"""
+        self.resize(len(images))
+        for slot, image in enumerate(images):
+            self.fill(slot, image, bgr=bgr)
+        return self.batch[:len(images)]
+
+    def _to_rgb(self, image, bgr):
+        """缩放到输入尺寸并转换为3通道RGB, 结果位于预分配的中转区"""
+        if image.ndim == 2:
+            cv2.resize(image, self.input_size, dst=self._resized_gray)
+            cv2.cvtColor(self._resized_gray, cv2.COLOR_GRAY2RGB, dst=self._rgb)
+            return self._rgb
+
+        if image.shape[2] == 4:
+            cv2.resize(image, self.input_size, dst=self._resized_alpha)
+            code = cv2.COLOR_BGRA2RGB if bgr else cv2.COLOR_RGBA2RGB
+            cv2.cvtColor(self._resized_alpha, code, dst=self._rgb)
+            return self._rgb
+
+        if bgr:
+            cv2.resize(image, self.input_size, dst=self._resized)
+            cv2.cvtColor(self._resized, cv2.COLOR_BGR2RGB, dst=self._rgb)
+            return self._rgb
+
+        cv2.resize(image, self.input_size, dst=self._rgb)
+        return self._rgb
@@ -1,15 +1,66 @@
 import os
+import threading
 import cv2
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing.image import img_to_array
 import logging
+from .input_buffer import InputBuffer
+
+# 面部分区在人脸(皮肤)裁剪框内的相对位置 (x0, y0, x1, y1), 按正面人像的一般比例划分
+FACE_ZONES = {
+    'forehead': (0.25, 0.05, 0.75, 0.28),
+    'left_cheek': (0.10, 0.45, 0.38, 0.72),
+    'right_cheek': (0.62, 0.45, 0.90, 0.72),
+    'nose': (0.40, 0.35, 0.60, 0.65),
+    'chin': (0.33, 0.78, 0.67, 0.97),
+}
+
+# 模型的 4 个输出在结果中的名称
+OUTPUT_KEYS = ('score', 'moisture', 'oil', 'sensitivity')
+
+# 图像嵌入取自该名称的层, 与训练端 model_trainer.FEATURE_LAYER 一致
+FEATURE_LAYER = 'features'
+
+def feature_output(model):
+    """
+    返回模型中作为图像嵌入的特征张量
+
+    优先取名为 FEATURE_LAYER 的层的输出; 未命名特征层的旧模型取输出全连接层的输入。
+    两者都没有时报错, 而不是随意取某一层
+    """
+    try:
+        return model.get_layer(FEATURE_LAYER).output
+    except ValueError:
+        pass
+    output_layer = model.layers[-1] if model.layers else None
+    if isinstance(output_layer, tf.keras.layers.Dense) and len(model.outputs) == 1:
+        return output_layer.input
+    raise ValueError(f"模型中没有特征层 '{FEATURE_LAYER}', 输出层也不是全连接层, 无法确定图像嵌入")
+
+def face_zones(image_shape, roi=None, zones=None):
+    """
+    按相对比例计算各面部分区在原图中的裁剪框 {名称: (x, y, width, height)}
+
+    roi 为人脸/皮肤区域 (x, y, width, height), 未给出时以整幅图像为准
+    """
+    if roi is None:
+        roi = (0, 0, image_shape[1], image_shape[0])
+    x, y, w, h = roi
+    boxes = {}
+    for name, (x0, y0, x1, y1) in (zones or FACE_ZONES).items():
+        left, top = x + int(x0 * w), y + int(y0 * h)
+        boxes[name] = (left, top, max(1, int(x1 * w) - int(x0 * w)), max(1, int(y1 * h) - int(y0 * h)))
+    return boxes
 
 class SkinAnalyzer:
-    def __init__(self, model_path):
+    def __init__(self, model_path, batch_size=1):
         self.model_path = model_path
         self.model = None
+        self.batch_size = batch_size
+        self.input_dtype = np.float32
+        # 每个工作线程持有独立的预分配输入缓冲区
+        self._local = threading.local()
         self.setup_logging()
         self.load_model()
 
@@ -24,59 +75,144 @@ class SkinAnalyzer:
     def load_model(self):
         """加载预训练模型"""
         try:
-            self.model = load_model(self.model_path)
+            # 推理不需要优化器与损失; Keras 3 无法反序列化旧 .h5 中以字符串保存的损失函数
+            self.model = load_model(self.model_path, compile=False)
+            # 新模型在图内完成归一化, 直接接收 uint8 输入; 旧模型仍使用 float32
+            self.input_dtype = tf.as_dtype(self.model.inputs[0].dtype).as_numpy_dtype
+            # 同一次前向计算同时输出预测值与特征层的输出(图像嵌入)
+            self._outputs_model = tf.keras.Model(self.model.inputs,
+                                                 [self.model.outputs[0], feature_output(self.model)])
+            self._local = threading.local()
             self.logger.info(f"成功加载模型: {self.model_path}")
         except Exception as e:
             self.logger.error(f"加载模型失败: {str(e)}")
             raise
 
-    def preprocess_image(self, image):
-        """预处理图像"""
+    def _get_input_buffer(self):
+        """获取当前线程的输入缓冲区"""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = InputBuffer(batch_size=self.batch_size, dtype=self.input_dtype)
+            self._local.buffer = buffer
+        return buffer
+
+    def preprocess_image(self, image, bgr=False):
+        """
+        预处理图像
+
+        结果写入当前线程的预分配缓冲区并以 (1, 224, 224, 3) 视图返回,
+        下一次调用会覆盖其内容, 调用方需在此之前完成推理。
+        模型输入为 uint8 时只做缩放和颜色转换, 归一化由模型完成。
+        """
         try:
-            # 调整图像大小
-            image = cv2.resize(image, (224, 224))
-            # 转换为RGB格式
-            if len(image.shape) == 2:
-                image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
-            elif image.shape[2] == 4:
-                image = cv2.cvtColor(image, cv2.COLOR_RGBA2RGB)
-            # 转换为数组并归一化
-            image = img_to_array(image)
-            image = image / 255.0
-            # 添加批次维度
-            image = np.expand_dims(image, axis=0)
-            return image
+            buffer = self._get_input_buffer()
+            buffer.fill(0, image, bgr=bgr)
+            return buffer.batch[:1]
         except Exception as e:
             self.logger.error(f"图像预处理失败: {str(e)}")
             raise
 
-    def analyze_skin(self, image):
-        """分析皮肤状况"""
+    def preprocess_batch(self, images, bgr=False):
+        """批量预处理图像, 每张图像写入缓冲区的一个批次槽位"""
+        try:
+            return self._get_input_buffer().fill_batch(images, bgr=bgr)
+        except Exception as e:
+            self.logger.error(f"批量图像预处理失败: {str(e)}")
+            raise
+
+    def _predict(self, batch):
+        """一次前向计算返回 (预测值 [B, 4], L2 归一化的嵌入 [B, D])"""
+        predictions, embeddings = self._outputs_model.predict_on_batch(batch)
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return np.asarray(predictions), embeddings
+
+    def embed_batch(self, images, bgr=False):
+        """
+        计算一批图像的嵌入(特征层的输出, 见 feature_output; L2 归一化), 用于相似病例检索与近似重复查找
+        """
+        return self._predict(self.preprocess_batch(images, bgr=bgr))[1]
+
+    def analyze_skin(self, image, bgr=False, roi=None, with_embedding=False):
+        """
+        分析皮肤状况
+
+        roi 为 (x, y, width, height) 时只分析该区域, 并在结果中返回裁剪框;
+        with_embedding=True 时结果中附带图像嵌入 embedding(同一次前向计算得到)
+        """
         try:
+            # 裁剪到皮肤区域(切片视图, 不复制像素)
+            if roi is not None:
+                x, y, w, h = roi
+                image = image[y:y + h, x:x + w]
+            
             # 预处理图像
-            processed_image = self.preprocess_image(image)
+            processed_image = self.preprocess_image(image, bgr=bgr)
             
             # 模型预测
-            predictions = self.model.predict(processed_image)[0]
+            predictions, embeddings = self._predict(processed_image)
             
             # 解析预测结果
-            result = {
-                'score': float(predictions[0] * 100),  # 肤质评分
-                'moisture': float(predictions[1] * 100),  # 水分含量
-                'oil': float(predictions[2] * 100),  # 油分含量
-                'sensitivity': float(predictions[3] * 100),  # 敏感度
-            }
+            result = self._parse_predictions(predictions[0])
             
             # 生成护理建议
             result['recommendations'] = self._generate_recommendations(result)
             
+            if roi is not None:
+                result['roi'] = {'x': int(x), 'y': int(y), 'width': int(w), 'height': int(h)}
+            
             self.logger.info(f"分析完成: {result}")
+            if with_embedding:
+                result['embedding'] = embeddings[0]
             return result
             
         except Exception as e:
             self.logger.error(f"皮肤分析失败: {str(e)}")
             raise
 
+    def analyze_regions(self, image, bgr=False, roi=None, zones=None, with_embedding=False):
+        """
+        按面部分区分析皮肤状况
+
+        在人脸区域 roi 内按 zones(默认 FACE_ZONES)裁出额头、两颊、鼻子、下巴,
+        各分区以原图分辨率裁剪后再缩放到模型输入, 保留整图缩放时丢失的皮肤纹理;
+        全部分区写入同一个批次缓冲区, 一次前向计算得到所有分区的结果。
+        返回各分区平均后的综合结果(含护理建议), zones 中为各分区的结果与裁剪框;
+        with_embedding=True 时附带各分区嵌入平均后重新归一化的 embedding
+        """
+        try:
+            boxes = face_zones(image.shape, roi, zones)
+            # 切片视图, 不复制像素
+            crops = [image[y:y + h, x:x + w] for x, y, w, h in boxes.values()]
+            batch = self.preprocess_batch(crops, bgr=bgr)
+            predictions, embeddings = self._predict(batch)
+            
+            zone_results = {}
+            for (name, (x, y, w, h)), prediction in zip(boxes.items(), predictions):
+                zone_results[name] = self._parse_predictions(prediction)
+                zone_results[name]['box'] = {'x': int(x), 'y': int(y), 'width': int(w), 'height': int(h)}
+            
+            result = self._parse_predictions(predictions.mean(axis=0))
+            result['recommendations'] = self._generate_recommendations(result)
+            result['zones'] = zone_results
+            if roi is not None:
+                x, y, w, h = roi
+                result['roi'] = {'x': int(x), 'y': int(y), 'width': int(w), 'height': int(h)}
+            
+            self.logger.info(f"分区分析完成: {len(zone_results)} 个分区")
+            if with_embedding:
+                embedding = embeddings.mean(axis=0)
+                result['embedding'] = embedding / max(np.linalg.norm(embedding), 1e-12)
+            return result
+            
+        except Exception as e:
+            self.logger.error(f"分区皮肤分析失败: {str(e)}")
+            raise
+
+    def _parse_predictions(self, predictions):
+        """模型输出(0~1)换算为百分制结果: 肤质评分、水分含量、油分含量、敏感度"""
+        return {key: float(value * 100) for key, value in zip(OUTPUT_KEYS, predictions)}
+
     def _generate_recommendations(self, result):
         """根据分析结果生成护理建议"""
         recommendations = []
@@ -105,19 +241,35 @@ class SkinAnalyzer:
             
         return " ".join(recommendations)
 
-    def analyze_image_file(self, image_path):
-        """分析图像文件"""
+    def embed_image_file(self, image_path, roi_detector=None):
+        """计算图像文件的嵌入, roi_detector 与 analyze_image_file 相同"""
+        image = cv2.imread(image_path)
+        if image is None:
+            raise ValueError(f"无法读取图像: {image_path}")
+        if roi_detector is not None:
+            x, y, w, h = roi_detector(image)
+            image = image[y:y + h, x:x + w]
+        return self.embed_batch([image], bgr=True)[0]
+
+    def analyze_image_file(self, image_path, roi_detector=None, regions=False, with_embedding=False):
+        """
+        分析图像文件
+
+        roi_detector 接收 BGR 图像并返回裁剪框 (x, y, width, height),
+        提供时先裁剪到皮肤区域再推理; regions=True 时在该区域内按面部分区分析(见 analyze_regions)
+        """
         try:
             # 读取图像
             image = cv2.imread(image_path)
             if image is None:
                 raise ValueError(f"无法读取图像: {image_path}")
-                
-            # 转换为RGB格式
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
             
-            # 分析皮肤
-            return self.analyze_skin(image)
+            roi = roi_detector(image) if roi_detector is not None else None
+            
+            # 分析皮肤, BGR→RGB 转换在缩放后的图像上进行
+            if regions:
+                return self.analyze_regions(image, bgr=True, roi=roi, with_embedding=with_embedding)
+            return self.analyze_skin(image, bgr=True, roi=roi, with_embedding=with_embedding)
             
         except Exception as e:
             self.logger.error(f"图像文件分析失败: {str(e)}")
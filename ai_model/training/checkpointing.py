@@ -0,0 +1,150 @@
+import os
+import json
+import shutil
+import logging
+import tensorflow as tf
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# 需要随检查点保存的回调内部状态(EarlyStopping / ReduceLROnPlateau 等)
+CALLBACK_STATE_ATTRS = ('wait', 'best', 'cooldown_counter', 'stopped_epoch', 'best_epoch')
+
+class TrainingCheckpoint(tf.keras.callbacks.Callback):
+    """
+    周期性保存可恢复的训练状态
+
+    每 save_every 个批次及每轮结束时保存一次: 模型权重、优化器状态(含学习率与动量)、随机数状态,
+    以及训练位置(轮次、轮内批次、总步数)、已有训练历史和早停(含最佳权重)/学习率调度回调的状态。
+    检查点由 tf.train.CheckpointManager 管理: 数据文件写完后才原子更新指针文件,
+    中断在任何时刻都不会留下损坏的最新检查点; 只保留最近 max_to_keep 个。
+    """
+
+    def __init__(self, directory: str, save_every: int = 500, max_to_keep: int = 3,
+                 tracked_callbacks: Sequence[tf.keras.callbacks.Callback] = ()):
+        super().__init__()
+        self.directory = directory
+        self.save_every = save_every
+        self.max_to_keep = max_to_keep
+        self.tracked_callbacks = list(tracked_callbacks)
+
+        self.epoch = 0
+        self.step = 0
+        self.global_step = 0
+        # 恢复到轮次中间时, 本轮已完成的批次数
+        self.step_offset = 0
+        self.history: Dict[str, list] = {}
+        # 下一次 fit 开始时写回各回调的状态(来自检查点或上一次 fit)
+        self._carried_states: Optional[List[Dict]] = None
+
+        self._state = tf.Variable('', dtype=tf.string, trainable=False)
+        self._best_weights: Dict[str, List[tf.Variable]] = {}
+        self._checkpoint = None
+        self._manager = None
+
+    def attach(self, model: tf.keras.Model):
+        """绑定模型并创建检查点管理器(fit 之前调用, 以便先恢复状态)"""
+        self.set_model(model)
+        if model.optimizer is not None and not model.optimizer.built:
+            model.optimizer.build(model.trainable_variables)
+        # Dropout 等层的随机数生成器状态不属于模型权重, 单独保存以便恢复后取到相同的随机数
+        weight_ids = {id(weight) for weight in model.weights}
+        rng_states = [variable for variable in model.variables if id(variable) not in weight_ids]
+        # EarlyStopping(restore_best_weights=True) 在内存中保留的最佳权重同样随检查点保存
+        self._best_weights = {
+            str(index): [tf.Variable(tf.zeros(weight.shape, weight.dtype), trainable=False) for weight in model.weights]
+            for index, callback in enumerate(self.tracked_callbacks)
+            if getattr(callback, 'restore_best_weights', False)
+        }
+        self._checkpoint = tf.train.Checkpoint(model=model, optimizer=model.optimizer, rng_states=rng_states,
+                                               best_weights=self._best_weights, state=self._state)
+        self._manager = tf.train.CheckpointManager(self._checkpoint, self.directory, max_to_keep=self.max_to_keep)
+
+    @property
+    def latest(self) -> Optional[str]:
+        """最新检查点的路径, 没有检查点时为 None"""
+        return self._manager.latest_checkpoint
+
+    def clear(self):
+        """删除已有检查点, 重新开始训练"""
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+        self._manager = tf.train.CheckpointManager(self._checkpoint, self.directory, max_to_keep=self.max_to_keep)
+
+    def restore(self) -> Optional[Dict]:
+        """
+        从最新检查点恢复模型与优化器, 返回训练位置等状态; 没有检查点时返回 None
+        """
+        latest = self._manager.latest_checkpoint
+        if latest is None:
+            return None
+        self._checkpoint.restore(latest).assert_existing_objects_matched()
+        state = json.loads(self._state.numpy().decode('utf-8'))
+        self.epoch = state['epoch']
+        self.step = state['step']
+        self.global_step = state['global_step']
+        self.history = state['history']
+        self._carried_states = state['callbacks']
+        for index, saved in enumerate(self._carried_states):
+            if saved.pop('has_best_weights', False):
+                saved['best_weights'] = [variable.numpy() for variable in self._best_weights[str(index)]]
+        logger.info(f"从检查点 {latest} 恢复: 第 {self.epoch} 轮第 {self.step} 批")
+        return state
+
+    def _callback_states(self) -> List[Dict]:
+        states = []
+        for callback in self.tracked_callbacks:
+            saved = {attr: getattr(callback, attr) for attr in CALLBACK_STATE_ATTRS if hasattr(callback, attr)}
+            if getattr(callback, 'best_weights', None) is not None:
+                saved['best_weights'] = callback.best_weights
+            states.append(saved)
+        return states
+
+    def save(self):
+        callback_states = []
+        for index, saved in enumerate(self._callback_states()):
+            best_weights = saved.pop('best_weights', None)
+            if best_weights is not None:
+                for variable, value in zip(self._best_weights[str(index)], best_weights):
+                    variable.assign(value)
+                saved['has_best_weights'] = True
+            callback_states.append(saved)
+        state = {
+            'epoch': self.epoch,
+            'step': self.step,
+            'global_step': self.global_step,
+            'history': self.history,
+            'callbacks': callback_states
+        }
+        self._state.assign(json.dumps(state, default=float))
+        self._manager.save(checkpoint_number=self.global_step)
+
+    def on_train_begin(self, logs=None):
+        # 其他回调在 on_train_begin 中重置自身状态, 本回调排在其后再写回保存的状态
+        if self._carried_states is not None:
+            for callback, saved in zip(self.tracked_callbacks, self._carried_states):
+                for attr, value in saved.items():
+                    setattr(callback, attr, value)
+
+    def on_train_end(self, logs=None):
+        self._carried_states = self._callback_states()
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+        self.step = self.step_offset
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.step = self.step_offset + batch + 1
+        self.global_step += 1
+        # 每轮最后一批之后由 on_epoch_end 保存(此时验证结果与回调状态已更新)
+        last_batch = batch + 1 == (self.params or {}).get('steps')
+        if self.save_every and self.global_step % self.save_every == 0 and not last_batch:
+            self.save()
+
+    def on_epoch_end(self, epoch, logs=None):
+        for key, value in (logs or {}).items():
+            self.history.setdefault(key, []).append(float(value))
+        self.epoch = epoch + 1
+        self.step = 0
+        self.step_offset = 0
+        self.save()
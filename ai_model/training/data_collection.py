@@ -1,9 +1,11 @@
 import os
 import cv2
+import uuid
 import numpy as np
 from PIL import Image
 import pandas as pd
 from sklearn.model_selection import train_test_split
+from label_store import LabelStore
 
 class SkinDataCollector:
     def __init__(self, data_dir='data'):
@@ -14,44 +16,56 @@ class SkinDataCollector:
         # 创建必要的目录
         os.makedirs(self.image_dir, exist_ok=True)
         
+        # 标签存储, 首次使用时导入旧的 labels.csv
+        self.store = LabelStore(os.path.join(data_dir, 'labels.db'))
+        self.store.migrate_csv('labels', self.label_file)
+        
     def collect_image(self, image, label_data):
         """
         收集单张图像及其标签数据
         """
-        # 生成唯一文件名
-        filename = f"skin_{len(os.listdir(self.image_dir))}.jpg"
-        filepath = os.path.join(self.image_dir, filename)
-        
-        # 保存图像
-        cv2.imwrite(filepath, image)
-        
-        # 更新标签文件
-        label_data['image_path'] = filename
-        self._update_labels(label_data)
-        
+        filename = self._save_image(image)
+        self.store.append('labels', {**label_data, 'image_path': filename})
         return filename
     
-    def _update_labels(self, label_data):
+    def collect_images(self, images, label_data_list):
         """
-        更新标签CSV文件
+        批量收集图像及其标签数据, 标签在一个事务中写入
         """
-        if os.path.exists(self.label_file):
-            df = pd.read_csv(self.label_file)
-        else:
-            df = pd.DataFrame()
-        
-        df = df.append(label_data, ignore_index=True)
-        df.to_csv(self.label_file, index=False)
+        filenames = []
+        try:
+            for image in images:
+                filenames.append(self._save_image(image))
+        except Exception:
+            # 有图像写入失败时整批不入库, 删除本批已写入的图像
+            for filename in filenames:
+                path = os.path.join(self.image_dir, filename)
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        self.store.append_many('labels', [
+            {**label_data, 'image_path': filename}
+            for filename, label_data in zip(filenames, label_data_list)
+        ])
+        return filenames
+    
+    def _save_image(self, image):
+        """
+        以唯一文件名保存图像, 多个写入者之间不会冲突; 写入失败时报错, 不返回不存在的文件名
+        """
+        filename = f"skin_{uuid.uuid4().hex}.jpg"
+        if not cv2.imwrite(os.path.join(self.image_dir, filename), image):
+            raise IOError(f"无法写入图片: {os.path.join(self.image_dir, filename)}")
+        return filename
     
     def prepare_training_data(self, test_size=0.2):
         """
         准备训练数据
         """
-        if not os.path.exists(self.label_file):
-            raise FileNotFoundError("标签文件不存在，请先收集数据")
-        
         # 读取标签数据
-        df = pd.read_csv(self.label_file)
+        df = self.store.read('labels')
+        if df.empty:
+            raise ValueError("标签数据为空，请先收集数据")
         
         # 准备图像路径和标签
         X = df['image_path'].values
@@ -72,34 +86,8 @@ class SkinDataCollector:
     def preprocess_image(self, image):
         """
         图像预处理
-        """
-        # 调整大小
-        image = cv2.resize(image, (224, 224))
-        
-        # 标准化
-        image = image.astype(np.float32) / 255.0
-        
-        # 数据增强
-        augmented = self._apply_augmentation(image)
         
-        return augmented
-    
-    def _apply_augmentation(self, image):
-        """
-        应用数据增强
+        只调整大小并保持 uint8, 归一化在模型图内完成;
+        数据增强在训练时按批次随机进行(见 augmentation.py), 不再预先生成多份副本
         """
-        augmented = []
-        
-        # 原始图像
-        augmented.append(image)
-        
-        # 水平翻转
-        augmented.append(cv2.flip(image, 1))
-        
-        # 亮度调整
-        augmented.append(cv2.convertScaleAbs(image, alpha=1.2, beta=0))
-        
-        # 对比度调整
-        augmented.append(cv2.convertScaleAbs(image, alpha=1.0, beta=10))
-        
-        return np.array(augmented) 
\ No newline at end of file
+        return cv2.resize(image, (224, 224))
@@ -1,17 +1,32 @@
 import os
 import cv2
+import hashlib
 import numpy as np
 import pandas as pd
 from datetime import datetime
 from data_collection import SkinDataCollector
 from typing import Dict, List, Tuple
 
+def split_for(image_path: str, val_fraction: float = 0.2) -> str:
+    """
+    按 image_path 的哈希确定样本划分, 同一图片始终落在同一划分
+    """
+    digest = hashlib.sha1(str(image_path).encode('utf-8')).digest()
+    return 'val' if int.from_bytes(digest[:8], 'big') / 2 ** 64 < val_fraction else 'train'
+
 class DataCollectionScript:
-    def __init__(self):
+    def __init__(self, val_fraction: float = 0.2):
         self.collector = SkinDataCollector()
+        self.val_fraction = val_fraction
         self.annotation_file = 'data/annotations.csv'
         self.validation_file = 'data/validation.csv'
         
+        # 标注、验证与更新日志与标签共用同一存储, 首次使用时导入旧的 CSV
+        self.store = self.collector.store
+        self.store.migrate_csv('annotations', self.annotation_file)
+        self.store.migrate_csv('validations', self.validation_file)
+        self.store.migrate_csv('update_log', 'data/update_log.csv')
+        
     def collect_user_data(self, image: np.ndarray, user_info: Dict) -> str:
         """
         收集用户数据
@@ -35,100 +50,94 @@ class DataCollectionScript:
         """
         标注数据
         """
-        if not os.path.exists(self.annotation_file):
-            df = pd.DataFrame(columns=[
-                'image_path', 'skin_score', 'moisture_level', 'oil_level',
-                'sensitivity', 'annotator_id', 'timestamp'
-            ])
-            df.to_csv(self.annotation_file, index=False)
-        
-        # 添加标注
-        annotations['image_path'] = image_path
-        annotations['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        df = pd.read_csv(self.annotation_file)
-        df = df.append(annotations, ignore_index=True)
-        df.to_csv(self.annotation_file, index=False)
+        self.annotate_batch([(image_path, annotations)])
+    
+    def annotate_batch(self, items: List[Tuple[str, Dict]]) -> None:
+        """
+        批量标注数据, items 为 (图像路径, 标注) 列表
+        """
+        self.store.append_many('annotations', self._stamp(items))
     
     def validate_data(self, image_path: str, validation_data: Dict) -> None:
         """
         验证数据
         """
-        if not os.path.exists(self.validation_file):
-            df = pd.DataFrame(columns=[
-                'image_path', 'is_valid', 'validation_notes',
-                'validator_id', 'timestamp'
-            ])
-            df.to_csv(self.validation_file, index=False)
-        
-        # 添加验证结果
-        validation_data['image_path'] = image_path
-        validation_data['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        df = pd.read_csv(self.validation_file)
-        df = df.append(validation_data, ignore_index=True)
-        df.to_csv(self.validation_file, index=False)
+        self.validate_batch([(image_path, validation_data)])
+    
+    def validate_batch(self, items: List[Tuple[str, Dict]]) -> None:
+        """
+        批量写入验证结果, items 为 (图像路径, 验证结果) 列表
+        """
+        self.store.append_many('validations', self._stamp(items))
+    
+    def _stamp(self, items: List[Tuple[str, Dict]]) -> List[Dict]:
+        """
+        为记录补充图像路径与时间戳
+        """
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return [{**data, 'image_path': image_path, 'timestamp': timestamp} for image_path, data in items]
+    
+    def build_training_set(self) -> int:
+        """
+        增量构建训练集, 按上次构建之后的新标注与新验证结果加入或移除样本, 返回新增样本数
+        """
+        before = self.store.count_training_samples()
+        added = self.store.build_training_samples(
+            lambda image_path: split_for(image_path, self.val_fraction)
+        )
+        total = self.store.count_training_samples()
+        if added or total != before:
+            self._log_update(total)
+        return added
     
     def prepare_training_dataset(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """
         准备训练数据集
-        """
-        # 读取标注和验证数据
-        annotations_df = pd.read_csv(self.annotation_file)
-        validation_df = pd.read_csv(self.validation_file)
         
-        # 合并数据
-        merged_df = pd.merge(
-            annotations_df,
-            validation_df[['image_path', 'is_valid']],
-            on='image_path'
-        )
+        先增量更新训练集, 训练/验证划分由 image_path 哈希决定, 已有样本不会换到另一划分
+        """
+        self.build_training_set()
         
-        # 只保留验证通过的数据
-        valid_data = merged_df[merged_df['is_valid'] == True]
+        samples = self.store.read_training_samples()
+        if samples.empty:
+            return samples, samples
         
-        # 划分训练集和验证集
-        train_data = valid_data.sample(frac=0.8, random_state=42)
-        val_data = valid_data.drop(train_data.index)
+        train_data = samples[samples['split'] == 'train'].drop(columns='split')
+        val_data = samples[samples['split'] == 'val'].drop(columns='split')
         
         return train_data, val_data
     
     def update_training_set(self, new_data: pd.DataFrame) -> None:
         """
         更新训练集
+        
+        新数据按已有表头的列顺序追加到 training_set.csv 末尾, 不重写已有内容
         """
-        # 读取现有训练集
         train_file = 'data/training_set.csv'
+        existing_rows = self.store.get_meta('training_set.rows', None)
         if os.path.exists(train_file):
-            existing_data = pd.read_csv(train_file)
-            # 合并新数据
-            updated_data = pd.concat([existing_data, new_data], ignore_index=True)
+            if existing_rows is None:
+                # 首次使用计数前已有的训练集, 统计一次行数
+                existing_rows = len(pd.read_csv(train_file))
+            columns = pd.read_csv(train_file, nrows=0).columns
+            new_data.reindex(columns=columns).to_csv(train_file, mode='a', header=False, index=False)
         else:
-            updated_data = new_data
-        
-        # 保存更新后的训练集
-        updated_data.to_csv(train_file, index=False)
+            existing_rows = 0
+            new_data.to_csv(train_file, index=False)
         
         # 记录更新日志
-        self._log_update(updated_data.shape[0])
+        total_samples = existing_rows + len(new_data)
+        self.store.set_meta('training_set.rows', total_samples)
+        self._log_update(total_samples)
     
     def _log_update(self, total_samples: int) -> None:
         """
         记录更新日志
         """
-        log_file = 'data/update_log.csv'
-        log_entry = {
+        self.store.append('update_log', {
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'total_samples': total_samples
-        }
-        
-        if os.path.exists(log_file):
-            df = pd.read_csv(log_file)
-            df = df.append(log_entry, ignore_index=True)
-        else:
-            df = pd.DataFrame([log_entry])
-        
-        df.to_csv(log_file, index=False)
+        })
     
     def generate_data_report(self) -> Dict:
         """
@@ -143,8 +152,8 @@ class DataCollectionScript:
         }
         
         # 读取数据
-        annotations_df = pd.read_csv(self.annotation_file)
-        validation_df = pd.read_csv(self.validation_file)
+        annotations_df = self.store.read('annotations')
+        validation_df = self.store.read('validations')
         
         # 计算统计信息
         report['total_samples'] = len(annotations_df)
@@ -5,12 +5,34 @@ from PIL import Image
 import pandas as pd
 from sklearn.model_selection import train_test_split
 import logging
+from parallel import ProgressReporter, imap_tasks, write_error_manifest
+from record_shards import ShardWriter
+from preprocess_cache import PreprocessCache, load_image, preprocess_params
+
+# 预处理参数, 同时作为预处理缓存键的一部分
+IMAGE_SIZE = (224, 224)
+PREPROCESS_PARAMS = preprocess_params(IMAGE_SIZE)
 
 class DataPreprocessor:
-    def __init__(self, data_dir, output_dir):
+    def __init__(self, data_dir, output_dir, workers=1, chunksize=64, ordered=True,
+                 cache_dir=None, cache_max_bytes=5 * 1024 ** 3):
         self.data_dir = data_dir
         self.output_dir = output_dir
+        # 预处理缓存: 重新构建时只解码新增或变化的图片
+        self.cache = PreprocessCache(cache_dir, cache_max_bytes) if cache_dir else None
+        # 并行参数: workers>1 时使用进程池, ordered=False 时按完成顺序收集结果
+        self.workers = workers
+        self.chunksize = chunksize
+        self.ordered = ordered
+        # 处理失败的图片, 写入 errors.csv
+        self.errors = []
         self.setup_logging()
+    
+    def __getstate__(self):
+        """传给工作进程时不携带错误清单"""
+        state = self.__dict__.copy()
+        state['errors'] = []
+        return state
         
     def setup_logging(self):
         """设置日志记录"""
@@ -34,24 +56,19 @@ class DataPreprocessor:
         for dir_path in dirs:
             os.makedirs(dir_path, exist_ok=True)
     
+    def load_image(self, image_path):
+        """
+        读取并预处理单张图片, 失败时抛出异常
+
+        返回 224x224 的 uint8 RGB 图像, 归一化由模型内的预处理层完成;
+        启用缓存时源文件内容与参数未变的图片直接取缓存结果
+        """
+        return load_image(image_path, IMAGE_SIZE, self.cache)
+    
     def preprocess_image(self, image_path):
-        """预处理单张图片"""
+        """预处理单张图片, 失败时返回 None"""
         try:
-            # 读取图片
-            img = cv2.imread(image_path)
-            if img is None:
-                return None
-            
-            # 调整大小
-            img = cv2.resize(img, (224, 224))
-            
-            # 颜色空间转换
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            
-            # 标准化
-            img = img.astype(np.float32) / 255.0
-            
-            return img
+            return self.load_image(image_path)
         except Exception as e:
             logging.error(f"处理图片 {image_path} 时出错: {str(e)}")
             return None
@@ -62,6 +79,7 @@ class DataPreprocessor:
         
         # 创建输出目录
         self.create_directories()
+        self.errors = []
         
         # 根据数据集类型选择处理方法
         if dataset_name == 'celeba':
@@ -72,6 +90,10 @@ class DataPreprocessor:
             self.process_lfw()
         else:
             raise ValueError(f"不支持的数据集: {dataset_name}")
+        
+        # 淘汰最久未使用的缓存条目
+        if self.cache is not None:
+            self.cache.prune()
     
     def process_celeba(self):
         """处理 CelebA 数据集"""
@@ -90,31 +112,20 @@ class DataPreprocessor:
         if not os.path.exists(img_list_file):
             raise FileNotFoundError("找不到 CelebA 图片列表文件")
         
-        # 读取属性文件
-        attributes = pd.read_csv(attr_file, delim_whitespace=True, skiprows=1)
-        
-        # 处理数据
-        processed_data = []
-        with open(img_list_file, 'r') as f:
-            for line in f:
-                img_name, partition = line.strip().split()
-                img_path = os.path.join(self.data_dir, 'img_align_celeba', img_name)
-                
-                if os.path.exists(img_path):
-                    processed_img = self.preprocess_image(img_path)
-                    if processed_img is not None:
-                        # 获取图片的属性
-                        img_attrs = attributes.loc[img_name]
-                        
-                        processed_data.append({
-                            'image': processed_img,
-                            'partition': int(partition),
-                            'filename': img_name,
-                            'attributes': img_attrs.to_dict()
-                        })
+        # 属性表: 首行为样本数, 第二行为属性名, 之后每行是文件名和 -1/1 属性值
+        attributes = pd.read_csv(attr_file, sep=r'\s+', skiprows=1).astype(np.int8)
+        partitions = pd.read_csv(img_list_file, sep=r'\s+', header=None,
+                                 names=['filename', 'partition'], index_col='filename')
+        
+        # 划分表与属性表一次性连接, 只保留图片存在的样本
+        img_dir = os.path.join(self.data_dir, 'img_align_celeba')
+        metadata = partitions.join(attributes, how='inner')
+        metadata = metadata[metadata.index.isin(set(os.listdir(img_dir)))]
+        metadata = metadata.rename_axis('filename').reset_index()
+        metadata.insert(0, 'path', img_dir + os.sep + metadata['filename'])
         
         # 保存处理后的数据
-        self.save_processed_data(processed_data)
+        self.save_processed_data(metadata, list(attributes.columns))
         
         # 保存属性统计信息
         self.save_attribute_stats(attributes)
@@ -125,20 +136,15 @@ class DataPreprocessor:
         if not os.path.exists(img_dir):
             raise FileNotFoundError("找不到 FFHQ 图片目录")
         
-        processed_data = []
-        for img_name in os.listdir(img_dir):
-            if img_name.endswith('.png'):
-                img_path = os.path.join(img_dir, img_name)
-                processed_img = self.preprocess_image(img_path)
-                if processed_img is not None:
-                    processed_data.append({
-                        'image': processed_img,
-                        'partition': 0,  # FFHQ 默认用于训练
-                        'filename': img_name
-                    })
+        filenames = [img_name for img_name in os.listdir(img_dir) if img_name.endswith('.png')]
+        metadata = pd.DataFrame({
+            'path': [os.path.join(img_dir, img_name) for img_name in filenames],
+            'partition': 0,  # FFHQ 默认用于训练
+            'filename': filenames
+        })
         
         # 保存处理后的数据
-        self.save_processed_data(processed_data)
+        self.save_processed_data(metadata)
     
     def process_lfw(self):
         """处理 LFW 数据集"""
@@ -146,42 +152,60 @@ class DataPreprocessor:
         if not os.path.exists(img_dir):
             raise FileNotFoundError("找不到 LFW 图片目录")
         
-        processed_data = []
+        paths = []
         for person_dir in os.listdir(img_dir):
             person_path = os.path.join(img_dir, person_dir)
             if os.path.isdir(person_path):
                 for img_name in os.listdir(person_path):
                     if img_name.endswith('.jpg'):
-                        img_path = os.path.join(person_path, img_name)
-                        processed_img = self.preprocess_image(img_path)
-                        if processed_img is not None:
-                            processed_data.append({
-                                'image': processed_img,
-                                'partition': 0,  # LFW 默认用于训练
-                                'filename': img_name
-                            })
+                        paths.append(os.path.join(person_path, img_name))
+        
+        metadata = pd.DataFrame({
+            'path': paths,
+            'partition': 0,  # LFW 默认用于训练
+            'filename': [os.path.basename(path) for path in paths]
+        })
         
         # 保存处理后的数据
-        self.save_processed_data(processed_data)
+        self.save_processed_data(metadata)
     
-    def save_processed_data(self, processed_data):
-        """保存处理后的数据"""
+    def save_processed_data(self, metadata, label_columns=None):
+        """
+        保存处理后的数据
+        
+        metadata 为文件元数据表(path/partition/filename, 以及可选的标签列)。
+        先在元数据表上划分数据集, 再按划分逐张解码、处理并写出,
+        内存占用与图像数据量无关(只保留文件元数据)。
+        """
         # 划分训练集、验证集和测试集
-        train_data, val_data, test_data = self.split_dataset(processed_data)
+        train_data, val_data, test_data = self.split_dataset(metadata)
         
-        # 保存数据集
-        self.save_dataset(train_data, 'train')
-        self.save_dataset(val_data, 'val')
-        self.save_dataset(test_data, 'test')
+        # 保存数据集, 只保留成功写出的记录
+        train_data = self.save_dataset(train_data, 'train', label_columns)
+        val_data = self.save_dataset(val_data, 'val', label_columns)
+        test_data = self.save_dataset(test_data, 'test', label_columns)
         
         # 保存数据集信息
         self.save_dataset_info(train_data, val_data, test_data)
         
+        # 保存错误清单
+        write_error_manifest(self.errors, os.path.join(self.output_dir, 'errors.csv'))
+        
         # 保存属性数据
-        self.save_attributes(train_data, val_data, test_data)
+        if label_columns:
+            self.save_attributes(train_data, val_data, test_data, label_columns)
     
     def split_dataset(self, data):
-        """划分数据集"""
+        """
+        划分数据集
+        
+        数据自带多个划分(如 CelebA 官方的 0/1/2 划分)时直接按 partition 列取掩码,
+        否则随机划分
+        """
+        if data['partition'].nunique() > 1:
+            partition = data['partition'].to_numpy()
+            return data[partition == 0], data[partition == 1], data[partition == 2]
+        
         # 首先分离测试集
         train_val_data, test_data = train_test_split(
             data, test_size=0.1, random_state=42
@@ -194,12 +218,60 @@ class DataPreprocessor:
         
         return train_data, val_data, test_data
     
-    def save_dataset(self, data, split_name):
-        """保存数据集"""
+    def load_record(self, record):
+        """读取并预处理一条记录, 返回 (记录, 图像, 错误信息)"""
+        try:
+            return record, self.load_image(record['path']), None
+        except Exception as e:
+            return record, None, str(e)
+    
+    def _record_error(self, record, error, split_name):
+        """记录处理失败的图片"""
+        logging.error(f"处理图片 {record['path']} 时出错: {error}")
+        self.errors.append({
+            'filename': record['filename'],
+            'path': record['path'],
+            'split': split_name,
+            'error': error
+        })
+    
+    def iter_processed(self, records, split_name=''):
+        """
+        解码并预处理, 生成 (记录, 图像)
+
+        workers>1 时在进程池中解码, 失败的图片记入错误清单并被跳过
+        """
+        progress = ProgressReporter(len(records), f"{split_name} 解码")
+        for record, image, error in imap_tasks(self.load_record, records, self.workers,
+                                                self.chunksize, self.ordered):
+            progress.update(error is None)
+            if error is None:
+                yield record, image
+            else:
+                self._record_error(record, error, split_name)
+        progress.summary()
+    
+    def save_dataset(self, data, split_name, label_columns=None):
+        """
+        保存数据集, 返回成功写出的记录
+
+        图像以 uint8 张量写入分片记录文件(见 record_shards), 不再逐张编码为JPEG;
+        给出 label_columns 时对应列作为标签一同写入。解码在工作进程中完成。
+        """
         output_dir = os.path.join(self.output_dir, split_name)
-        for item in data:
-            img_path = os.path.join(output_dir, item['filename'])
-            cv2.imwrite(img_path, (item['image'] * 255).astype(np.uint8))
+        labels = data[label_columns].to_numpy(dtype=np.float32) if label_columns else None
+        records = data[['path', 'filename']].to_dict(orient='records')
+        
+        saved = np.zeros(len(records), dtype=bool)
+        with ShardWriter(output_dir, label_names=label_columns) as writer:
+            positions = {record['filename']: i for i, record in enumerate(records)}
+            for record, image in self.iter_processed(records, split_name):
+                position = positions[record['filename']]
+                writer.add(record['filename'], image, labels[position] if labels is not None else None)
+                saved[position] = True
+        
+        logging.info(f"{split_name} 集写出 {saved.sum()}/{len(records)} 条记录")
+        return data[saved]
     
     def save_dataset_info(self, train_data, val_data, test_data):
         """保存数据集信息"""
@@ -213,17 +285,13 @@ class DataPreprocessor:
         info_df = pd.DataFrame([info])
         info_df.to_csv(os.path.join(self.output_dir, 'dataset_info.csv'), index=False)
     
-    def save_attributes(self, train_data, val_data, test_data):
-        """保存属性数据"""
+    def save_attributes(self, train_data, val_data, test_data, label_columns):
+        """保存属性数据, 每个划分直接从列切片写出一个 Parquet 文件"""
+        columns = ['filename'] + list(label_columns)
         for split_name, data in [('train', train_data), ('val', val_data), ('test', test_data)]:
-            attributes = []
-            for item in data:
-                attr_dict = item['attributes']
-                attr_dict['filename'] = item['filename']
-                attributes.append(attr_dict)
-            
-            attr_df = pd.DataFrame(attributes)
-            attr_df.to_csv(os.path.join(self.output_dir, f'{split_name}_attributes.csv'), index=False)
+            data[columns].reset_index(drop=True).to_parquet(
+                os.path.join(self.output_dir, f'{split_name}_attributes.parquet'), index=False
+            )
     
     def save_attribute_stats(self, attributes):
         """保存属性统计信息"""
@@ -233,10 +301,12 @@ class DataPreprocessor:
             'attribute_names': list(attributes.columns)
         }
         
-        # 计算每个属性的正样本比例
-        for attr in attributes.columns:
-            positive_ratio = (attributes[attr] == 1).mean()
-            stats[f'{attr}_positive_ratio'] = positive_ratio
+        # 一次计算所有属性的正样本比例
+        positive_ratios = (attributes.to_numpy() == 1).mean(axis=0)
+        stats.update({
+            f'{attr}_positive_ratio': ratio
+            for attr, ratio in zip(attributes.columns, positive_ratios)
+        })
         
         stats_df = pd.DataFrame([stats])
         stats_df.to_csv(os.path.join(self.output_dir, 'attribute_stats.csv'), index=False)
@@ -245,7 +315,8 @@ if __name__ == '__main__':
     # 使用示例
     preprocessor = DataPreprocessor(
         data_dir='datasets/celeba',
-        output_dir='datasets/celeba/processed'
+        output_dir='datasets/celeba/processed',
+        workers=os.cpu_count()
     )
     
     # 处理CelebA数据集
@@ -0,0 +1,155 @@
+import os
+import json
+import logging
+import argparse
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers, models
+from typing import Dict, List, Sequence
+from model_trainer import FEATURE_LAYER, OUTPUT_NAMES, preprocessing_layers
+from record_shards import ShardDataset, ShardWriter
+from record_sequence import RecordSequence
+from evaluation import benchmark_model_file, format_table, model_predictor
+
+logger = logging.getLogger(__name__)
+
+# 默认比较的学生模型宽度(第一个深度可分离卷积块的通道数, 之后每块翻倍)
+STUDENT_WIDTHS = (8, 16, 32)
+
+# 延迟-精度表的列
+TABLE_COLUMNS = ('model', 'parameters', 'size_mb', 'load_ms', 'latency_p50_ms', 'latency_p95_ms',
+                 'throughput', 'mae', 'r2')
+
+def build_student(input_shape=(224, 224, 3), width: int = 16, blocks: int = 4,
+                  learning_rate: float = 0.002) -> tf.keras.Model:
+    """
+    构建紧凑的学生模型
+
+    与教师模型共用输入预处理层(uint8 RGB, 任意尺寸), 可直接由 SkinAnalyzer 加载;
+    步长 2 的普通卷积之后接 blocks 个深度可分离卷积块(每块下采样一次、通道数翻倍),
+    全局平均池化后直接回归 4 个输出, 不再有 Flatten + 大全连接层
+    """
+    stack = [
+        *preprocessing_layers(input_shape),
+        layers.Conv2D(width, (3, 3), strides=2, padding='same', use_bias=False),
+        layers.BatchNormalization(),
+        layers.ReLU()
+    ]
+    for block in range(blocks):
+        stack += [
+            layers.SeparableConv2D(width * 2 ** block, (3, 3), strides=2, padding='same', use_bias=False),
+            layers.BatchNormalization(),
+            layers.ReLU()
+        ]
+    stack += [
+        layers.GlobalAveragePooling2D(name=FEATURE_LAYER),
+        layers.Dense(len(OUTPUT_NAMES), activation='linear', dtype='float32')
+    ]
+    model = models.Sequential(stack, name=f'student_w{width}')
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        loss='mse',
+        metrics=['mae']
+    )
+    return model
+
+def label_with_teacher(teacher: tf.keras.Model, images: ShardDataset, output_dir: str,
+                       batch_size: int = 64) -> ShardDataset:
+    """
+    用教师模型为无标注图像生成软标签, 写成新的分片记录
+
+    每张图像只经过教师一次, 之后各学生模型的每一轮训练都直接读取记录中的教师输出;
+    接收浮点输入的旧教师模型先把图像换算到 [0, 1](见 evaluation.model_predictor)
+    """
+    predict = model_predictor(teacher)
+    metadata = {'source': images.data_dir, 'teacher': teacher.name}
+    with ShardWriter(output_dir, image_shape=images.image_shape, label_names=OUTPUT_NAMES,
+                     metadata=metadata) as writer:
+        keys = iter(images.keys)
+        for batch, _ in images.iter_batches(batch_size):
+            predictions = np.asarray(predict(batch))
+            for image, prediction in zip(batch, predictions):
+                writer.add(next(keys), image, prediction)
+    return ShardDataset(output_dir)
+
+def _image_records(source: str, output_dir: str, target_size=(224, 224)) -> ShardDataset:
+    """
+    无标注图像来源: 已有的分片记录目录直接打开, 图片目录则先解码写成记录
+    """
+    if ShardDataset.exists(source):
+        return ShardDataset(source)
+    from preprocess_data import IMAGE_EXTENSIONS, load_image
+
+    width, height = target_size
+    with ShardWriter(output_dir, image_shape=(height, width, 3)) as writer:
+        for name in sorted(os.listdir(source)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            try:
+                writer.add(name, load_image(os.path.join(source, name), target_size))
+            except Exception as e:
+                logger.warning(f"无法读取图像, 已跳过 {name}: {str(e)}")
+    return ShardDataset(output_dir)
+
+def distill(teacher_path: str, unlabeled: str, output_dir: str = 'models/distillation',
+            widths: Sequence[int] = STUDENT_WIDTHS, epochs: int = 20, batch_size: int = 32,
+            seed: int = 42) -> Dict[str, str]:
+    """
+    以教师模型的 4 个回归输出为目标训练不同宽度的学生模型, 返回 {模型名: 文件路径}
+
+    unlabeled 为无标注用户图像的目录或分片记录; 学生以 MSE 拟合教师输出(回归任务的蒸馏目标),
+    不需要人工标签。学生保存为 .h5, 与教师一样由 SkinAnalyzer 加载
+    """
+    teacher = tf.keras.models.load_model(teacher_path, compile=False)
+    os.makedirs(output_dir, exist_ok=True)
+    images = _image_records(unlabeled, os.path.join(output_dir, 'images'))
+    soft_labels = label_with_teacher(teacher, images, os.path.join(output_dir, 'soft_labels'))
+    logger.info(f"已用教师模型标注 {len(soft_labels)} 张图像")
+
+    paths = {}
+    for width in widths:
+        tf.keras.utils.set_random_seed(seed)
+        student = build_student(soft_labels.image_shape, width)
+        student.fit(
+            RecordSequence(soft_labels, batch_size, shuffle=True, seed=seed),
+            epochs=epochs,
+            callbacks=[tf.keras.callbacks.ReduceLROnPlateau(monitor='loss', factor=0.2, patience=3, min_lr=0.0001)],
+            shuffle=False,
+            verbose=2
+        )
+        path = os.path.join(output_dir, f'{student.name}.h5')
+        student.save(path)
+        paths[student.name] = path
+        logger.info(f"学生模型 {student.name}: {student.count_params()} 个参数, 已保存到 {path}")
+    return paths
+
+def latency_accuracy_table(model_paths: Dict[str, str], test_dir: str, batch_size: int = 1) -> List[Dict]:
+    """
+    在带标签的测试集上比较教师与各学生模型的延迟与精度, 每个模型一行
+    """
+    return [benchmark_model_file(path, test_dir, OUTPUT_NAMES, batch_size, label=name)
+            for name, path in model_paths.items()]
+
+def main():
+    parser = argparse.ArgumentParser(description='将皮肤分析模型蒸馏为紧凑的学生模型')
+    parser.add_argument('--teacher', default='models/skin_analysis_model.h5')
+    parser.add_argument('--unlabeled', required=True, help='无标注用户图像目录或分片记录目录')
+    parser.add_argument('--test-dir', default='data/records/test', help='带标签的测试集分片记录')
+    parser.add_argument('--output-dir', default='models/distillation')
+    parser.add_argument('--widths', type=int, nargs='+', default=list(STUDENT_WIDTHS))
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    paths = {'teacher': args.teacher}
+    paths.update(distill(args.teacher, args.unlabeled, args.output_dir, args.widths, args.epochs, args.batch_size))
+    rows = latency_accuracy_table(paths, args.test_dir)
+
+    os.makedirs('reports', exist_ok=True)
+    with open(os.path.join('reports', 'distillation_report.json'), 'w', encoding='utf-8') as f:
+        json.dump(rows, f, indent=2)
+    print(format_table(rows, TABLE_COLUMNS))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+import os
+import json
+import math
+import queue
+import time
+import socket
+import argparse
+import itertools
+import logging
+import multiprocessing
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+def free_ports(count: int) -> List[int]:
+    """取 count 个本机空闲端口, 供本地启动的各工作进程通信"""
+    sockets = [socket.socket() for _ in range(count)]
+    try:
+        for sock in sockets:
+            sock.bind(('localhost', 0))
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+def cluster_config(addresses: Sequence[str], index: int) -> Dict:
+    """第 index 个工作进程的 TF_CONFIG"""
+    return {'cluster': {'worker': list(addresses)}, 'task': {'type': 'worker', 'index': index}}
+
+def scale_hyperparameters(batch_size: int, learning_rate: float, num_workers: int) -> Tuple[int, float]:
+    """
+    按线性缩放规则换算全局批大小与学习率
+
+    batch_size 为每个工作进程的批大小, 全局批大小随工作进程数增大,
+    学习率按同样倍数放大, 使每个样本对参数更新的贡献与单进程训练一致
+    """
+    return batch_size * num_workers, learning_rate * num_workers
+
+def shard_range(num_records: int, index: int, num_workers: int, drop_remainder: bool = True) -> Tuple[int, int]:
+    """
+    第 index 个工作进程负责的连续记录区间 [start, stop)
+
+    训练时各分片大小相同(丢弃末尾不足一轮分配的记录), 保证各进程每轮步数一致,
+    否则同步的梯度聚合会互相等待; drop_remainder=False 时(用于评估)各分片合起来覆盖全部记录,
+    靠后的分片可能较小甚至为空, 由 _shard_batches 补空批次对齐步数
+    """
+    if drop_remainder:
+        per_worker = num_records // num_workers
+    else:
+        per_worker = math.ceil(num_records / num_workers)
+    return min(index * per_worker, num_records), min((index + 1) * per_worker, num_records)
+
+def _shard_batches(dataset, start: int, stop: int, batch_size: int, shuffle: bool, seed: int,
+                   steps: Optional[int] = None):
+    """
+    返回逐轮产出分片内批次的生成器函数
+
+    批内为连续记录(顺序读盘), shuffle 时每轮按 (seed, 轮次) 打乱批次顺序。
+    给出 steps 时(用于评估)产出 (图像, 标签, 样本权重), 不足的步数以一条权重为 0 的
+    全零记录补齐(空批次在 oneDNN 的 BatchNormalization 中会出错), 补齐的记录不计入指标
+    """
+    epochs = itertools.count()
+    padding = (np.zeros((1, *dataset.image_shape), np.uint8), np.zeros((1, len(dataset.label_names)), np.float32),
+               np.zeros(1, np.float32))
+
+    def generate():
+        starts = np.arange(start, stop, batch_size)
+        if shuffle:
+            np.random.default_rng([seed, next(epochs)]).shuffle(starts)
+        for batch_start in starts:
+            images, labels = dataset.read_range(int(batch_start), min(int(batch_start) + batch_size, stop))
+            yield (images, labels) if steps is None else (images, labels, np.ones(len(labels), np.float32))
+        for _ in range(len(starts), steps or 0):
+            yield padding
+
+    return generate
+
+def run_worker(config: Dict) -> Dict:
+    """
+    数据并行训练的单个工作进程
+
+    集群信息取自环境变量 TF_CONFIG(本地启动时由 train_distributed 设置,
+    多机训练时由各主机自行设置)。每个进程只读取自己的记录分片,
+    梯度经 MultiWorkerMirroredStrategy 的集合通信同步, 各进程参数始终一致。
+    由 0 号进程保存模型。
+    """
+    import tensorflow as tf
+    from model_trainer import SkinAnalysisModel
+    from record_shards import ShardDataset
+
+    strategy = tf.distribute.MultiWorkerMirroredStrategy()
+    num_workers = strategy.num_replicas_in_sync
+    task = json.loads(os.environ.get('TF_CONFIG', '{}')).get('task', {})
+    index = task.get('index', 0)
+    batch_size = config['batch_size']
+    global_batch_size, learning_rate = scale_hyperparameters(batch_size, config['learning_rate'], num_workers)
+
+    def make_dataset(record_dir: str, training: bool):
+        dataset = ShardDataset(record_dir)
+        # 评估使用全部记录: 分片不丢弃余数, 各进程按最大分片的步数补齐
+        start, stop = shard_range(len(dataset), index, num_workers, drop_remainder=training)
+        steps = math.ceil(shard_range(len(dataset), 0, num_workers, drop_remainder=training)[1] / batch_size)
+        signature = (
+            tf.TensorSpec((None, *dataset.image_shape), tf.uint8),
+            tf.TensorSpec((None, len(dataset.label_names)), tf.float32)
+        ) + (() if training else (tf.TensorSpec((None,), tf.float32),))
+        generate = _shard_batches(dataset, start, stop, batch_size, training, config['seed'] + index,
+                                  steps=None if training else steps)
+        distributed = strategy.distribute_datasets_from_function(
+            lambda _: tf.data.Dataset.from_generator(generate, output_signature=signature).prefetch(2)
+        )
+        return distributed, steps
+
+    train_data, train_steps = make_dataset(config['train_dir'], training=True)
+    if train_steps == 0:
+        raise ValueError(f"训练记录数({len(ShardDataset(config['train_dir']))})少于工作进程数({num_workers}), "
+                         f"每个进程分不到记录")
+    val_data, val_steps = make_dataset(config['val_dir'], training=False)
+    if config.get('steps_per_epoch'):
+        train_steps = min(train_steps, config['steps_per_epoch'])
+
+    with strategy.scope():
+        model = SkinAnalysisModel(input_shape=ShardDataset(config['train_dir']).image_shape,
+                                  learning_rate=learning_rate, dropout_rate=config['dropout_rate'],
+                                  precision=config.get('precision', 'float32')).model
+        optimizer = model.optimizer
+
+    def replica_train_step(images, labels):
+        with tf.GradientTape() as tape:
+            predictions = model(images, training=True)
+            per_example = tf.reduce_mean(tf.square(labels - predictions), axis=-1)
+            loss = tf.nn.compute_average_loss(per_example)
+            # mixed_float16 时放大损失防止梯度下溢, apply_gradients 中再缩小; 其他精度下原样返回
+            scaled_loss = optimizer.scale_loss(loss)
+        gradients = tape.gradient(scaled_loss, model.trainable_variables)
+        optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+        return (loss, tf.reduce_sum(tf.reduce_mean(tf.abs(labels - predictions), axis=-1)),
+                tf.cast(tf.shape(labels)[0], tf.float32))
+
+    def replica_eval_step(images, labels, weights):
+        predictions = model(images, training=False)
+        errors = labels - predictions
+        return (tf.reduce_sum(weights * tf.reduce_mean(tf.square(errors), axis=-1)),
+                tf.reduce_sum(weights * tf.reduce_mean(tf.abs(errors), axis=-1)),
+                tf.reduce_sum(weights))
+
+    @tf.function
+    def train_step(iterator):
+        results = strategy.run(replica_train_step, args=next(iterator))
+        return [strategy.reduce('SUM', value, axis=None) for value in results]
+
+    @tf.function
+    def eval_step(iterator):
+        results = strategy.run(replica_eval_step, args=next(iterator))
+        return [strategy.reduce('SUM', value, axis=None) for value in results]
+
+    history = {'loss': [], 'mae': [], 'val_loss': [], 'val_mae': []}
+    samples, seconds = 0, 0.0
+    for epoch in range(config['epochs']):
+        iterator = iter(train_data)
+        total_loss, total_abs, seen = 0.0, 0.0, 0.0
+        for step in range(train_steps):
+            start = time.perf_counter()
+            loss, abs_error, count = train_step(iterator)
+            count = float(count)
+            # 第一轮第一步包含图构建, 不计入吞吐
+            if epoch or step:
+                seconds += time.perf_counter() - start
+                samples += count
+            total_loss += float(loss)
+            total_abs += float(abs_error)
+            seen += count
+        history['loss'].append(total_loss / train_steps)
+        history['mae'].append(total_abs / seen)
+
+        iterator = iter(val_data)
+        squared, absolute, count = 0.0, 0.0, 0.0
+        for _ in range(val_steps):
+            batch_squared, batch_absolute, batch_count = eval_step(iterator)
+            squared += float(batch_squared)
+            absolute += float(batch_absolute)
+            count += float(batch_count)
+        history['val_loss'].append(squared / max(count, 1.0))
+        history['val_mae'].append(absolute / max(count, 1.0))
+        if index == 0:
+            logger.info(f"第 {epoch + 1}/{config['epochs']} 轮: loss={history['loss'][-1]:.4f} "
+                        f"val_loss={history['val_loss'][-1]:.4f}")
+
+    if index == 0 and config.get('model_path'):
+        os.makedirs(os.path.dirname(config['model_path']) or '.', exist_ok=True)
+        model.save(config['model_path'])
+    # 各进程在此同步一次再退出, 避免先退出的进程被协调服务视为故障
+    strategy.reduce('SUM', strategy.run(lambda: tf.constant(1.0)), axis=None)
+
+    return {
+        'worker': index,
+        'workers': num_workers,
+        'global_batch_size': global_batch_size,
+        'learning_rate': learning_rate,
+        'steps_per_epoch': train_steps,
+        'history': history,
+        'samples_per_second': round(samples / seconds, 2) if seconds else None
+    }
+
+def _launch_worker(tf_config: Dict, config: Dict, threads: int, results):
+    os.environ['TF_CONFIG'] = json.dumps(tf_config)
+    from parallel import limit_threads
+    limit_threads(threads)
+    results.put(run_worker(config))
+
+def train_distributed(train_dir: str, val_dir: str, workers: int = 2, epochs: int = 10,
+                      batch_size: int = 32, learning_rate: float = 0.001, dropout_rate: float = 0.5,
+                      model_path: Optional[str] = None, seed: int = 42,
+                      steps_per_epoch: Optional[int] = None, precision: str = 'float32') -> Dict:
+    """
+    在本机启动 workers 个工作进程做数据并行训练, 返回 0 号进程的结果
+
+    batch_size 与 learning_rate 为单进程的取值, 按工作进程数线性放大(见 scale_hyperparameters);
+    各进程平分 CPU 核心数作为计算线程; precision 同 SkinAnalysisModel
+    """
+    from record_shards import ShardDataset
+
+    # 工作进程内同样检查, 这里提前报错以免启动进程后只得到退出码
+    num_records = len(ShardDataset(train_dir))
+    if num_records < workers:
+        raise ValueError(f"训练记录数({num_records})少于工作进程数({workers}), 每个进程分不到记录")
+    addresses = [f'localhost:{port}' for port in free_ports(workers)]
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    config = {
+        'train_dir': train_dir,
+        'val_dir': val_dir,
+        'epochs': epochs,
+        'batch_size': batch_size,
+        'learning_rate': learning_rate,
+        'dropout_rate': dropout_rate,
+        'model_path': model_path,
+        'seed': seed,
+        'steps_per_epoch': steps_per_epoch,
+        'precision': precision
+    }
+    # 各进程训练结束后自行退出(MultiWorkerMirroredStrategy 会拦截 SIGTERM, 不能用进程池终止)
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [
+        context.Process(target=_launch_worker, args=(cluster_config(addresses, index), config, threads, results))
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outputs = []
+    while len(outputs) < workers:
+        try:
+            outputs.append(results.get(timeout=5))
+        except queue.Empty:
+            failed = [process.exitcode for process in processes if process.exitcode not in (None, 0)]
+            if failed:
+                # 一个进程失败后其余进程会阻塞在集合通信上, 直接结束
+                for process in processes:
+                    process.kill()
+                raise RuntimeError(f"工作进程异常退出, 退出码: {failed}")
+    for process in processes:
+        process.join()
+    return next(output for output in outputs if output['worker'] == 0)
+
+def benchmark_scaling(train_dir: str, val_dir: str, worker_counts: Sequence[int] = (1, 2, 4, 8),
+                      batch_size: int = 32, steps: int = 20) -> Dict[int, Dict[str, float]]:
+    """
+    对比不同工作进程数下的训练吞吐(样本/秒)及相对单进程的加速比与并行效率
+
+    每个进程的批大小固定(弱扩展), 每种配置训练 steps 步; 某种配置失败(如内存或CPU不足)时记录错误并继续
+    """
+    results = {}
+    for workers in worker_counts:
+        try:
+            result = train_distributed(train_dir, val_dir, workers=workers, epochs=1,
+                                       batch_size=batch_size, steps_per_epoch=steps)
+        except (RuntimeError, ValueError) as e:
+            logger.warning(f"{workers} 个工作进程的基准失败: {e}")
+            results[workers] = {'error': str(e)}
+            continue
+        results[workers] = {'samples_per_second': result['samples_per_second']}
+        logger.info(f"{workers} 个工作进程: {result['samples_per_second']} 样本/秒")
+
+    completed = {workers: result for workers, result in results.items() if 'error' not in result}
+    if completed:
+        base_workers = min(completed)
+        per_worker = completed[base_workers]['samples_per_second'] / base_workers
+        for workers, result in completed.items():
+            result['speedup'] = round(result['samples_per_second'] / completed[base_workers]['samples_per_second'], 2)
+            result['efficiency'] = round(result['samples_per_second'] / (per_worker * workers), 2)
+    return results
+
+def main():
+    from precision import PRECISIONS
+
+    parser = argparse.ArgumentParser(description='多进程数据并行训练')
+    parser.add_argument('mode', choices=['local', 'worker', 'benchmark'],
+                        help='local: 本机启动多个工作进程; worker: 按 TF_CONFIG 运行单个工作进程(多机); '
+                             'benchmark: 吞吐扩展性基准')
+    parser.add_argument('--train-dir', default='data/records/train')
+    parser.add_argument('--val-dir', default='data/records/val')
+    parser.add_argument('--workers', type=int, nargs='+', default=[2])
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=32, help='每个工作进程的批大小')
+    parser.add_argument('--learning-rate', type=float, default=0.001, help='单进程学习率, 按进程数放大')
+    parser.add_argument('--steps', type=int, default=20, help='基准每种配置的训练步数')
+    parser.add_argument('--model-path', default='models/skin_analysis_model.h5')
+    parser.add_argument('--precision', choices=PRECISIONS, default='float32')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.mode == 'benchmark':
+        result = benchmark_scaling(args.train_dir, args.val_dir, args.workers, args.batch_size, args.steps)
+    elif args.mode == 'worker':
+        config = {
+            'train_dir': args.train_dir, 'val_dir': args.val_dir, 'epochs': args.epochs,
+            'batch_size': args.batch_size, 'learning_rate': args.learning_rate, 'dropout_rate': 0.5,
+            'model_path': args.model_path, 'seed': 42, 'steps_per_epoch': None, 'precision': args.precision
+        }
+        result = run_worker(config)
+    else:
+        result = train_distributed(args.train_dir, args.val_dir, args.workers[0], args.epochs,
+                                   args.batch_size, args.learning_rate, model_path=args.model_path,
+                                   precision=args.precision)
+    print(json.dumps(result, indent=2))
+
+if __name__ == '__main__':
+    main()
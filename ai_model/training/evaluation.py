@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 报告中数值保留的小数位, 使同一模型多次评估的报告可以直接比较
+REPORT_PRECISION = 6
+
+class StreamingRegressionMetrics:
+    """
+    按批次累积的回归指标(每个输出分别统计 MSE / MAE / R²)
+
+    只保存每个输出的样本数、真实值均值与离差平方和(Welford 算法按批合并),
+    以及平方误差与绝对误差的运行均值, 内存占用与样本数无关。
+    R² = 1 - SSE / SST, 其中 SST 由真实值的离差平方和得到。
+    """
+
+    def __init__(self, names: Sequence[str]):
+        self.names = list(names)
+        size = len(self.names)
+        self.count = 0
+        self._mean = np.zeros(size)
+        self._m2 = np.zeros(size)
+        self._squared_error = np.zeros(size)
+        self._absolute_error = np.zeros(size)
+
+    def update(self, y_true: np.ndarray, y_pred: np.ndarray):
+        """合并一个批次的真实值与预测值, 形状均为 [B, 输出数]"""
+        y_true = np.asarray(y_true, dtype=np.float64)
+        errors = np.asarray(y_pred, dtype=np.float64) - y_true
+        batch_count = len(y_true)
+        if batch_count == 0:
+            return
+        total = self.count + batch_count
+        weight = batch_count / total
+
+        # 批内均值与离差平方和, 再与已有统计量合并(Chan 等人的并行 Welford 公式)
+        batch_mean = y_true.mean(axis=0)
+        batch_m2 = ((y_true - batch_mean) ** 2).sum(axis=0)
+        delta = batch_mean - self._mean
+        self._m2 += batch_m2 + delta ** 2 * self.count * weight
+        self._mean += delta * weight
+
+        self._squared_error += ((errors ** 2).mean(axis=0) - self._squared_error) * weight
+        self._absolute_error += (np.abs(errors).mean(axis=0) - self._absolute_error) * weight
+        self.count = total
+
+    def result(self) -> Dict[str, Dict[str, float]]:
+        """各输出的 mse / mae / r2"""
+        metrics = {}
+        for i, name in enumerate(self.names):
+            sse = self._squared_error[i] * self.count
+            metrics[name] = {
+                'mse': float(self._squared_error[i]),
+                'mae': float(self._absolute_error[i]),
+                'r2': float(1.0 - sse / self._m2[i]) if self._m2[i] > 0 else float('nan')
+            }
+        return metrics
+
+def _latency_summary(latencies: List[float]) -> Dict[str, float]:
+    latencies_ms = np.asarray(latencies) * 1000.0
+    return {
+        'mean': float(latencies_ms.mean()),
+        'p50': float(np.percentile(latencies_ms, 50)),
+        'p95': float(np.percentile(latencies_ms, 95)),
+        'max': float(latencies_ms.max())
+    }
+
+def _round(value):
+    if isinstance(value, float):
+        return round(value, REPORT_PRECISION)
+    if isinstance(value, dict):
+        return {key: _round(item) for key, item in value.items()}
+    return value
+
+def evaluate_stream(predict, batches: Iterable[Tuple[np.ndarray, np.ndarray]],
+                    names: Sequence[str], warmup_batches: int = 1) -> Dict:
+    """
+    逐批预测并累积指标, 返回评估报告
+
+    predict 接收一批输入返回预测值(如 model.predict_on_batch);
+    batches 逐批产出 (输入, 真实值), 全部测试集不必同时在内存中。
+    同一次运行同时记录每批延迟与吞吐, 前 warmup_batches 批(含图构建)只计指标不计时。
+    """
+    metrics = StreamingRegressionMetrics(names)
+    latencies = []
+    timed_samples = 0
+    batch_sizes = set()
+    for index, (inputs, targets) in enumerate(batches):
+        start = time.perf_counter()
+        predictions = np.asarray(predict(inputs))
+        elapsed = time.perf_counter() - start
+        if index >= warmup_batches:
+            latencies.append(elapsed)
+            timed_samples += len(targets)
+        batch_sizes.add(len(targets))
+        metrics.update(targets, predictions)
+
+    if metrics.count == 0:
+        raise ValueError("评估数据为空")
+    report = {
+        'samples': metrics.count,
+        'batch_size': max(batch_sizes),
+        'metrics': metrics.result()
+    }
+    if latencies:
+        report['latency_ms'] = _latency_summary(latencies)
+        report['throughput'] = timed_samples / sum(latencies)
+    return _round(report)
+
+def save_report(report: Dict, path: str, model_info: Optional[Dict] = None):
+    """
+    保存评估报告(JSON, 键排序), 时间戳与模型信息单独放在 run 下
+    """
+    document = dict(report)
+    document['run'] = {'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), **(model_info or {})}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+
+def compare_reports(baseline: Dict, candidate: Dict) -> Dict:
+    """
+    比较两份评估报告, 返回各指标的 (基线, 新值, 差值)
+
+    只比较两份报告中都有的数值项, run 信息不参与比较
+    """
+    def flatten(node, prefix=''):
+        items = {}
+        for key, value in node.items():
+            if key == 'run':
+                continue
+            path = f'{prefix}{key}'
+            if isinstance(value, dict):
+                items.update(flatten(value, path + '.'))
+            elif isinstance(value, (int, float)):
+                items[path] = value
+        return items
+
+    old, new = flatten(baseline), flatten(candidate)
+    return {
+        key: {'baseline': old[key], 'candidate': new[key], 'delta': _round(float(new[key] - old[key]))}
+        for key in sorted(old.keys() & new.keys())
+    }
+
+def model_predictor(model):
+    """
+    返回以分片记录中的 uint8 批次做前向计算的函数
+
+    新模型在图内归一化, 直接接收 uint8; 旧 .h5 模型接收 [0, 1] 的浮点输入(与 SkinAnalyzer 相同的判断),
+    先换算再推理, 否则 0-255 的输入会得到无意义的结果
+    """
+    import tensorflow as tf
+
+    dtype = tf.as_dtype(model.inputs[0].dtype)
+    if dtype == tf.uint8:
+        return model.predict_on_batch
+    if not dtype.is_floating:
+        raise ValueError(f"不支持的模型输入类型: {dtype.name}")
+    scale = dtype.as_numpy_dtype(1.0 / 255)
+    return lambda batch: model.predict_on_batch(np.asarray(batch, dtype=dtype.as_numpy_dtype) * scale)
+
+def benchmark_model_file(model_path: str, test_dir: str, names: Sequence[str], batch_size: int = 1,
+                         label: Optional[str] = None) -> Dict:
+    """
+    从文件加载模型并在分片记录测试集上评估, 返回一行部署指标
+
+    包括参数量、文件大小、加载耗时、按 batch_size 逐批推理的延迟与吞吐(旧模型的延迟含输入换算),
+    以及各输出 MAE / R² 的平均值(完整的各输出指标在 metrics 中)
+    """
+    import tensorflow as tf
+    from record_sequence import RecordSequence
+
+    start = time.perf_counter()
+    model = tf.keras.models.load_model(model_path, compile=False)
+    load_seconds = time.perf_counter() - start
+
+    batches = RecordSequence(test_dir, batch_size)
+    report = evaluate_stream(model_predictor(model), (batches[i] for i in range(len(batches))), names)
+    metrics = report['metrics']
+    return _round({
+        'model': label or os.path.basename(model_path),
+        'parameters': int(model.count_params()),
+        'size_mb': os.path.getsize(model_path) / 1024 ** 2,
+        'load_ms': load_seconds * 1000.0,
+        'latency_p50_ms': report['latency_ms']['p50'],
+        'latency_p95_ms': report['latency_ms']['p95'],
+        'throughput': report['throughput'],
+        'mae': float(np.mean([item['mae'] for item in metrics.values()])),
+        'r2': float(np.mean([item['r2'] for item in metrics.values()])),
+        'metrics': metrics
+    })
+
+def format_table(rows: List[Dict], columns: Sequence[str]) -> str:
+    """把若干行结果排成 Markdown 表格"""
+    lines = ['| ' + ' | '.join(columns) + ' |', '|' + '---|' * len(columns)]
+    for row in rows:
+        lines.append('| ' + ' | '.join(str(row.get(column, '')) for column in columns) + ' |')
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='比较两个模型版本的评估报告')
+    parser.add_argument('baseline', help='基线评估报告')
+    parser.add_argument('candidate', help='新模型的评估报告')
+    args = parser.parse_args()
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.candidate, 'r', encoding='utf-8') as f:
+        candidate = json.load(f)
+    print(json.dumps(compare_reports(baseline, candidate), indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+import os
+import json
+import math
+import time
+import itertools
+import logging
+import multiprocessing
+from typing import Dict, List, Optional
+from parallel import limit_threads
+
+logger = logging.getLogger(__name__)
+
+# 默认搜索空间: 轮数不再作为超参数, 由逐级减半的训练预算决定
+SEARCH_SPACE = {
+    'learning_rate': [0.001, 0.0005, 0.0001],
+    'dropout_rate': [0.3, 0.5, 0.7],
+    'batch_size': [16, 32, 64]
+}
+
+TRIAL_LOG = 'trials.jsonl'
+
+# 工作进程内缓存已打开的数据集, 同一进程中的后续试验直接复用
+_datasets = {}
+
+def _dataset(record_dir: str):
+    """打开分片记录(memmap), 多个工作进程经页缓存共享同一份数据"""
+    if record_dir not in _datasets:
+        from record_shards import ShardDataset
+        _datasets[record_dir] = ShardDataset(record_dir)
+    return _datasets[record_dir]
+
+def _run_trial(task: Dict) -> Dict:
+    """
+    将一个试验从 start_epoch 训练到 end_epoch, 返回验证损失
+
+    非首个阶段时从上一阶段保存的模型(含优化器状态)继续训练
+    """
+    import tensorflow as tf
+    from model_trainer import SkinAnalysisModel
+    from record_sequence import RecordSequence
+
+    params = task['params']
+    if task['start_epoch'] > 0:
+        model = tf.keras.models.load_model(task['resume_path'])
+    else:
+        model = SkinAnalysisModel(learning_rate=params['learning_rate'],
+                                  dropout_rate=params['dropout_rate']).model
+
+    start = time.perf_counter()
+    # 样本顺序由 (试验编号, 轮次) 决定, 晋级后从 start_epoch 接着编号, 不重放前几级的顺序;
+    # Keras 默认还会打乱序列的批次下标, 使顺序无法复现
+    history = model.fit(
+        RecordSequence(_dataset(task['train_dir']), params['batch_size'], shuffle=True, seed=task['trial_id'],
+                       epoch=task['start_epoch']),
+        validation_data=RecordSequence(_dataset(task['val_dir']), params['batch_size']),
+        initial_epoch=task['start_epoch'],
+        epochs=task['end_epoch'],
+        shuffle=False,
+        verbose=0
+    )
+    # 先写临时文件再替换, 中断时不会留下不完整的模型
+    tmp_path = task['model_path'].replace('.keras', '.tmp.keras')
+    model.save(tmp_path)
+    os.replace(tmp_path, task['model_path'])
+
+    return {
+        'trial_id': task['trial_id'],
+        'rung': task['rung'],
+        'params': params,
+        'epochs': task['end_epoch'],
+        'val_loss': float(history.history['val_loss'][-1]),
+        'seconds': round(time.perf_counter() - start, 3)
+    }
+
+class SuccessiveHalvingSearch:
+    """
+    逐级减半(successive halving)的超参数搜索
+
+    全部配置先各训练 min_epochs 轮, 每一级只保留验证损失最好的 1/eta,
+    并把训练预算乘以 eta, 直到 max_epochs。晋级的试验从上一级保存的模型继续训练,
+    不重复已完成的轮次。同一级的试验在工作进程中并行运行, 每个进程限定线程数。
+    每个完成的 (试验, 级别) 追加写入试验日志, 中断后重新运行会跳过已完成的部分。
+    每个试验只保留最近一级的模型, 被淘汰试验的模型随即删除。
+    """
+
+    def __init__(self, train_dir: str, val_dir: str, output_dir: str = 'reports/hyperparameter_search',
+                 search_space: Optional[Dict[str, List]] = None, min_epochs: int = 1,
+                 max_epochs: int = 27, eta: int = 3, workers: Optional[int] = None):
+        self.train_dir = train_dir
+        self.val_dir = val_dir
+        self.output_dir = output_dir
+        self.search_space = search_space or SEARCH_SPACE
+        self.min_epochs = min_epochs
+        self.max_epochs = max_epochs
+        self.eta = eta
+        self.workers = workers or min(os.cpu_count() or 1, 4)
+        self.log_path = os.path.join(output_dir, TRIAL_LOG)
+        os.makedirs(os.path.join(output_dir, 'models'), exist_ok=True)
+
+    def configurations(self) -> List[Dict]:
+        """搜索空间中的全部配置, 顺序固定以便恢复时对应同一试验编号"""
+        names = sorted(self.search_space)
+        return [dict(zip(names, values)) for values in itertools.product(*(self.search_space[n] for n in names))]
+
+    def rungs(self) -> List[int]:
+        """各级别的累计训练轮数"""
+        epochs, rungs = self.min_epochs, []
+        while epochs < self.max_epochs:
+            rungs.append(epochs)
+            epochs *= self.eta
+        return rungs + [self.max_epochs]
+
+    def _load_log(self) -> Dict:
+        """读取试验日志, 返回 {(试验编号, 级别): 结果}"""
+        completed = {}
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        result = json.loads(line)
+                        completed[(result['trial_id'], result['rung'])] = result
+        return completed
+
+    def _append_log(self, result: Dict):
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _model_path(self, trial_id: int, rung: int) -> str:
+        return os.path.join(self.output_dir, 'models', f'trial-{trial_id:03d}-rung-{rung}.keras')
+
+    def _remove_model(self, trial_id: int, rung: int):
+        path = self._model_path(trial_id, rung)
+        if rung >= 0 and os.path.exists(path):
+            os.remove(path)
+
+    def run(self) -> Dict:
+        """执行搜索, 返回最佳配置与计算量统计"""
+        configs = self.configurations()
+        completed = self._load_log()
+        for (trial_id, _), result in completed.items():
+            if result['params'] != configs[trial_id]:
+                raise ValueError(f"试验日志与当前搜索空间不一致: {self.log_path}")
+
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        context = multiprocessing.get_context('spawn')
+        active = list(range(len(configs)))
+        rungs = self.rungs()
+
+        with context.Pool(self.workers, initializer=limit_threads, initargs=(threads,)) as pool:
+            for rung, end_epoch in enumerate(rungs):
+                start_epoch = rungs[rung - 1] if rung > 0 else 0
+                tasks = [{
+                    'trial_id': trial_id,
+                    'rung': rung,
+                    'params': configs[trial_id],
+                    'start_epoch': start_epoch,
+                    'end_epoch': end_epoch,
+                    'train_dir': self.train_dir,
+                    'val_dir': self.val_dir,
+                    'model_path': self._model_path(trial_id, rung),
+                    'resume_path': self._model_path(trial_id, rung - 1)
+                } for trial_id in active if (trial_id, rung) not in completed]
+
+                logger.info(f"级别 {rung}: {len(active)} 个试验训练到第 {end_epoch} 轮"
+                            f"({len(active) - len(tasks)} 个已在日志中)")
+                for result in pool.imap_unordered(_run_trial, tasks):
+                    completed[(result['trial_id'], rung)] = result
+                    self._append_log(result)
+                    self._remove_model(result['trial_id'], rung - 1)
+
+                # 按验证损失保留前 1/eta 进入下一级
+                ranked = sorted(active, key=lambda trial_id: (completed[(trial_id, rung)]['val_loss'], trial_id))
+                if rung < len(rungs) - 1:
+                    active = ranked[:max(1, math.ceil(len(active) / self.eta))]
+                    for trial_id in ranked[len(active):]:
+                        self._remove_model(trial_id, rung)
+
+        best_id = ranked[0]
+        best = completed[(best_id, len(rungs) - 1)]
+        summary = {
+            'best_params': best['params'],
+            'best_val_loss': best['val_loss'],
+            'best_trial': best_id,
+            'best_model': self._model_path(best_id, len(rungs) - 1),
+            'rungs': rungs,
+            'trials': len(configs),
+            # 实际训练的总轮数, 与对每个配置训练 max_epochs 轮的穷举搜索对比
+            'epochs_trained': sum(
+                result['epochs'] - (rungs[result['rung'] - 1] if result['rung'] > 0 else 0)
+                for result in completed.values()
+            ),
+            'exhaustive_epochs': len(configs) * self.max_epochs
+        }
+        with open(os.path.join(self.output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        return summary
@@ -0,0 +1,154 @@
+import os
+import cv2
+import glob
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from typing import Dict, Optional, Sequence, Tuple
+from augmentation import augment_dataset
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+def _load_example(path: tf.Tensor, label: tf.Tensor, image_size: Tuple[int, int]):
+    """
+    读取并解码单张图片, 缩放到固定尺寸, 输出 uint8 RGB(归一化在模型图内完成)
+    """
+    image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    image = tf.image.resize(image, image_size)
+    return tf.saturate_cast(tf.round(image), tf.uint8), label
+
+def build_dataset(data: pd.DataFrame, label_columns: Sequence[str],
+                  image_dir: str = 'data/images', batch_size: int = 32,
+                  shuffle: bool = False, shuffle_buffer: int = 1024,
+                  cache: Optional[str] = None, image_size: Tuple[int, int] = (224, 224),
+                  augment: Optional[Dict[str, float]] = None,
+                  seed: Optional[int] = None) -> tf.data.Dataset:
+    """
+    从标注表构建 tf.data 输入管道
+
+    解码与缩放以 AUTOTUNE 并行执行, 批次经 prefetch 与训练计算重叠。
+    cache 为 None 时不缓存; 为空字符串时缓存在内存; 否则为磁盘缓存文件前缀,
+    首轮解码后的张量写入磁盘, 之后各轮直接顺序读取。
+    无法读取或解码的图片会被跳过。
+    augment 给出增强参数时在分批后对整批做随机增强(位于缓存之后, 每轮结果不同)。
+    """
+    paths = [os.path.join(image_dir, str(path)) for path in data['image_path']]
+    labels = data[list(label_columns)].to_numpy(dtype=np.float32)
+    dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+
+    # 不缓存时只打乱文件名, 缓冲区不占用图像内存, 可以覆盖整个数据集
+    if shuffle and cache is None:
+        dataset = dataset.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+
+    dataset = dataset.map(
+        lambda path, label: _load_example(path, label, image_size),
+        num_parallel_calls=AUTOTUNE,
+        deterministic=not shuffle
+    ).ignore_errors()
+
+    if cache is not None:
+        if cache:
+            os.makedirs(os.path.dirname(cache) or '.', exist_ok=True)
+        dataset = dataset.cache(cache)
+        if shuffle:
+            dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+
+    dataset = dataset.batch(batch_size)
+    if augment:
+        dataset = augment_dataset(dataset, seed=seed, config=augment)
+    return dataset.prefetch(AUTOTUNE)
+
+def load_numpy_arrays(data: pd.DataFrame, label_columns: Sequence[str],
+                      image_dir: str = 'data/images',
+                      image_size: Tuple[int, int] = (224, 224)) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    逐张读取图片到内存数组(原有的 NumPy 输入方式, 用于基准对比)
+    """
+    images, labels = [], []
+    for path, label in zip(data['image_path'], data[list(label_columns)].to_numpy(dtype=np.float32)):
+        image = cv2.imread(os.path.join(image_dir, str(path)))
+        if image is None:
+            continue
+        image = cv2.resize(image, image_size[::-1])
+        images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        labels.append(label)
+    return np.array(images), np.array(labels)
+
+def _time_fit(model: tf.keras.Model, steps: int, epochs: int, **fit_kwargs) -> float:
+    """
+    训练指定轮数并返回每秒步数
+    """
+    start = time.perf_counter()
+    model.fit(epochs=epochs, verbose=0, **fit_kwargs)
+    return steps * epochs / (time.perf_counter() - start)
+
+def benchmark_feeds(model: tf.keras.Model, data: pd.DataFrame, label_columns: Sequence[str],
+                    image_dir: str = 'data/images', batch_size: int = 32, epochs: int = 3,
+                    cache_dir: Optional[str] = None) -> dict:
+    """
+    对比 NumPy 内存数组与 tf.data 管道喂数据时的训练吞吐(步/秒)
+
+    NumPy 方式先把全部图片读入内存再训练, 分别给出纯训练与含加载时间的吞吐;
+    tf.data 方式的首轮包含解码, 启用缓存时之后各轮直接读取缓存。
+    """
+    # 预热一次, 排除图构建与编译开销
+    warmup = build_dataset(data.head(batch_size), label_columns, image_dir, batch_size)
+    model.fit(warmup, epochs=1, verbose=0)
+
+    start = time.perf_counter()
+    x, y = load_numpy_arrays(data, label_columns, image_dir)
+    load_seconds = time.perf_counter() - start
+    # 两种方式都会跳过无法读取的图片, 按实际样本数计算步数
+    steps = int(np.ceil(len(x) / batch_size))
+    numpy_rate = _time_fit(model, steps, epochs, x=x, y=y, batch_size=batch_size, shuffle=True)
+    results = {
+        'numpy': {
+            'load_seconds': round(load_seconds, 3),
+            'steps_per_second': round(numpy_rate, 3),
+            'end_to_end_steps_per_second': round(steps * epochs / (load_seconds + steps * epochs / numpy_rate), 3)
+        }
+    }
+    del x, y
+
+    feeds = {'tfdata': None}
+    if cache_dir:
+        feeds['tfdata_cached'] = os.path.join(cache_dir, 'benchmark')
+    for name, cache in feeds.items():
+        if cache:
+            for path in glob.glob(cache + '*'):
+                os.remove(path)
+        dataset = build_dataset(data, label_columns, image_dir, batch_size, shuffle=True, cache=cache)
+        results[name] = {'steps_per_second': round(_time_fit(model, steps, epochs, x=dataset), 3)}
+
+    results['steps_per_epoch'] = steps
+    results['epochs'] = epochs
+    return results
+
+def main():
+    from model_trainer import SkinAnalysisModel
+    from train_and_evaluate import LABEL_COLUMNS
+
+    parser = argparse.ArgumentParser(description='对比 NumPy 与 tf.data 输入方式的训练吞吐')
+    parser.add_argument('annotation_file', help='标注CSV文件(含 image_path 与标签列)')
+    parser.add_argument('--image-dir', default='data/images')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--cache-dir', help='启用磁盘缓存并额外测试缓存后的吞吐')
+    parser.add_argument('--output', help='结果JSON文件')
+    args = parser.parse_args()
+
+    data = pd.read_csv(args.annotation_file)
+    model = SkinAnalysisModel().model
+    results = benchmark_feeds(model, data, LABEL_COLUMNS, args.image_dir,
+                              args.batch_size, args.epochs, args.cache_dir)
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+if __name__ == '__main__':
+    main()
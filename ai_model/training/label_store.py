@@ -0,0 +1,260 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 各类记录分别存放, 表名只允许取自这里
+TABLES = ('labels', 'annotations', 'validations', 'update_log')
+
+# 各表记录的基本字段, 表为空时读取结果也带有这些列
+TABLE_COLUMNS = {
+    'labels': ['image_path', 'user_id', 'timestamp', 'age', 'gender', 'skin_type',
+               'skin_score', 'moisture_level', 'oil_level', 'sensitivity'],
+    'annotations': ['image_path', 'skin_score', 'moisture_level', 'oil_level', 'sensitivity',
+                    'skin_type', 'age', 'gender', 'annotator_id', 'timestamp'],
+    'validations': ['image_path', 'is_valid', 'validation_notes', 'validator_id', 'timestamp'],
+    'update_log': ['timestamp', 'total_samples']
+}
+
+def _to_builtin(value):
+    """JSON 序列化 numpy 标量等非内置类型"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (datetime, pd.Timestamp)):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+class LabelStore:
+    """
+    只追加的标签/标注存储(SQLite, WAL 模式)
+
+    每条记录以 JSON 保存, 写入是单条 INSERT, 与已有数据量无关;
+    WAL 模式下多个进程可同时写入, 读取不阻塞写入。
+    自增 id 即写入顺序, 可作为增量读取的高水位。
+    """
+
+    def __init__(self, db_path: str = 'data/labels.db', timeout: float = 30.0):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+
+        with self._connection() as conn:
+            for table in TABLES:
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, image_path TEXT, data TEXT NOT NULL)"
+                )
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_image_path ON {table} (image_path)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS migrations ("
+                "source TEXT PRIMARY KEY, rows INTEGER, migrated_at TEXT)"
+            )
+            # 训练集样本(引用标注 id)与增量构建的高水位
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS training_samples ("
+                "annotation_id INTEGER PRIMARY KEY, image_path TEXT, split TEXT NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """每个线程一个连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _check_table(table: str):
+        if table not in TABLES:
+            raise ValueError(f"未知的记录类型: {table}")
+
+    @staticmethod
+    def _row(record: Dict):
+        return record.get('image_path'), json.dumps(record, ensure_ascii=False, default=_to_builtin)
+
+    def append(self, table: str, record: Dict) -> int:
+        """追加一条记录, 返回记录 id"""
+        self._check_table(table)
+        with self._connection() as conn:
+            cursor = conn.execute(f"INSERT INTO {table} (image_path, data) VALUES (?, ?)", self._row(record))
+        return cursor.lastrowid
+
+    def append_many(self, table: str, records: Iterable[Dict]) -> int:
+        """在一个事务中批量追加记录, 返回写入条数"""
+        self._check_table(table)
+        rows = [self._row(record) for record in records]
+        with self._connection() as conn:
+            conn.executemany(f"INSERT INTO {table} (image_path, data) VALUES (?, ?)", rows)
+        return len(rows)
+
+    def max_id(self, table: str) -> int:
+        """当前最大记录 id, 没有记录时为 0"""
+        self._check_table(table)
+        row = self._connection().execute(f"SELECT MAX(id) FROM {table}").fetchone()
+        return row[0] or 0
+
+    def count(self, table: str) -> int:
+        self._check_table(table)
+        return self._connection().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def read(self, table: str, since_id: int = 0) -> pd.DataFrame:
+        """
+        读取 id 大于 since_id 的记录, 按写入顺序返回, 含 id 列
+        """
+        self._check_table(table)
+        cursor = self._connection().execute(
+            f"SELECT id, data FROM {table} WHERE id > ? ORDER BY id", (since_id,)
+        )
+        records = [{'id': row_id, **json.loads(data)} for row_id, data in cursor]
+        if not records:
+            return pd.DataFrame(columns=['id', *TABLE_COLUMNS[table]])
+        return pd.DataFrame.from_records(records)
+
+    def migrate_csv(self, table: str, csv_path: str) -> int:
+        """
+        将旧的 CSV 文件一次性导入指定表
+
+        每个源文件只导入一次(记录在 migrations 表中), 原文件保留不动。
+        """
+        self._check_table(table)
+        source = os.path.abspath(csv_path)
+        conn = self._connection()
+        if not os.path.exists(csv_path):
+            return 0
+        if conn.execute("SELECT 1 FROM migrations WHERE source = ?", (source,)).fetchone():
+            return 0
+
+        df = pd.read_csv(csv_path)
+        records: List[Dict] = [
+            {key: value for key, value in row.items() if not pd.isna(value)}
+            for row in df.to_dict(orient='records')
+        ]
+        try:
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO {table} (image_path, data) VALUES (?, ?)",
+                    [self._row(record) for record in records]
+                )
+                conn.execute(
+                    "INSERT INTO migrations (source, rows, migrated_at) VALUES (?, ?, ?)",
+                    (source, len(records), datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                )
+        except sqlite3.IntegrityError:
+            # 其他进程已同时完成导入, 本次事务整体回滚
+            return 0
+        logger.info(f"已从 {csv_path} 导入 {len(records)} 条记录到 {table}")
+        return len(records)
+
+    def get_meta(self, key: str, default: Optional[int] = 0) -> Optional[int]:
+        row = self._connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def set_meta(self, key: str, value: int):
+        with self._connection() as conn:
+            self._set_meta(conn, key, value)
+
+    def _set_meta(self, conn: sqlite3.Connection, key: str, value: int):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def count_training_samples(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM training_samples").fetchone()[0]
+
+    def build_training_samples(self, assign_split: Callable[[str], str]) -> int:
+        """
+        增量更新训练集, 返回新增样本数
+
+        图片是否入选只看其最新一条验证结果。只考察高水位之后的新标注
+        (按 image_path 索引查该图片最新的验证结果)和新验证结果涉及的图片:
+        最新结果为通过时加入其已有标注, 为不通过时从训练集中移除该图片的样本。
+        构建耗时取决于增量而非总量。
+        assign_split 由 image_path 决定样本划分, 已有样本不会被重新划分。
+        整个构建在一个写事务中完成, 并发构建互相排队。
+        """
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            seen_annotations = self.get_meta('build.annotations')
+            seen_validations = self.get_meta('build.validations')
+            last_annotation = self.max_id('annotations')
+            last_validation = self.max_id('validations')
+            params = {'seen_a': seen_annotations, 'last_a': last_annotation,
+                      'seen_v': seen_validations, 'last_v': last_validation}
+            latest_valid = (
+                "(SELECT json_extract(v.data, '$.is_valid') FROM validations v "
+                "WHERE v.image_path = {path} AND v.id <= :last_v ORDER BY v.id DESC LIMIT 1)"
+            )
+
+            # 新标注: 所属图片的最新验证结果为通过
+            rows = conn.execute(
+                "SELECT a.id, a.image_path FROM annotations a WHERE a.id > :seen_a AND a.id <= :last_a "
+                f"AND {latest_valid.format(path='a.image_path')} = 1",
+                params
+            ).fetchall()
+
+            # 有新验证结果的图片, 按最新结果加入已有标注或移除已有样本
+            changed = conn.execute(
+                f"SELECT image_path, {latest_valid.format(path='c.image_path')} FROM "
+                "(SELECT DISTINCT image_path FROM validations WHERE id > :seen_v AND id <= :last_v) c",
+                params
+            ).fetchall()
+            valid_paths = [(image_path,) for image_path, is_valid in changed if is_valid == 1]
+            invalid_paths = [(image_path,) for image_path, is_valid in changed if is_valid != 1]
+            for (image_path,) in valid_paths:
+                rows += conn.execute(
+                    "SELECT id, image_path FROM annotations WHERE image_path = ? AND id <= ?",
+                    (image_path, seen_annotations)
+                ).fetchall()
+
+            before = conn.total_changes
+            conn.executemany("DELETE FROM training_samples WHERE image_path = ?", invalid_paths)
+            removed = conn.total_changes - before
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO training_samples (annotation_id, image_path, split) VALUES (?, ?, ?)",
+                [(annotation_id, image_path, assign_split(image_path)) for annotation_id, image_path in rows]
+            )
+            added = conn.total_changes - before
+            self._set_meta(conn, 'build.annotations', last_annotation)
+            self._set_meta(conn, 'build.validations', last_validation)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if removed:
+            logger.info(f"最新验证结果为不通过, 已从训练集移除 {removed} 条样本")
+        return added
+
+    def read_training_samples(self, split: Optional[str] = None) -> pd.DataFrame:
+        """
+        读取训练集样本(标注内容加 split 列), 可只读取指定划分
+        """
+        query = (
+            "SELECT a.id, a.data, s.split FROM training_samples s "
+            "JOIN annotations a ON a.id = s.annotation_id"
+        )
+        params = ()
+        if split is not None:
+            query += " WHERE s.split = ?"
+            params = (split,)
+        cursor = self._connection().execute(query + " ORDER BY a.id", params)
+        records = [{'id': row_id, **json.loads(data), 'split': row_split} for row_id, data, row_split in cursor]
+        if not records:
+            return pd.DataFrame(columns=['id', *TABLE_COLUMNS['annotations'], 'split'])
+        return pd.DataFrame.from_records(records)
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
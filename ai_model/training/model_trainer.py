@@ -2,21 +2,71 @@ import tensorflow as tf
 from tensorflow.keras import layers, models
 import numpy as np
 import os
-from sklearn.metrics import mean_squared_error, r2_score
 import matplotlib.pyplot as plt
+from checkpointing import TrainingCheckpoint
+from evaluation import evaluate_stream
+from precision import check_precision, dtype_policy
+
+# 模型的 4 个输出
+OUTPUT_NAMES = ['skin_score', 'moisture', 'oil', 'sensitivity']
+
+# 图像嵌入取自该名称的层(输出层之前的特征), 与 SkinAnalyzer 中的 FEATURE_LAYER 一致
+FEATURE_LAYER = 'features'
+
+def preprocessing_layers(input_shape=(224, 224, 3)):
+    """
+    模型输入端的预处理层
+
+    模型直接接收任意尺寸的原始 uint8 RGB 图像, 缩放和归一化在计算图内完成,
+    训练与推理共用同一段预处理, 两侧不会再出现不一致。
+    """
+    height, width, channels = input_shape
+    return [
+        layers.Input(shape=(None, None, channels), dtype='uint8', name='image'),
+        layers.Resizing(height, width),
+        layers.Rescaling(1.0 / 255)
+    ]
 
 class SkinAnalysisModel:
-    def __init__(self, input_shape=(224, 224, 3)):
+    def __init__(self, input_shape=(224, 224, 3), learning_rate=0.001, dropout_rate=0.5, precision='float32'):
         self.input_shape = input_shape
+        self.learning_rate = learning_rate
+        self.dropout_rate = dropout_rate
+        self.precision = precision
         self.model = self._build_model()
         
     def _build_model(self):
         """
         构建深度学习模型
+        
+        precision 为 'mixed_bfloat16' / 'mixed_float16' 时各层以半精度计算、变量保持 float32(见 precision),
+        回归输出层始终以 float32 计算; float16 另需动态损失缩放防止梯度下溢, bfloat16 指数范围与 float32 相同, 不需要
         """
-        model = models.Sequential([
+        if self.precision != 'float32':
+            check_precision(self.precision)
+        with dtype_policy(self.precision):
+            model = self._build_layers()
+        
+        optimizer = tf.keras.optimizers.Adam(learning_rate=self.learning_rate)
+        if self.precision == 'mixed_float16':
+            optimizer = tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
+        
+        # 编译模型
+        model.compile(
+            optimizer=optimizer,
+            loss='mse',
+            metrics=['mae']
+        )
+        
+        return model
+    
+    def _build_layers(self):
+        return models.Sequential([
+            # 输入预处理: uint8 RGB -> 缩放 -> 归一化
+            *preprocessing_layers(self.input_shape),
+            
             # 卷积层1
-            layers.Conv2D(32, (3, 3), activation='relu', input_shape=self.input_shape),
+            layers.Conv2D(32, (3, 3), activation='relu'),
             layers.BatchNormalization(),
             layers.MaxPooling2D((2, 2)),
             
@@ -32,25 +82,25 @@ class SkinAnalysisModel:
             
             # 全连接层
             layers.Flatten(),
-            layers.Dense(256, activation='relu'),
-            layers.Dropout(0.5),
+            layers.Dense(256, activation='relu', name=FEATURE_LAYER),
+            layers.Dropout(self.dropout_rate),
             
             # 输出层
-            layers.Dense(4, activation='linear')  # 4个输出：肤质评分、水分、油脂、敏感度
+            layers.Dense(4, activation='linear', dtype='float32')  # 4个输出：肤质评分、水分、油脂、敏感度
         ])
-        
-        # 编译模型
-        model.compile(
-            optimizer='adam',
-            loss='mse',
-            metrics=['mae']
-        )
-        
-        return model
     
-    def train(self, train_data, val_data, epochs=50, batch_size=32):
+    def train(self, train_data, val_data, epochs=50, batch_size=32,
+              checkpoint_dir=None, resume=False, save_every=500, overwrite=False):
         """
         训练模型
+        
+        train_data / val_data 可以是内存中的 (X, y) 元组,
+        也可以是按批次产出数据的序列(如 RecordSequence), 此时 batch_size 由序列决定
+        
+        给定 checkpoint_dir 时每 save_every 批及每轮结束保存检查点(见 checkpointing);
+        resume=True 时从最新检查点继续: 训练数据支持 seek() 时从中断的批次接着训练,
+        否则从中断的那一轮开头重新训练该轮。已有检查点而未指定 resume 时拒绝开始,
+        以免误删中断训练的进度; overwrite=True 时删除已有检查点重新训练
         """
         # 早停策略
         early_stopping = tf.keras.callbacks.EarlyStopping(
@@ -66,36 +116,82 @@ class SkinAnalysisModel:
             patience=3,
             min_lr=0.0001
         )
+        callbacks = [early_stopping, reduce_lr]
         
         # 训练模型
-        history = self.model.fit(
-            train_data,
-            validation_data=val_data,
-            epochs=epochs,
-            batch_size=batch_size,
-            callbacks=[early_stopping, reduce_lr]
-        )
+        if isinstance(train_data, tuple):
+            x, y = train_data
+            fit_kwargs = {'x': x, 'y': y, 'batch_size': batch_size}
+        else:
+            # 序列自行决定批次顺序; Keras 默认还会打乱序列的批次下标, 使顺序无法复现
+            fit_kwargs = {'x': train_data, 'shuffle': False}
+        
+        if checkpoint_dir is None:
+            return self.model.fit(
+                validation_data=val_data,
+                epochs=epochs,
+                callbacks=callbacks,
+                **fit_kwargs
+            )
         
+        # 检查点回调排在最后, 以便在其他回调重置状态之后写回恢复的状态
+        checkpoint = TrainingCheckpoint(checkpoint_dir, save_every, tracked_callbacks=callbacks)
+        checkpoint.attach(self.model)
+        if not resume and not overwrite and checkpoint.latest is not None:
+            raise FileExistsError(
+                f"{checkpoint_dir} 中已有检查点 {checkpoint.latest}, "
+                "继续训练请指定 resume=True(--resume), 重新训练请指定 overwrite=True(--overwrite)"
+            )
+        state = checkpoint.restore() if resume else None
+        if state is None:
+            checkpoint.clear()
+        initial_epoch = state['epoch'] if state else 0
+        
+        if state and state['step'] > 0 and hasattr(train_data, 'seek') and initial_epoch < epochs:
+            # 先训练中断那一轮剩余的批次
+            checkpoint.step_offset = state['step']
+            self.model.fit(
+                train_data.seek(initial_epoch, state['step']),
+                validation_data=val_data,
+                initial_epoch=initial_epoch,
+                epochs=initial_epoch + 1,
+                callbacks=callbacks + [checkpoint],
+                shuffle=False
+            )
+            initial_epoch += 1
+            # EarlyStopping 在每次 fit 结束时换回最佳权重, 继续训练前重新载入该轮结束时的检查点
+            if not self.model.stop_training:
+                checkpoint.restore()
+        
+        if hasattr(train_data, 'set_epoch'):
+            train_data.set_epoch(initial_epoch)
+        history = tf.keras.callbacks.History()
+        if initial_epoch < epochs and not self.model.stop_training:
+            history = self.model.fit(
+                validation_data=val_data,
+                initial_epoch=initial_epoch,
+                epochs=epochs,
+                callbacks=callbacks + [checkpoint],
+                **fit_kwargs
+            )
+        # 历史记录包含恢复之前已完成的轮次
+        history.history = checkpoint.history
         return history
     
-    def evaluate(self, test_data):
+    def evaluate(self, test_data, batch_size=32):
         """
         评估模型性能
+        
+        test_data 可以是内存中的 (X, y) 元组, 也可以是按批次产出 (X, y) 的序列(如 RecordSequence);
+        逐批预测并累积各输出的 MSE / MAE / R²(见 evaluation), 同时记录每批延迟与吞吐
         """
-        predictions = self.model.predict(test_data[0])
-        true_values = test_data[1]
-        
-        # 计算各项指标
-        metrics = {}
-        for i, name in enumerate(['skin_score', 'moisture', 'oil', 'sensitivity']):
-            mse = mean_squared_error(true_values[:, i], predictions[:, i])
-            r2 = r2_score(true_values[:, i], predictions[:, i])
-            metrics[name] = {
-                'mse': mse,
-                'r2': r2
-            }
-        
-        return metrics
+        if isinstance(test_data, tuple):
+            x, y = test_data
+            batches = ((x[i:i + batch_size], y[i:i + batch_size]) for i in range(0, len(x), batch_size))
+        else:
+            batches = (test_data[i] for i in range(len(test_data)))
+        
+        return evaluate_stream(self.model.predict_on_batch, batches, OUTPUT_NAMES)
     
     def plot_training_history(self, history, save_path=None):
         """
@@ -0,0 +1,99 @@
+import os
+import csv
+import time
+import logging
+import multiprocessing
+import cv2
+
+logger = logging.getLogger(__name__)
+
+def default_workers():
+    """默认工作进程数: 全部CPU核心"""
+    return os.cpu_count() or 1
+
+def _init_worker():
+    """工作进程初始化: OpenCV 只用单线程, 避免与进程池争抢CPU"""
+    cv2.setNumThreads(1)
+
+def limit_threads(threads):
+    """工作进程初始化: 限制 TensorFlow/OpenMP 线程数, 各进程合计不超过CPU核心数"""
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+def imap_tasks(func, items, workers=None, chunksize=64, ordered=True):
+    """
+    在进程池中对 items 逐个执行 func 并生成结果
+
+    任务按 chunksize 分块派发以摊薄进程间通信开销;
+    ordered=False 时按完成顺序返回结果, 吞吐量更高。
+    workers<=1 时直接在当前进程中执行, 便于调试。
+    func 需可被 pickle(模块级函数、functools.partial 或可序列化对象的方法)。
+    """
+    workers = default_workers() if workers is None else workers
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+        mapper = pool.imap if ordered else pool.imap_unordered
+        yield from mapper(func, items, chunksize)
+
+class ProgressReporter:
+    """处理进度与吞吐量报告"""
+
+    def __init__(self, total, desc='处理', interval=5.0):
+        self.total = total
+        self.desc = desc
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.start_time = time.perf_counter()
+        self._last_report = self.start_time
+
+    def update(self, success=True):
+        """记录一个任务完成, 每隔 interval 秒输出一次进度"""
+        self.done += 1
+        if not success:
+            self.failed += 1
+
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            logger.info(self._format(now))
+
+    def summary(self):
+        """输出并返回最终统计"""
+        now = time.perf_counter()
+        logger.info(self._format(now))
+        elapsed = now - self.start_time
+        return {
+            'total': self.total,
+            'done': self.done,
+            'failed': self.failed,
+            'elapsed_seconds': round(elapsed, 3),
+            'images_per_second': round(self.done / elapsed, 2) if elapsed > 0 else 0.0
+        }
+
+    def _format(self, now):
+        elapsed = now - self.start_time
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        percent = self.done / self.total * 100 if self.total else 100.0
+        return (f"{self.desc}: {self.done}/{self.total} ({percent:.1f}%), "
+                f"{rate:.1f} 张/秒, 失败 {self.failed}")
+
+def write_error_manifest(errors, path):
+    """将处理失败的图片写入错误清单CSV, 没有失败时删除旧清单"""
+    if not errors:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+
+    fieldnames = list(dict.fromkeys(key for error in errors for key in error))
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(errors)
+    logger.warning(f"{len(errors)} 张图片处理失败, 详见 {path}")
@@ -0,0 +1,167 @@
+import os
+import time
+import json
+import logging
+import argparse
+import contextlib
+import tensorflow as tf
+from typing import Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# 支持的计算精度: float32 基线, bfloat16 / float16 混合精度(变量与输出层保持 float32)
+PRECISIONS = ('float32', 'mixed_bfloat16', 'mixed_float16')
+
+# 与 bfloat16 计算相关的 CPU 指令集(/proc/cpuinfo 中的标志名)
+BF16_CPU_FLAGS = ('avx512_bf16', 'amx_bf16', 'amx_tile')
+
+def cpu_features() -> Dict[str, bool]:
+    """
+    检测 CPU 是否原生支持 bfloat16 计算(AVX512-BF16 / AMX), 不支持时 bfloat16 只能模拟, 通常比 float32 更慢
+    """
+    flags = set()
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    flags.update(line.split(':', 1)[1].split())
+                    break
+    except OSError:
+        pass
+    return {flag: flag in flags for flag in BF16_CPU_FLAGS}
+
+def onednn_enabled() -> bool:
+    """
+    TensorFlow 的 oneDNN 优化是否生效
+
+    x86 Linux 版本默认开启, 导入 TensorFlow 前设置 TF_ENABLE_ONEDNN_OPTS=0 可关闭
+    """
+    try:
+        from tensorflow.python.util import _pywrap_util_port
+        return bool(_pywrap_util_port.IsMklEnabled())
+    except (ImportError, AttributeError):
+        return os.environ.get('TF_ENABLE_ONEDNN_OPTS', '1') != '0'
+
+def check_precision(precision: str) -> Dict:
+    """
+    检查指定精度在本机的运行环境, 返回 oneDNN 与 CPU 指令集状态; 环境不理想时记录警告
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"不支持的计算精度: {precision}")
+    status = {'precision': precision, 'onednn': onednn_enabled(), 'cpu': cpu_features()}
+    if not status['onednn']:
+        logger.warning("oneDNN 优化未开启(TF_ENABLE_ONEDNN_OPTS=0?), CPU 训练无法使用融合算子与 bfloat16 内核")
+    if precision == 'mixed_bfloat16' and not any(status['cpu'].values()):
+        logger.warning("CPU 不支持 AVX512-BF16 / AMX, bfloat16 计算为软件模拟, 可能比 float32 更慢")
+    logger.info(f"计算精度 {precision}: oneDNN={'开启' if status['onednn'] else '关闭'}, CPU={status['cpu']}")
+    return status
+
+@contextlib.contextmanager
+def dtype_policy(precision: str):
+    """
+    在 with 块内把 Keras 全局精度策略设为 precision, 退出时恢复原策略
+
+    只在构建模型时生效, 各层在创建时记下当时的策略, 不影响之后构建的其他模型
+    """
+    previous = tf.keras.mixed_precision.global_policy()
+    tf.keras.mixed_precision.set_global_policy(precision)
+    try:
+        yield
+    finally:
+        tf.keras.mixed_precision.set_global_policy(previous)
+
+class ThroughputCallback(tf.keras.callbacks.Callback):
+    """
+    记录训练吞吐(样本/秒), 每轮第一批(含图构建)不计时
+
+    给出每轮样本数 num_samples 时每轮最后一个不满的批次按实际大小计数, 否则每批按 batch_size 计
+    """
+
+    def __init__(self, batch_size: int, num_samples: Optional[int] = None):
+        super().__init__()
+        self.batch_size = batch_size
+        self.num_samples = num_samples
+        self.elapsed = 0.0
+        self.samples = 0
+        self._start = None
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._start = time.perf_counter() if batch > 0 else None
+
+    def on_train_batch_end(self, batch, logs=None):
+        if self._start is not None:
+            self.elapsed += time.perf_counter() - self._start
+            self.samples += self._batch_samples(batch)
+
+    def _batch_samples(self, batch: int) -> int:
+        if self.num_samples is None:
+            return self.batch_size
+        return max(0, min(self.batch_size, self.num_samples - batch * self.batch_size))
+
+    @property
+    def samples_per_second(self) -> float:
+        return self.samples / self.elapsed if self.elapsed else 0.0
+
+def compare_precisions(train_dir: str, val_dir: str, precisions: Sequence[str] = ('float32', 'mixed_bfloat16'),
+                       epochs: int = 3, batch_size: int = 32, seed: int = 0) -> Dict:
+    """
+    用相同的数据与初始化分别以各精度训练, 比较训练吞吐与验证集指标
+
+    第一个精度作为基线, 其余精度给出吞吐加速比及各指标相对基线的差值(见 evaluation.compare_reports)
+    """
+    from model_trainer import SkinAnalysisModel
+    from record_shards import ShardDataset
+    from record_sequence import RecordSequence
+    from evaluation import compare_reports
+
+    train_dataset = ShardDataset(train_dir)
+    val_dataset = ShardDataset(val_dir)
+    results = {}
+    for precision in precisions:
+        environment = check_precision(precision)
+        tf.keras.utils.set_random_seed(seed)
+        model = SkinAnalysisModel(input_shape=train_dataset.image_shape, precision=precision)
+        throughput = ThroughputCallback(batch_size, len(train_dataset))
+        model.model.fit(
+            RecordSequence(train_dataset, batch_size, shuffle=True, seed=seed),
+            epochs=epochs,
+            callbacks=[throughput],
+            shuffle=False,
+            verbose=0
+        )
+        report = model.evaluate(RecordSequence(val_dataset, batch_size), batch_size)
+        results[precision] = {
+            'environment': environment,
+            'train_samples_per_second': throughput.samples_per_second,
+            'evaluation': report
+        }
+        logger.info(f"{precision}: 训练吞吐 {throughput.samples_per_second:.1f} 样本/秒")
+
+    baseline = results[precisions[0]]
+    for precision in precisions[1:]:
+        result = results[precision]
+        result['speedup'] = (result['train_samples_per_second'] / baseline['train_samples_per_second']
+                             if baseline['train_samples_per_second'] else 0.0)
+        result['metric_differences'] = compare_reports(baseline['evaluation']['metrics'],
+                                                       result['evaluation']['metrics'])
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='比较 float32 与混合精度训练的吞吐和指标')
+    parser.add_argument('train_dir', help='训练集分片记录目录')
+    parser.add_argument('val_dir', help='验证集分片记录目录')
+    parser.add_argument('--precisions', nargs='+', choices=PRECISIONS, default=['float32', 'mixed_bfloat16'])
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--output', default='reports/precision_comparison.json')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    results = compare_precisions(args.train_dir, args.val_dir, args.precisions, args.epochs, args.batch_size)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+if __name__ == '__main__':
+    main()
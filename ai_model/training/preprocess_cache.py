@@ -0,0 +1,133 @@
+import os
+import cv2
+import json
+import uuid
+import hashlib
+import logging
+import numpy as np
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 预处理实现变化时递增, 使旧的缓存条目失效
+CACHE_VERSION = 1
+
+class PreprocessCache:
+    """
+    内容寻址的预处理结果缓存
+
+    键为源文件字节的哈希加预处理参数(目标尺寸、颜色顺序、归一化等),
+    源文件内容或参数任一变化都会得到新的键, 因此条目无需失效处理;
+    改名、移动或跨数据集的相同文件共用同一条目。
+    每个条目是一个 .npy 文件, 原子写入, 多个工作进程可以同时读写。
+    命中时更新文件修改时间, prune() 按修改时间做 LRU 淘汰, 使总大小不超过 max_bytes。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 5 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(data: bytes, params: Dict) -> str:
+        """源文件内容与预处理参数共同决定的缓存键"""
+        digest = hashlib.sha256(data)
+        digest.update(json.dumps({'version': CACHE_VERSION, **params}, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f'{key}.npy')
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """读取缓存条目, 不存在时返回 None"""
+        path = self._path(key)
+        try:
+            array = np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return array
+
+    def put(self, key: str, array: np.ndarray):
+        """写入缓存条目(先写临时文件再原子替换)"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str, params: Dict, decode: Callable[[bytes], np.ndarray]) -> np.ndarray:
+        """
+        读取源文件并返回预处理结果, 命中缓存时跳过解码与缩放
+
+        decode 将源文件字节转换为预处理后的数组, 失败时应抛出异常
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        key = self.key(data, params)
+        array = self.get(key)
+        if array is None:
+            array = decode(data)
+            self.put(key, array)
+        return array
+
+    def prune(self) -> Dict[str, int]:
+        """按最近使用时间淘汰条目, 直到总大小不超过 max_bytes, 返回统计"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+
+        stats = {'entries': len(entries) - evicted, 'bytes': total, 'evicted': evicted}
+        logger.info(f"预处理缓存: {stats['entries']} 个条目, {total / 1024 ** 2:.1f}MB, 淘汰 {evicted} 个")
+        return stats
+
+def load_with_cache(path: str, params: Dict, decode: Callable[[bytes], np.ndarray],
+                    cache: Optional[PreprocessCache] = None) -> np.ndarray:
+    """有缓存时经缓存读取, 否则直接读取并解码"""
+    if cache is not None:
+        return cache.load(path, params, decode)
+    with open(path, 'rb') as f:
+        return decode(f.read())
+
+def preprocess_params(target_size=(224, 224)) -> Dict:
+    """预处理参数, 同时作为预处理缓存键的一部分; 与 decode_image 的实现一一对应"""
+    return {'target_size': list(target_size), 'color': 'RGB', 'dtype': 'uint8', 'normalize': None}
+
+def decode_image(data: bytes, target_size=(224, 224), source: str = '') -> np.ndarray:
+    """
+    将图片文件字节解码为 target_size 的 uint8 RGB 图像, 归一化由模型内的预处理层完成
+    """
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError(f"无法读取图片: {source}")
+    # 调整大小, 保证各数据集图片尺寸一致以便存储和组批
+    img = cv2.resize(img, tuple(target_size))
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+def load_image(path: str, target_size=(224, 224), cache: Optional[PreprocessCache] = None) -> np.ndarray:
+    """读取并预处理单张图片, 失败时抛出异常; 提供缓存时复用未变化图片的结果"""
+    path = str(path)
+    return load_with_cache(path, preprocess_params(target_size),
+                           lambda data: decode_image(data, target_size, path), cache)
@@ -3,7 +3,10 @@ import cv2
 import numpy as np
 import pandas as pd
 from pathlib import Path
+from functools import partial
 import logging
+from parallel import ProgressReporter, imap_tasks, write_error_manifest
+from preprocess_cache import PreprocessCache, load_image, preprocess_params
 
 # 设置日志
 logging.basicConfig(
@@ -12,38 +15,79 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
 def preprocess_image(image_path, target_size=(224, 224)):
-    """预处理单张图片"""
+    """预处理单张图片, 返回 uint8 RGB 图像(归一化在模型内完成)"""
     try:
-        # 读取图片
-        img = cv2.imread(str(image_path))
-        if img is None:
-            raise ValueError(f"无法读取图片: {image_path}")
-        
-        # 调整大小
-        img = cv2.resize(img, target_size)
-        
-        # 归一化
-        img = img.astype(np.float32) / 255.0
-        
-        return img
+        return load_image(image_path, target_size)
     except Exception as e:
         logger.error(f"图片预处理失败 {image_path}: {str(e)}")
         return None
 
-def prepare_dataset(data_dir, output_dir):
-    """准备数据集"""
+def process_file(image_path, output_dir, target_size=(224, 224), cache=None):
+    """预处理一张图片并写入输出目录, 返回 (图片路径, 错误信息)"""
+    try:
+        img = load_image(image_path, target_size, cache)
+        output_file = os.path.join(output_dir, Path(image_path).name)
+        if not cv2.imwrite(output_file, cv2.cvtColor(img, cv2.COLOR_RGB2BGR)):
+            raise IOError(f"无法写入图片: {output_file}")
+        return image_path, None
+    except Exception as e:
+        return image_path, str(e)
+
+def prepare_dataset(data_dir, output_dir, workers=None, chunksize=64, ordered=False,
+                    target_size=(224, 224), cache_dir=None, cache_max_bytes=5 * 1024 ** 3):
+    """
+    准备数据集
+
+    图片列表按 chunksize 分块派发到 workers 个进程中并行处理(默认全部核心),
+    处理失败的图片写入 errors.csv, 返回进度统计。
+    给出 cache_dir 时按源文件内容与参数缓存预处理结果, 重新构建只处理新增或变化的图片。
+    """
     try:
         # 创建输出目录
         output_path = Path(output_dir)
-        output_path.mkdir(parents=True, exist_ok=True)
+        image_dir = output_path / 'images'
+        image_dir.mkdir(parents=True, exist_ok=True)
         
-        # 这里需要实现数据集准备逻辑
         # 1. 读取数据集元数据
+        image_paths = sorted(
+            str(path) for path in Path(data_dir).rglob('*')
+            if path.suffix.lower() in IMAGE_EXTENSIONS
+        )
+        logger.info(f"共找到 {len(image_paths)} 张图片")
+        
         # 2. 预处理图片
+        cache = PreprocessCache(cache_dir, cache_max_bytes) if cache_dir else None
+        task = partial(process_file, output_dir=str(image_dir), target_size=target_size, cache=cache)
+        progress = ProgressReporter(len(image_paths), '预处理')
+        processed, errors = [], []
+        for image_path, error in imap_tasks(task, image_paths, workers, chunksize, ordered):
+            progress.update(error is None)
+            if error is None:
+                processed.append(image_path)
+            else:
+                errors.append({'path': image_path, 'error': error})
+        stats = progress.summary()
+        if cache is not None:
+            stats['cache'] = cache.prune()
+        
         # 3. 保存处理后的数据
+        manifest = pd.DataFrame({
+            'image_id': [Path(path).stem for path in processed],
+            'source_path': processed,
+            'image_path': [os.path.join('images', Path(path).name) for path in processed]
+        })
+        metadata_file = Path(data_dir) / 'HAM10000_metadata.csv'
+        if metadata_file.exists() and metadata_file.stat().st_size > 0:
+            metadata = pd.read_csv(metadata_file)
+            manifest = manifest.merge(metadata, on='image_id', how='left')
+        manifest.to_csv(output_path / 'manifest.csv', index=False)
+        write_error_manifest(errors, str(output_path / 'errors.csv'))
         
         logger.info("数据集准备完成")
+        return stats
         
     except Exception as e:
         logger.error(f"数据集准备失败: {str(e)}")
@@ -52,4 +96,4 @@ def prepare_dataset(data_dir, output_dir):
 if __name__ == "__main__":
     data_dir = "datasets/ham10000"
     output_dir = "datasets/processed"
-    prepare_dataset(data_dir, output_dir) 
\ No newline at end of file
+    prepare_dataset(data_dir, output_dir)
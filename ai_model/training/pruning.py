@@ -0,0 +1,184 @@
+import os
+import gzip
+import json
+import logging
+import argparse
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers
+from typing import Dict, List, Optional, Sequence
+from model_trainer import OUTPUT_NAMES
+from record_sequence import RecordSequence
+from evaluation import benchmark_model_file, format_table
+
+logger = logging.getLogger(__name__)
+
+# 默认比较的剪枝比例(每个卷积层与隐藏全连接层去掉的通道/单元比例)
+SPARSITIES = (0.25, 0.5, 0.75)
+
+# 剪枝报告表的列
+TABLE_COLUMNS = ('model', 'sparsity', 'parameters', 'size_mb', 'compressed_mb', 'load_ms',
+                 'latency_p50_ms', 'latency_p95_ms', 'mae', 'r2')
+
+def _keep_indices(scores: np.ndarray, sparsity: float) -> np.ndarray:
+    """按得分保留 (1 - sparsity) 比例的通道(至少 1 个), 返回升序下标"""
+    keep = max(1, int(round(len(scores) * (1.0 - sparsity))))
+    return np.sort(np.argsort(scores)[::-1][:keep])
+
+def _flatten_indices(layer: tf.keras.layers.Layer, channels: np.ndarray) -> np.ndarray:
+    """通道下标映射为 Flatten 输出中的下标(channels_last: 每个空间位置依次排列全部通道)"""
+    shape = layer.input.shape
+    positions = int(np.prod(shape[1:-1]))
+    return (np.arange(positions)[:, None] * shape[-1] + channels[None, :]).ravel()
+
+def prune_model(model: tf.keras.Model, sparsity: float) -> tf.keras.Model:
+    """
+    对 Sequential 模型做结构化剪枝, 返回物理上更小的稠密模型
+
+    每个 Conv2D 按输出滤波器权重的 L1 范数去掉 sparsity 比例的通道,
+    随后的 BatchNormalization、下一层卷积的输入通道、Flatten 之后全连接层的输入行随之裁剪;
+    隐藏全连接层同样按单元权重的 L1 范数去掉部分单元, 输出层保持 4 个输出。
+    剪枝前后层的类型与配置(层名、激活函数、精度策略等)不变, 只改变通道/单元数,
+    因此 SkinAnalyzer 仍能按名称找到特征层(FEATURE_LAYER)取图像嵌入
+    """
+    dense_layers = [layer for layer in model.layers if isinstance(layer, layers.Dense)]
+    output_layer = dense_layers[-1] if dense_layers else None
+
+    source = model.inputs[0]
+    pruned = tf.keras.Sequential(name=f'{model.name}_pruned')
+    pruned.add(layers.Input(shape=source.shape[1:], dtype=source.dtype, name='image'))
+    weights = []
+    # 当前张量最后一维中保留的下标, None 表示全部保留
+    keep = None
+    for layer in model.layers:
+        config = layer.get_config()
+        values = layer.get_weights()
+        if isinstance(layer, layers.Conv2D) and not isinstance(layer, layers.SeparableConv2D):
+            kernel = values[0] if keep is None else values[0][:, :, keep, :]
+            keep = _keep_indices(np.abs(kernel).sum(axis=(0, 1, 2)), sparsity)
+            values = [kernel[..., keep]] + [bias[keep] for bias in values[1:]]
+            config['filters'] = len(keep)
+        elif isinstance(layer, layers.BatchNormalization):
+            values = values if keep is None else [value[keep] for value in values]
+        elif isinstance(layer, layers.Flatten):
+            keep = None if keep is None else _flatten_indices(layer, keep)
+        elif isinstance(layer, layers.Dense):
+            kernel = values[0] if keep is None else values[0][keep]
+            if layer is output_layer:
+                keep = None
+                values = [kernel] + values[1:]
+            else:
+                keep = _keep_indices(np.abs(kernel).sum(axis=0), sparsity)
+                values = [kernel[:, keep]] + [bias[keep] for bias in values[1:]]
+                config['units'] = len(keep)
+        elif values:
+            raise ValueError(f"不支持剪枝的层: {layer.name} ({type(layer).__name__})")
+        pruned.add(type(layer).from_config(config))
+        weights.append(values)
+
+    for layer, values in zip(pruned.layers, weights):
+        if values:
+            layer.set_weights(values)
+    return pruned
+
+def cluster_weights(model: tf.keras.Model, bits: int = 4, iterations: int = 10) -> tf.keras.Model:
+    """
+    权重聚类: 每个卷积/全连接核的权重用 2**bits 个共享值(一维 k-means 中心)代替
+
+    不改变模型结构和推理速度, 但权重只剩少量不同取值, 模型文件压缩后显著变小(就地修改并返回模型)
+    """
+    for layer in model.layers:
+        if not isinstance(layer, (layers.Conv2D, layers.Dense)):
+            continue
+        values = layer.get_weights()
+        kernel = values[0].ravel()
+        # 在权重范围内均匀初始化中心(对大权重比随机初始化更稳定), 按排序后中心的中点分配
+        centroids = np.linspace(kernel.min(), kernel.max(), 2 ** bits)
+        for _ in range(iterations):
+            assignment = np.searchsorted((centroids[1:] + centroids[:-1]) / 2, kernel)
+            sums = np.bincount(assignment, weights=kernel, minlength=len(centroids))
+            counts = np.bincount(assignment, minlength=len(centroids))
+            centroids = np.where(counts > 0, sums / np.maximum(counts, 1), centroids)
+        assignment = np.searchsorted((centroids[1:] + centroids[:-1]) / 2, kernel)
+        values[0] = centroids[assignment].astype(values[0].dtype).reshape(values[0].shape)
+        layer.set_weights(values)
+    return model
+
+def fine_tune(model: tf.keras.Model, train_dir: str, val_dir: str, epochs: int = 3, batch_size: int = 32,
+              learning_rate: float = 0.0005, seed: int = 42) -> tf.keras.callbacks.History:
+    """剪枝后用较小的学习率微调, 恢复精度"""
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        loss='mse',
+        metrics=['mae']
+    )
+    return model.fit(
+        RecordSequence(train_dir, batch_size, shuffle=True, seed=seed),
+        validation_data=RecordSequence(val_dir, batch_size),
+        epochs=epochs,
+        shuffle=False,
+        verbose=2
+    )
+
+def _compressed_size(path: str) -> float:
+    """模型文件 gzip 压缩后的大小(MB), 反映权重聚类带来的传输/存储收益"""
+    with open(path, 'rb') as f:
+        return len(gzip.compress(f.read(), compresslevel=6)) / 1024 ** 2
+
+def prune_and_benchmark(model_path: str, train_dir: str, val_dir: str, test_dir: str,
+                        output_dir: str = 'models/pruning', sparsities: Sequence[float] = SPARSITIES,
+                        fine_tune_epochs: int = 3, batch_size: int = 32,
+                        cluster_bits: Optional[int] = None) -> List[Dict]:
+    """
+    按各剪枝比例剪枝、微调(可选再做权重聚类)并导出模型, 返回每个比例一行的对比结果
+
+    第一行为未剪枝的原模型; 各行包含参数量、文件大小(及压缩后大小)、加载耗时、
+    单张推理延迟与测试集精度(见 evaluation.benchmark_model_file)
+    """
+    original = tf.keras.models.load_model(model_path, compile=False)
+    if tf.as_dtype(original.inputs[0].dtype) != tf.uint8:
+        # 微调直接读取分片记录中的 uint8 图像, 旧模型会以 0-255 的输入训练
+        raise ValueError(f"只支持在图内归一化、接收 uint8 输入的模型, {model_path} 的输入类型为 "
+                         f"{original.inputs[0].dtype}, 请先用当前的 SkinAnalysisModel 重新训练")
+    os.makedirs(output_dir, exist_ok=True)
+    rows = [dict(benchmark_model_file(model_path, test_dir, OUTPUT_NAMES, label='original'),
+                 sparsity=0.0, compressed_mb=round(_compressed_size(model_path), 6))]
+
+    for sparsity in sparsities:
+        model = prune_model(original, sparsity)
+        if fine_tune_epochs:
+            fine_tune(model, train_dir, val_dir, fine_tune_epochs, batch_size)
+        if cluster_bits:
+            cluster_weights(model, cluster_bits)
+        name = f'pruned_{int(round(sparsity * 100))}'
+        path = os.path.join(output_dir, f'{name}.h5')
+        model.save(path)
+        row = benchmark_model_file(path, test_dir, OUTPUT_NAMES, label=name)
+        rows.append(dict(row, sparsity=sparsity, compressed_mb=round(_compressed_size(path), 6)))
+        logger.info(f"剪枝比例 {sparsity}: {row['parameters']} 个参数, 已保存到 {path}")
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='对皮肤分析模型做结构化剪枝与权重聚类')
+    parser.add_argument('--model', default='models/skin_analysis_model.h5')
+    parser.add_argument('--train-dir', default='data/records/train')
+    parser.add_argument('--val-dir', default='data/records/val')
+    parser.add_argument('--test-dir', default='data/records/test')
+    parser.add_argument('--output-dir', default='models/pruning')
+    parser.add_argument('--sparsities', type=float, nargs='+', default=list(SPARSITIES))
+    parser.add_argument('--fine-tune-epochs', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--cluster-bits', type=int, default=None, help='微调后把权重聚类为 2**bits 个共享值')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    rows = prune_and_benchmark(args.model, args.train_dir, args.val_dir, args.test_dir, args.output_dir,
+                               args.sparsities, args.fine_tune_epochs, args.batch_size, args.cluster_bits)
+
+    os.makedirs('reports', exist_ok=True)
+    with open(os.path.join('reports', 'pruning_report.json'), 'w', encoding='utf-8') as f:
+        json.dump(rows, f, indent=2)
+    print(format_table(rows, TABLE_COLUMNS))
+
+if __name__ == '__main__':
+    main()
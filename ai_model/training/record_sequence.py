@@ -0,0 +1,62 @@
+import math
+import numpy as np
+import tensorflow as tf
+from record_shards import ShardDataset
+
+class RecordSequence(tf.keras.utils.Sequence):
+    """
+    基于分片记录按批次惰性读取的训练数据源
+
+    分片以 np.memmap 打开, 每个批次只读取本批的记录, 数据集可以远大于内存,
+    驻留由操作系统页缓存管理。不打乱时每个批次是一段连续记录, 整块拷贝。
+    shuffle=True 时每轮对全部样本重新排列, 批次组成逐轮变化; 代价是批内记录
+    不再连续, 按下标逐条读取(批内下标排序后读, 同一分片内仍是单向寻址),
+    数据集远大于页缓存时读盘以随机访问为主。
+    每轮的样本顺序只由 (seed, 轮次) 决定, 中断的训练可经 seek() 从原位置继续。
+    """
+
+    def __init__(self, dataset, batch_size=32, shuffle=False, seed=None, epoch=0, start_step=0, **kwargs):
+        super().__init__(**kwargs)
+        self.dataset = dataset if isinstance(dataset, ShardDataset) else ShardDataset(dataset)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        # 未指定种子时随机取一个, 同一实例内各轮顺序仍可由 (seed, 轮次) 重现
+        self.seed = int(np.random.SeedSequence().entropy % 2 ** 32) if seed is None else seed
+        self.start_step = start_step
+        self._started = False
+        self.set_epoch(epoch)
+
+    def _total_batches(self):
+        return math.ceil(len(self.dataset) / self.batch_size)
+
+    def __len__(self):
+        return self._total_batches() - self.start_step
+
+    def __getitem__(self, index):
+        start = (index + self.start_step) * self.batch_size
+        stop = min(start + self.batch_size, len(self.dataset))
+        if self._order is None:
+            return self.dataset.read_range(start, stop)
+        return self.dataset.get_batch(np.sort(self._order[start:stop]))
+
+    def set_epoch(self, epoch):
+        """切换到指定轮次的样本顺序"""
+        self.epoch = epoch
+        self._order = None
+        if self.shuffle:
+            self._order = np.random.default_rng([self.seed, epoch]).permutation(len(self.dataset))
+
+    def seek(self, epoch, step):
+        """
+        返回第 epoch 轮从第 step 批开始的剩余批次, 只用于训练该轮
+        """
+        return RecordSequence(self.dataset, self.batch_size, self.shuffle, self.seed, epoch=epoch, start_step=step)
+
+    def on_epoch_begin(self):
+        # Keras 在 fit 开始时也会调用 on_epoch_end, 轮次按 on_epoch_begin 计数
+        if self._started:
+            self.set_epoch(self.epoch + 1)
+        self._started = True
+
+    def on_epoch_end(self):
+        pass
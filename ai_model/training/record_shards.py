@@ -0,0 +1,219 @@
+import os
+import csv
+import json
+import numpy as np
+
+INDEX_FILE = 'index.json'
+KEYS_FILE = 'index.csv'
+
+class ShardWriter:
+    """
+    分片二进制训练记录写入器
+
+    每个分片是一对定长记录的二进制文件: uint8 图像 [N, H, W, C] 与 float32 标签 [N, L],
+    顺序追加写入, 内存占用与数据集和分片大小无关。
+    index.json 记录形状与各分片条数, index.csv 记录每条记录的 key/分片/偏移,
+    读取端以 np.memmap 打开, 可顺序读取也可按下标或 key 随机访问,
+    无需逐个打开和解码图片文件。
+    """
+
+    def __init__(self, output_dir, image_shape=(224, 224, 3), label_names=None,
+                 shard_size=4096, metadata=None):
+        self.output_dir = output_dir
+        self.image_shape = tuple(image_shape)
+        self.label_names = list(label_names or [])
+        self.shard_size = shard_size
+        self.metadata = metadata or {}
+
+        self.shards = []
+        self.keys = []
+        self._image_file = None
+        self._label_file = None
+
+        os.makedirs(output_dir, exist_ok=True)
+        self._remove_stale_shards()
+
+    def _remove_stale_shards(self):
+        """删除旧的分片文件, 避免与新索引混淆"""
+        for name in os.listdir(self.output_dir):
+            if name.startswith('shard-') or name in (INDEX_FILE, KEYS_FILE):
+                os.remove(os.path.join(self.output_dir, name))
+
+    def _open_shard(self):
+        """开始写入下一个分片"""
+        self._close_shard()
+        name = f'shard-{len(self.shards):05d}'
+        self.shards.append({
+            'images': f'{name}.images.bin',
+            'labels': f'{name}.labels.bin' if self.label_names else None,
+            'count': 0
+        })
+        self._image_file = open(os.path.join(self.output_dir, self.shards[-1]['images']), 'wb')
+        if self.label_names:
+            self._label_file = open(os.path.join(self.output_dir, self.shards[-1]['labels']), 'wb')
+
+    def _close_shard(self):
+        for f in (self._image_file, self._label_file):
+            if f is not None:
+                f.close()
+        self._image_file = None
+        self._label_file = None
+
+    def add(self, key, image, label=None):
+        """追加一条记录"""
+        if self._image_file is None or self.shards[-1]['count'] >= self.shard_size:
+            self._open_shard()
+
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        if image.shape != self.image_shape:
+            raise ValueError(f"图像尺寸 {image.shape} 与记录格式 {self.image_shape} 不一致")
+        self._image_file.write(image.tobytes())
+        if self.label_names:
+            self._label_file.write(np.asarray(label, dtype=np.float32).reshape(len(self.label_names)).tobytes())
+
+        shard = self.shards[-1]
+        self.keys.append((key, len(self.shards) - 1, shard['count']))
+        shard['count'] += 1
+
+    def close(self):
+        """落盘并写出索引文件"""
+        self._close_shard()
+        index = {
+            'image_shape': list(self.image_shape),
+            'label_names': self.label_names,
+            'total': len(self.keys),
+            'shards': self.shards,
+            'metadata': self.metadata
+        }
+        with open(os.path.join(self.output_dir, INDEX_FILE), 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2)
+        with open(os.path.join(self.output_dir, KEYS_FILE), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['key', 'shard', 'offset'])
+            writer.writerows(self.keys)
+        return index
+
+    def __enter__(self):
+        return self
+
+    def abort(self):
+        """放弃本次写入, 删除已写出的部分分片, 不写索引"""
+        self._close_shard()
+        self._remove_stale_shards()
+
+    def __exit__(self, exc_type, exc, tb):
+        # 写入中途出错时不写索引, 否则截断的分片会被当作完整记录读取
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+class ShardDataset:
+    """
+    分片训练记录读取器
+
+    各分片以 np.memmap 方式打开, 只有实际访问到的数据才会读入内存,
+    驻留由操作系统页缓存管理。
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        with open(os.path.join(data_dir, INDEX_FILE), 'r', encoding='utf-8') as f:
+            self.index = json.load(f)
+
+        self.image_shape = tuple(self.index['image_shape'])
+        self.label_names = self.index['label_names']
+        self.metadata = self.index.get('metadata', {})
+        self._images = []
+        self._labels = []
+        for shard in self.index['shards']:
+            count = shard['count']
+            self._images.append(np.memmap(
+                os.path.join(data_dir, shard['images']), dtype=np.uint8, mode='r',
+                shape=(count, *self.image_shape)
+            ))
+            if shard['labels']:
+                self._labels.append(np.memmap(
+                    os.path.join(data_dir, shard['labels']), dtype=np.float32, mode='r',
+                    shape=(count, len(self.label_names))
+                ))
+
+        # 各分片起始下标, 用于全局下标到 (分片, 偏移) 的映射
+        counts = [shard['count'] for shard in self.index['shards']]
+        self._starts = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self._keys = None
+
+    @staticmethod
+    def exists(data_dir):
+        return os.path.exists(os.path.join(data_dir, INDEX_FILE))
+
+    def __len__(self):
+        return int(self._starts[-1])
+
+    @property
+    def keys(self):
+        """按存储顺序排列的记录 key"""
+        if self._keys is None:
+            with open(os.path.join(self.data_dir, KEYS_FILE), 'r', newline='', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                next(reader)
+                self._keys = [row[0] for row in reader]
+        return self._keys
+
+    def index_of(self, key):
+        """按 key 查找记录的全局下标"""
+        if not hasattr(self, '_key_index'):
+            self._key_index = {key: i for i, key in enumerate(self.keys)}
+        return self._key_index[key]
+
+    def _locate(self, index):
+        shard = int(np.searchsorted(self._starts, index, side='right')) - 1
+        return shard, index - int(self._starts[shard])
+
+    def __getitem__(self, index):
+        """随机访问单条记录, 返回 (图像, 标签)"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        shard, offset = self._locate(index)
+        label = self._labels[shard][offset] if self._labels else None
+        return self._images[shard][offset], label
+
+    def get_batch(self, indices):
+        """按下标读取一批记录"""
+        indices = np.asarray(indices, dtype=np.int64)
+        images = np.empty((len(indices), *self.image_shape), dtype=np.uint8)
+        labels = np.empty((len(indices), len(self.label_names)), dtype=np.float32) if self._labels else None
+        # 按分片成组读取, 每个分片一次花式索引
+        shards = np.searchsorted(self._starts, indices, side='right') - 1
+        for shard in np.unique(shards):
+            rows = np.flatnonzero(shards == shard)
+            offsets = indices[rows] - self._starts[shard]
+            images[rows] = self._images[shard][offsets]
+            if labels is not None:
+                labels[rows] = self._labels[shard][offsets]
+        return images, labels
+
+    def read_range(self, start, stop):
+        """读取连续区间 [start, stop) 的记录, 按分片做整块切片拷贝"""
+        images, labels = [], []
+        shard, offset = self._locate(start)
+        while start < stop:
+            take = min(stop - start, int(self._starts[shard + 1]) - start)
+            images.append(self._images[shard][offset:offset + take])
+            if self._labels:
+                labels.append(self._labels[shard][offset:offset + take])
+            start += take
+            shard, offset = shard + 1, 0
+        return (np.concatenate(images) if images else np.empty((0, *self.image_shape), np.uint8),
+                np.concatenate(labels) if labels else None)
+
+    def iter_batches(self, batch_size=32):
+        """按存储顺序读取批次, 每个批次内是连续的磁盘读取"""
+        for start in range(0, len(self), batch_size):
+            yield self.read_range(start, min(start + batch_size, len(self)))
+
+    def to_arrays(self):
+        """将全部记录读入内存, 返回 (图像, 标签)"""
+        return self.read_range(0, len(self))
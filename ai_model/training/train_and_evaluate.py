@@ -1,35 +1,81 @@
 import os
+import cv2
+import hashlib
+import logging
+import argparse
 import numpy as np
 import pandas as pd
 import tensorflow as tf
 from sklearn.metrics import mean_squared_error, r2_score
 import matplotlib.pyplot as plt
+from typing import Dict
 from model_trainer import SkinAnalysisModel
 from data_collection_script import DataCollectionScript
+from record_shards import ShardDataset, ShardWriter
+from record_sequence import RecordSequence
+from input_pipeline import build_dataset
+from augmentation import DEFAULT_AUGMENTATION
+from hyperparameter_search import SuccessiveHalvingSearch
+from distributed_training import train_distributed
+from evaluation import save_report
+from precision import PRECISIONS, compare_precisions
+
+LABEL_COLUMNS = ['skin_score', 'moisture_level', 'oil_level', 'sensitivity']
+
+logger = logging.getLogger(__name__)
+
+def _source_digest(data: pd.DataFrame) -> str:
+    """
+    数据表样本与标签的摘要, 用于判断分片记录是否需要重建
+    """
+    content = data[['image_path'] + LABEL_COLUMNS].to_csv(index=False)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
 
 class ModelTrainer:
-    def __init__(self):
-        self.model = SkinAnalysisModel()
+    def __init__(self, precision: str = 'float32'):
+        self.model = SkinAnalysisModel(precision=precision)
         self.data_script = DataCollectionScript()
         self.history = None
     
-    def train_model(self, epochs: int = 50, batch_size: int = 32):
+    def train_model(self, epochs: int = 50, batch_size: int = 32, feed: str = 'tfdata',
+                    cache: bool = True, augment: bool = True, seed: int = 42,
+                    checkpoint_dir: str = 'data/checkpoints', resume: bool = False, save_every: int = 500,
+                    overwrite: bool = False):
         """
         训练模型
+        
+        feed='tfdata' 时由标注表构建 tf.data 管道并行解码(cache 控制是否缓存解码结果到磁盘),
+        augment 为 True 时训练集按批次做随机增强(由 seed 复现);
+        feed='records' 时从预先构建的分片记录按批次读取
+        
+        训练中每 save_every 批及每轮结束保存检查点到 checkpoint_dir, resume=True 时从最新检查点继续,
+        已有检查点时须指定 resume 或 overwrite(删除后重新训练);
+        feed='records' 可精确恢复到中断的批次, feed='tfdata' 从中断的那一轮开头继续
         """
         # 准备训练数据
         train_data, val_data = self.data_script.prepare_training_dataset()
         
-        # 加载和预处理数据
-        X_train, y_train = self._prepare_data(train_data)
-        X_val, y_val = self._prepare_data(val_data)
+        if feed == 'tfdata':
+            train_feed = self._build_pipeline(train_data, 'train', batch_size, shuffle=True, cache=cache,
+                                              augment=DEFAULT_AUGMENTATION if augment else None, seed=seed)
+            val_feed = self._build_pipeline(val_data, 'val', batch_size, cache=cache)
+        elif feed == 'records':
+            # 准备分片记录, 训练时按批次从 memmap 惰性读取
+            train_feed = RecordSequence(self._prepare_records(train_data, 'train'), batch_size, shuffle=True, seed=seed)
+            val_feed = RecordSequence(self._prepare_records(val_data, 'val'), batch_size)
+        else:
+            raise ValueError(f"不支持的数据输入方式: {feed}")
         
         # 训练模型
         self.history = self.model.train(
-            train_data=(X_train, y_train),
-            val_data=(X_val, y_val),
+            train_data=train_feed,
+            val_data=val_feed,
             epochs=epochs,
-            batch_size=batch_size
+            batch_size=batch_size,
+            checkpoint_dir=checkpoint_dir,
+            resume=resume,
+            save_every=save_every,
+            overwrite=overwrite
         )
         
         # 保存模型
@@ -38,43 +84,114 @@ class ModelTrainer:
         # 生成训练报告
         self._generate_training_report()
     
-    def evaluate_model(self, test_data: pd.DataFrame):
+    def train_model_distributed(self, workers: int = 2, epochs: int = 50, batch_size: int = 32,
+                                seed: int = 42) -> Dict:
+        """
+        多进程数据并行训练(见 distributed_training)
+        
+        各工作进程读取分片记录中互不重叠的部分, batch_size 为每个进程的批大小,
+        全局批大小与学习率按进程数线性放大; 计算精度与本训练器的模型相同。
+        不支持检查点与断点续训
+        """
+        train_data, val_data = self.data_script.prepare_training_dataset()
+        train_records = self._prepare_records(train_data, 'train')
+        val_records = self._prepare_records(val_data, 'val')
+        
+        model_path = 'models/skin_analysis_model.h5'
+        result = train_distributed(
+            train_records.data_dir,
+            val_records.data_dir,
+            workers=workers,
+            epochs=epochs,
+            batch_size=batch_size,
+            learning_rate=self.model.learning_rate,
+            dropout_rate=self.model.dropout_rate,
+            model_path=model_path,
+            seed=seed,
+            precision=self.model.precision
+        )
+        self.model.load_model(model_path)
+        
+        # 生成训练报告
+        self.history = tf.keras.callbacks.History()
+        self.history.history = result['history']
+        self._generate_training_report()
+        
+        return result
+    
+    def evaluate_model(self, test_data: pd.DataFrame, batch_size: int = 32):
         """
         评估模型性能
+        
+        测试集按批次从分片记录读取并流式累积指标, 不整体读入内存
         """
         # 准备测试数据
-        X_test, y_test = self._prepare_data(test_data)
+        test_feed = RecordSequence(self._prepare_records(test_data, 'test'), batch_size)
         
         # 评估模型
-        metrics = self.model.evaluate((X_test, y_test))
+        report = self.model.evaluate(test_feed)
         
         # 生成评估报告
-        self._generate_evaluation_report(metrics)
+        self._generate_evaluation_report(report)
         
-        return metrics
+        return report['metrics']
     
-    def _prepare_data(self, data: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    def _build_pipeline(self, data: pd.DataFrame, split_name: str, batch_size: int,
+                        shuffle: bool = False, cache: bool = True,
+                        augment: Dict = None, seed: int = None) -> tf.data.Dataset:
         """
-        准备训练数据
-        """
-        # 加载图像
-        X = []
-        for image_path in data['image_path']:
-            image = cv2.imread(os.path.join('data/images', image_path))
-            X.append(image)
+        由标注表构建 tf.data 输入管道
         
-        X = np.array(X)
+        磁盘缓存文件名包含数据摘要, 标注变化后自动使用新的缓存
+        """
+        cache_path = None
+        if cache:
+            cache_path = os.path.join('data/cache', f'{split_name}-{_source_digest(data)[:12]}')
+        return build_dataset(data, LABEL_COLUMNS, 'data/images', batch_size,
+                             shuffle=shuffle, cache=cache_path, augment=augment, seed=seed)
+    
+    def _prepare_records(self, data: pd.DataFrame, split_name: str) -> ShardDataset:
+        """
+        准备分片记录(N×224×224×3 uint8, memmap 打开)
         
-        # 准备标签
-        y = data[['skin_score', 'moisture_level', 'oil_level', 'sensitivity']].values
+        记录不存在或与当前数据不一致时先构建
+        """
+        record_dir = os.path.join('data/records', split_name)
+        if not self._records_match(record_dir, data):
+            self._build_records(data, record_dir)
         
-        return X, y
+        return ShardDataset(record_dir)
+    
+    def _records_match(self, record_dir: str, data: pd.DataFrame) -> bool:
+        """
+        检查分片记录是否与数据表中的样本一致
+        """
+        if not ShardDataset.exists(record_dir):
+            return False
+        return ShardDataset(record_dir).metadata.get('source') == _source_digest(data)
+    
+    def _build_records(self, data: pd.DataFrame, record_dir: str):
+        """
+        将数据表中的图像与标签写入分片记录, 每张图片只解码一次
+        """
+        labels = data[LABEL_COLUMNS].to_numpy(dtype=np.float32)
+        metadata = {'source': _source_digest(data)}
+        with ShardWriter(record_dir, label_names=LABEL_COLUMNS, metadata=metadata) as writer:
+            for image_path, label in zip(data['image_path'], labels):
+                image = cv2.imread(os.path.join('data/images', image_path))
+                if image is None:
+                    logger.warning(f"无法读取图像, 已跳过: {image_path}")
+                    continue
+                # 模型接收 uint8 RGB 输入, 统一缩放到 224x224 以便存储和组批
+                image = cv2.resize(image, (224, 224))
+                writer.add(str(image_path), cv2.cvtColor(image, cv2.COLOR_BGR2RGB), label)
     
     def _generate_training_report(self):
         """
         生成训练报告
         """
         report = {
+            'precision': self.model.precision,
             'training_history': self.history.history,
             'final_metrics': {
                 'loss': self.history.history['loss'][-1],
@@ -90,20 +207,19 @@ class ModelTrainer:
         # 绘制训练曲线
         self._plot_training_curves()
     
-    def _generate_evaluation_report(self, metrics: Dict):
+    def _generate_evaluation_report(self, report: Dict):
         """
         生成评估报告
-        """
-        report = {
-            'metrics': metrics,
-            'timestamp': pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
         
+        报告键排序、数值定长舍入, 不同模型版本的报告可直接 diff 或用 evaluation.compare_reports 比较
+        """
         # 保存报告
-        self._save_report(report, 'evaluation_report.json')
+        os.makedirs('reports', exist_ok=True)
+        save_report(report, os.path.join('reports', 'evaluation_report.json'),
+                    {'model_path': 'models/skin_analysis_model.h5'})
         
         # 绘制评估图表
-        self._plot_evaluation_charts(metrics)
+        self._plot_evaluation_charts(report['metrics'])
     
     def _save_report(self, report: Dict, filename: str):
         """
@@ -145,64 +261,117 @@ class ModelTrainer:
     def _plot_evaluation_charts(self, metrics: Dict):
         """
         绘制评估图表
-        """
-        plt.figure(figsize=(10, 6))
         
-        # 绘制各项指标的对比图
-        labels = list(metrics.keys())
-        values = list(metrics.values())
+        metrics 为 {输出: {指标: 值}}, 每个指标一张子图, 按输出分组
+        """
+        outputs = list(metrics.keys())
+        metric_names = list(next(iter(metrics.values())).keys())
+        plt.figure(figsize=(4 * len(metric_names), 5))
         
-        plt.bar(labels, values)
-        plt.title('Model Performance Metrics')
-        plt.xlabel('Metrics')
-        plt.ylabel('Values')
-        plt.xticks(rotation=45)
+        # 绘制各输出在每项指标上的对比图
+        for i, metric_name in enumerate(metric_names):
+            plt.subplot(1, len(metric_names), i + 1)
+            plt.bar(outputs, [metrics[output][metric_name] for output in outputs])
+            plt.title(metric_name.upper())
+            plt.xlabel('Outputs')
+            plt.ylabel('Values')
+            plt.xticks(rotation=45)
         
         plt.tight_layout()
         plt.savefig('reports/evaluation_charts.png')
         plt.close()
     
-    def optimize_hyperparameters(self):
+    def optimize_hyperparameters(self, max_epochs: int = 27, eta: int = 3, workers: int = None) -> Dict:
         """
         优化超参数
-        """
-        from sklearn.model_selection import GridSearchCV
-        from tensorflow.keras.wrappers.scikit_learn import KerasRegressor
-        
-        def create_model(learning_rate=0.001, dropout_rate=0.5):
-            model = SkinAnalysisModel()
-            model.model.optimizer.learning_rate = learning_rate
-            return model.model
-        
-        # 定义参数网格
-        param_grid = {
-            'learning_rate': [0.001, 0.0005, 0.0001],
-            'dropout_rate': [0.3, 0.5, 0.7],
-            'batch_size': [16, 32, 64],
-            'epochs': [30, 50, 100]
-        }
-        
-        # 创建KerasRegressor
-        model = KerasRegressor(build_fn=create_model)
-        
-        # 网格搜索
-        grid_search = GridSearchCV(
-            estimator=model,
-            param_grid=param_grid,
-            cv=3,
-            n_jobs=-1,
-            verbose=1
-        )
         
+        使用逐级减半搜索(见 hyperparameter_search), 试验在多个进程中并行,
+        各进程共享同一份分片记录; 中断后重新调用会从试验日志继续
+        """
         # 准备数据
-        train_data, _ = self.data_script.prepare_training_dataset()
-        X_train, y_train = self._prepare_data(train_data)
+        train_data, val_data = self.data_script.prepare_training_dataset()
+        train_records = self._prepare_records(train_data, 'train')
+        val_records = self._prepare_records(val_data, 'val')
         
-        # 执行网格搜索
-        grid_result = grid_search.fit(X_train, y_train)
+        # 执行搜索
+        search = SuccessiveHalvingSearch(
+            train_records.data_dir,
+            val_records.data_dir,
+            output_dir=os.path.join('reports', 'hyperparameter_search'),
+            max_epochs=max_epochs,
+            eta=eta,
+            workers=workers
+        )
+        summary = search.run()
         
         # 保存最佳参数
-        best_params = grid_result.best_params_
+        best_params = summary['best_params']
         self._save_report(best_params, 'best_hyperparameters.json')
         
-        return best_params
\ No newline at end of file
+        return best_params
+    
+    def compare_precision(self, epochs: int = 3, batch_size: int = 32) -> Dict:
+        """
+        比较 float32 与 bfloat16 混合精度训练的吞吐与验证集指标(见 precision)
+        """
+        train_data, val_data = self.data_script.prepare_training_dataset()
+        train_records = self._prepare_records(train_data, 'train')
+        val_records = self._prepare_records(val_data, 'val')
+        
+        results = compare_precisions(train_records.data_dir, val_records.data_dir,
+                                     epochs=epochs, batch_size=batch_size)
+        self._save_report(results, 'precision_comparison.json')
+        
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description='训练皮肤分析模型')
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--feed', choices=['tfdata', 'records'], help='默认 tfdata; 多进程训练始终读取分片记录')
+    parser.add_argument('--no-cache', action='store_true', help='不缓存解码结果(仅 tfdata)')
+    parser.add_argument('--no-augment', action='store_true', help='不做数据增强(仅 tfdata)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--checkpoint-dir', help='默认 data/checkpoints')
+    parser.add_argument('--save-every', type=int, help='每多少个批次保存一次检查点, 默认 500')
+    parser.add_argument('--resume', action='store_true', help='从最新检查点继续训练')
+    parser.add_argument('--overwrite', action='store_true', help='删除已有检查点重新训练')
+    parser.add_argument('--workers', type=int, default=1, help='大于 1 时在本机多进程数据并行训练')
+    parser.add_argument('--precision', choices=PRECISIONS, default='float32',
+                        help='计算精度, mixed_bfloat16 适用于支持 AVX512-BF16 / AMX 的 CPU')
+    parser.add_argument('--compare-precision', action='store_true',
+                        help='只比较 float32 与 mixed_bfloat16 的训练吞吐和指标, 不训练正式模型')
+    args = parser.parse_args()
+    if args.workers > 1:
+        # 多进程训练只读取分片记录且不支持检查点, 这些选项不能静默忽略
+        unsupported = [option for option, given in (
+            ('--feed tfdata', args.feed == 'tfdata'), ('--no-cache', args.no_cache), ('--no-augment', args.no_augment),
+            ('--checkpoint-dir', args.checkpoint_dir is not None), ('--save-every', args.save_every is not None),
+            ('--resume', args.resume), ('--overwrite', args.overwrite)
+        ) if given]
+        if unsupported:
+            parser.error(f"--workers > 1 时不支持 {', '.join(unsupported)}")
+
+    logging.basicConfig(level=logging.INFO)
+    trainer = ModelTrainer(precision=args.precision)
+    if args.compare_precision:
+        trainer.compare_precision(args.epochs, args.batch_size)
+        return
+    if args.workers > 1:
+        trainer.train_model_distributed(args.workers, args.epochs, args.batch_size, seed=args.seed)
+        return
+    trainer.train_model(
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        feed=args.feed or 'tfdata',
+        cache=not args.no_cache,
+        augment=not args.no_augment,
+        seed=args.seed,
+        checkpoint_dir=args.checkpoint_dir or 'data/checkpoints',
+        resume=args.resume,
+        save_every=args.save_every or 500,
+        overwrite=args.overwrite
+    )
+
+if __name__ == '__main__':
+    main()
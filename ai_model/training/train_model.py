@@ -4,6 +4,7 @@ import numpy as np
 import os
 from pathlib import Path
 import logging
+from model_trainer import preprocessing_layers
 
 # 设置日志
 logging.basicConfig(
@@ -15,7 +16,8 @@ logger = logging.getLogger(__name__)
 def create_model():
     """创建CNN模型"""
     model = models.Sequential([
-        layers.Conv2D(32, (3, 3), activation='relu', input_shape=(224, 224, 3)),
+        *preprocessing_layers((224, 224, 3)),
+        layers.Conv2D(32, (3, 3), activation='relu'),
         layers.MaxPooling2D((2, 2)),
         layers.Conv2D(64, (3, 3), activation='relu'),
         layers.MaxPooling2D((2, 2)),
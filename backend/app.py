@@ -4,9 +4,14 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
+import click
+import numpy as np
 from datetime import datetime
 from dotenv import load_dotenv
 from ai_model.inference.model_inference import SkinAnalyzer
+from ai_model.inference.embedding_index import EmbeddingIndex, embed_files, embed_directory
+from services.image_processing import ImageProcessor
+from services.upload_dedup import UploadDeduplicator
 import logging
 
 # 加载环境变量
@@ -32,11 +37,27 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key-here')
 app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'uploads')
 app.config['MODEL_PATH'] = os.getenv('MODEL_PATH', 'ai_model/inference/models/skin_analysis_model.h5')
+# 近似重复上传判定: 感知哈希汉明距离阈值(64 位中不同的位数)与时间窗口(秒)
+app.config['DEDUP_HASH_THRESHOLD'] = int(os.getenv('DEDUP_HASH_THRESHOLD', 6))
+app.config['DEDUP_WINDOW_SECONDS'] = float(os.getenv('DEDUP_WINDOW_SECONDS', 300))
+# 相似病例索引目录, 编号为分析记录 id(由 flask --app app build-embedding-index 用已有分析记录构建)
+app.config['EMBEDDING_INDEX_DIR'] = os.getenv('EMBEDDING_INDEX_DIR', 'data/embedding_index')
+# 相似病例检索扫描的倒排列表数: 越大召回率越高、查询越慢
+app.config['EMBEDDING_NPROBE'] = int(os.getenv('EMBEDDING_NPROBE', 4))
 
 # 初始化扩展
 db = SQLAlchemy(app)
 jwt = JWTManager(app)
 
+# 图像处理器(用于皮肤区域检测)
+image_processor = ImageProcessor()
+
+# 同一用户短时间内的近似重复上传直接复用之前的分析结果
+upload_dedup = UploadDeduplicator(
+    threshold=app.config['DEDUP_HASH_THRESHOLD'],
+    window_seconds=app.config['DEDUP_WINDOW_SECONDS']
+)
+
 # 初始化AI模型
 try:
     skin_analyzer = SkinAnalyzer(app.config['MODEL_PATH'])
@@ -45,6 +66,17 @@ except Exception as e:
     logger.error(f"AI模型加载失败: {str(e)}")
     skin_analyzer = None
 
+# 相似病例检索索引: 索引不存在时只是不提供检索, 不影响分析
+embedding_index = None
+if skin_analyzer and EmbeddingIndex.exists(app.config['EMBEDDING_INDEX_DIR']):
+    embedding_index = EmbeddingIndex(app.config['EMBEDDING_INDEX_DIR'])
+    if embedding_index.kind != 'analyses':
+        # 训练图片的索引编号是图片序号, 当作分析记录 id 会返回无关用户的记录
+        logger.error(f"嵌入索引 {app.config['EMBEDDING_INDEX_DIR']} 的编号不是分析记录 id, 不提供相似病例检索")
+        embedding_index = None
+    else:
+        logger.info(f"嵌入索引加载成功: {len(embedding_index)} 个向量")
+
 # 数据模型
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -162,7 +194,8 @@ def update_profile():
 def health_check():
     return jsonify({
         'status': 'healthy',
-        'model_loaded': skin_analyzer is not None
+        'model_loaded': skin_analyzer is not None,
+        'upload_dedup': upload_dedup.stats()
     })
 
 # 路由：皮肤分析
@@ -182,9 +215,22 @@ def analyze_skin():
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(file_path)
         
-        # 使用AI模型进行分析
+        # 近似重复的连拍照片复用之前(同一分析模式)的结果, 不再推理也不新增记录
+        user_id = get_jwt_identity()
+        regions = request.form.get('regions') == 'true'
+        image_hash, duplicate = upload_dedup.lookup((user_id, regions), file_path)
+        if duplicate is not None:
+            os.remove(file_path)
+            result = dict(duplicate['result'], duplicate_of=duplicate['analysis_id'])
+            return jsonify(result)
+        
+        # 使用AI模型进行分析, 推理前先裁剪到皮肤区域; regions=true 时按面部分区分析
         if skin_analyzer:
-            result = skin_analyzer.analyze_image_file(file_path)
+            result = skin_analyzer.analyze_image_file(
+                file_path, roi_detector=image_processor.detect_skin_roi, regions=regions,
+                # 索引中是整幅皮肤区域的嵌入, 分区模式的结果不加入索引
+                with_embedding=embedding_index is not None and not regions
+            )
         else:
             # 如果模型未加载，使用模拟数据
             result = {
@@ -195,15 +241,30 @@ def analyze_skin():
                 'recommendations': '建议使用补水保湿产品，避免刺激性护肤品。'
             }
         
-        # 保存分析结果
+        # 保存分析结果(裁剪框与分区结果只随响应返回, 不入库)
+        roi = result.pop('roi', None)
+        zones = result.pop('zones', None)
+        embedding = result.pop('embedding', None)
         analysis = SkinAnalysis(
-            user_id=get_jwt_identity(),
+            user_id=user_id,
             image_path=file_path,
             **result
         )
         db.session.add(analysis)
         db.session.commit()
         
+        # 嵌入以分析记录 id 加入相似病例索引; 分析已入库, 写索引失败只记录警告, 不影响本次响应与去重记录
+        if embedding is not None:
+            try:
+                embedding_index.add(embedding[None], [analysis.id])
+            except Exception as e:
+                logger.warning(f"分析记录 {analysis.id} 加入相似病例索引失败: {str(e)}")
+        
+        if roi is not None:
+            result['roi'] = roi
+        if zones is not None:
+            result['zones'] = zones
+        upload_dedup.record((user_id, regions), image_hash, result, analysis_id=analysis.id)
         return jsonify(result)
     except Exception as e:
         logger.error(f"皮肤分析失败: {str(e)}")
@@ -228,6 +289,77 @@ def get_history():
     
     return jsonify(history)
 
+# 路由：相似的历史分析结果
+@app.route('/api/history/<int:analysis_id>/similar', methods=['GET'])
+@jwt_required()
+def get_similar(analysis_id):
+    """
+    按图像嵌入检索与该次分析最相似的已有分析, 只返回评分, 不含其他用户的图片与身份
+    """
+    user_id = get_jwt_identity()
+    analysis = SkinAnalysis.query.filter_by(id=analysis_id, user_id=user_id).first()
+    if analysis is None:
+        return jsonify({'error': 'Analysis not found'}), 404
+    if embedding_index is None:
+        return jsonify({'error': 'Similarity search not available'}), 503
+    
+    k = max(1, min(request.args.get('k', 5, type=int), 50))
+    # 由索引中存储的编码重建嵌入, 不读图推理也不写索引
+    embedding = embedding_index.reconstruct(analysis_id)
+    if embedding is None:
+        # 索引建立之前的记录、分区模式的分析或写索引失败的记录, 在 build-embedding-index 重建索引时补入
+        return jsonify({'error': 'Analysis not indexed'}), 409
+    ids, distances = embedding_index.search(embedding, k=k + 1, nprobe=app.config['EMBEDDING_NPROBE'])
+    matches = [(int(i), float(d)) for i, d in zip(ids, distances) if i != analysis_id][:k]
+    rows = {row.id: row for row in SkinAnalysis.query.filter(SkinAnalysis.id.in_([i for i, _ in matches])).all()}
+    
+    return jsonify([{
+        'score': rows[i].score,
+        'moisture': rows[i].moisture,
+        'oil': rows[i].oil,
+        'sensitivity': rows[i].sensitivity,
+        'created_at': rows[i].created_at.isoformat(),
+        'distance': distance
+    } for i, distance in matches if i in rows])
+
+# 命令: 用已有分析记录重建相似病例索引
+@app.cli.command('build-embedding-index')
+@click.option('--train-images', default=None, help='额外用于训练量化器的图片目录(只参与训练, 不加入索引)')
+@click.option('--nlist', default=1024, help='倒排列表数')
+@click.option('--m', default=16, help='乘积量化的子向量数')
+@click.option('--max-train-samples', default=65536, help='训练量化器最多使用的分析记录数')
+def build_embedding_index(train_images, nlist, m, max_train_samples):
+    """
+    按分析记录的图片计算嵌入, 以 SkinAnalysis.id 为编号重建索引; 运行中的服务需重启后加载
+    """
+    if skin_analyzer is None:
+        raise click.ClickException('AI模型未加载')
+    analyses = SkinAnalysis.query.with_entities(SkinAnalysis.id, SkinAnalysis.image_path) \
+        .order_by(SkinAnalysis.id).all()
+    samples = [embed_directory(skin_analyzer, train_images)[1]] if train_images else []
+    index, pending_ids, pending = None, [], []
+    for positions, embeddings in embed_files(skin_analyzer, [row.image_path for row in analyses],
+                                             roi_detector=image_processor.detect_skin_roi):
+        pending_ids += [analyses[position].id for position in positions]
+        pending.append(embeddings)
+        if index is None and len(pending_ids) < max_train_samples:
+            continue
+        if index is None:
+            # 先用已积累的嵌入训练量化器, 之后的记录逐批加入
+            index = EmbeddingIndex.create(app.config['EMBEDDING_INDEX_DIR'], np.concatenate(samples + pending),
+                                          nlist=nlist, m=m, kind='analyses')
+        index.add(np.concatenate(pending), pending_ids)
+        pending_ids, pending = [], []
+    if index is None:
+        if not samples and not pending:
+            raise click.ClickException('没有可用于训练量化器的图片')
+        index = EmbeddingIndex.create(app.config['EMBEDDING_INDEX_DIR'], np.concatenate(samples + pending),
+                                      nlist=nlist, m=m, kind='analyses')
+    if pending_ids:
+        index.add(np.concatenate(pending), pending_ids)
+    index.compact()
+    click.echo(f"已为 {len(index)} 条分析记录建立索引: {app.config['EMBEDDING_INDEX_DIR']}")
+
 if __name__ == '__main__':
     try:
         # 创建必要的目录
@@ -2,10 +2,16 @@ import cv2
 import numpy as np
 from PIL import Image
 import io
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
+from .image_pyramid import METRIC_LEVELS, ImagePyramid, image_at_level
+
+# analyze_skin_color 返回的特征名, 与批量版本的列顺序一致
+COLOR_FEATURES = ('brightness', 'red_green', 'blue_yellow', 'color_variance')
 
 class ImageProcessor:
-    def __init__(self):
+    def __init__(self, metric_levels: Optional[Dict[str, int]] = None):
+        # 各指标计算所用的金字塔层级
+        self.metric_levels = dict(METRIC_LEVELS, **(metric_levels or {}))
         self.spectrum_filters = {
             'visible': None,  # 可见光
             'uv': np.array([0, 0, 1]),  # 紫外光
@@ -16,16 +22,29 @@ class ImageProcessor:
         """
         处理上传的图像文件
         """
+        processed_image, _ = self.process_image_with_roi(image_file)
+        return processed_image
+    
+    def process_image_with_roi(self, image_file) -> Tuple[np.ndarray, Tuple[int, int, int, int]]:
+        """
+        处理上传的图像文件, 先裁剪到皮肤区域再做降噪等耗时处理
+        
+        返回预处理后的图像和原图中的裁剪框 (x, y, width, height)
+        """
         # 读取图像
         image = Image.open(image_file)
         
         # 转换为OpenCV格式
         cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
         
+        # 裁剪到皮肤区域
+        roi = self.detect_skin_roi(cv_image)
+        cv_image = self.crop_to_roi(cv_image, roi)
+        
         # 图像预处理
         processed_image = self._preprocess_image(cv_image)
         
-        return processed_image
+        return processed_image, roi
     
     def _preprocess_image(self, image: np.ndarray) -> np.ndarray:
         """
@@ -64,9 +83,9 @@ class ImageProcessor:
         
         return spectra
     
-    def extract_skin_features(self, image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    def _skin_mask(self, image: np.ndarray, kernel_size: int = 5) -> np.ndarray:
         """
-        提取皮肤特征
+        基于HSV肤色范围生成皮肤掩码
         """
         # 转换为HSV颜色空间
         hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
@@ -79,67 +98,224 @@ class ImageProcessor:
         skin_mask = cv2.inRange(hsv, lower_skin, upper_skin)
         
         # 形态学操作改善掩码
-        kernel = np.ones((5,5), np.uint8)
+        kernel = np.ones((kernel_size, kernel_size), np.uint8)
         skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_OPEN, kernel)
         skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_CLOSE, kernel)
         
+        return skin_mask
+    
+    def extract_skin_features(self, image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        提取皮肤特征
+        """
+        skin_mask = self._skin_mask(image)
+        
         # 应用掩码
         skin = cv2.bitwise_and(image, image, mask=skin_mask)
         
         return skin, skin_mask
     
-    def analyze_skin_texture(self, image: np.ndarray) -> float:
+    def detect_skin_roi(self, image: np.ndarray, thumbnail_size: int = 128,
+                        margin: float = 0.1, min_area_ratio: float = 0.02) -> Tuple[int, int, int, int]:
         """
-        分析皮肤纹理
+        在缩略图上检测皮肤区域, 返回原图坐标系下的裁剪框 (x, y, width, height)
+        
+        取缩略图肤色掩码中最大的连通区域并向外扩展 margin,
+        找不到足够大的皮肤区域时返回整幅图像。
         """
-        # 转换为灰度图
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        height, width = image.shape[:2]
+        full_frame = (0, 0, width, height)
+        
+        # 生成缩略图, 检测只在少量像素上进行
+        scale = thumbnail_size / max(height, width)
+        if scale < 1:
+            thumbnail = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                                   interpolation=cv2.INTER_AREA)
+        else:
+            scale = 1.0
+            thumbnail = image
         
-        # 计算局部方差作为纹理特征
-        texture = cv2.Laplacian(gray, cv2.CV_64F).var()
+        skin_mask = self._skin_mask(thumbnail, kernel_size=3)
+        contours, _ = cv2.findContours(skin_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return full_frame
         
-        return texture
+        largest = max(contours, key=cv2.contourArea)
+        if cv2.contourArea(largest) < min_area_ratio * skin_mask.size:
+            return full_frame
+        
+        # 映射回原图坐标并扩展边距
+        x, y, w, h = cv2.boundingRect(largest)
+        pad_x, pad_y = w * margin, h * margin
+        x0 = max(0, int((x - pad_x) / scale))
+        y0 = max(0, int((y - pad_y) / scale))
+        x1 = min(width, int(np.ceil((x + w + pad_x) / scale)))
+        y1 = min(height, int(np.ceil((y + h + pad_y) / scale)))
+        
+        return x0, y0, x1 - x0, y1 - y0
     
-    def detect_skin_imperfections(self, image: np.ndarray) -> Dict[str, float]:
+    def crop_to_roi(self, image: np.ndarray, roi: Tuple[int, int, int, int]) -> np.ndarray:
         """
-        检测皮肤瑕疵
+        按裁剪框截取图像(返回视图, 不复制像素)
         """
-        # 转换为灰度图
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # 使用自适应阈值检测瑕疵
-        thresh = cv2.adaptiveThreshold(
-            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-            cv2.THRESH_BINARY_INV, 11, 2
-        )
+        x, y, w, h = roi
+        return image[y:y + h, x:x + w]
+    
+    def analyze_skin_texture(self, image, level: Optional[int] = None) -> float:
+        """
+        分析皮肤纹理
         
-        # 计算瑕疵面积比例
-        total_pixels = thresh.shape[0] * thresh.shape[1]
-        imperfection_pixels = np.sum(thresh > 0)
-        imperfection_ratio = imperfection_pixels / total_pixels
+        image 可以是数组或共用的 ImagePyramid, 在声明的金字塔层级上计算
+        """
+        image = image_at_level(image, 'texture', level, self.metric_levels)
+        return self._texture_features(image[np.newaxis])[0]
+    
+    def detect_skin_imperfections(self, image, level: Optional[int] = None) -> Dict[str, float]:
+        """
+        检测皮肤瑕疵
+        """
+        image = image_at_level(image, 'imperfections', level, self.metric_levels)
+        ratios = self._imperfection_features(image[np.newaxis])
         
         return {
-            'imperfection_ratio': imperfection_ratio,
-            'severity': imperfection_ratio * 100  # 转换为百分比
+            'imperfection_ratio': ratios[0],
+            'severity': ratios[0] * 100  # 转换为百分比
         }
     
-    def analyze_skin_color(self, image: np.ndarray) -> Dict[str, float]:
+    def analyze_skin_color(self, image, level: Optional[int] = None) -> Dict[str, float]:
         """
         分析皮肤颜色
         """
-        # 转换为LAB颜色空间
-        lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+        image = image_at_level(image, 'color', level, self.metric_levels)
+        features = self._color_features(image[np.newaxis])
         
-        # 计算颜色统计信息
-        l, a, b = cv2.split(lab)
+        return {name: values[0] for name, values in zip(COLOR_FEATURES, features.T)}
+    
+    def analyze_skin_texture_batch(self, images: np.ndarray, level: Optional[int] = None,
+                                   chunk_size: int = 16) -> np.ndarray:
+        """
+        批量分析皮肤纹理, images 为 N×H×W×3 的 uint8 数组, 返回长度为 N 的数组
+        """
+        images = self._stack_at_level(images, 'texture', level)
+        return self._map_chunks(self._texture_features, images, chunk_size)
+    
+    def detect_skin_imperfections_batch(self, images: np.ndarray, level: Optional[int] = None,
+                                        chunk_size: int = 16) -> Dict[str, np.ndarray]:
+        """
+        批量检测皮肤瑕疵, 返回与单张版本同名的特征数组
+        """
+        images = self._stack_at_level(images, 'imperfections', level)
+        ratios = self._map_chunks(self._imperfection_features, images, chunk_size)
         
         return {
-            'brightness': np.mean(l),
-            'red_green': np.mean(a),
-            'blue_yellow': np.mean(b),
-            'color_variance': np.std(l)
+            'imperfection_ratio': ratios,
+            'severity': ratios * 100
         }
     
+    def analyze_skin_color_batch(self, images: np.ndarray, level: Optional[int] = None,
+                                 chunk_size: int = 16) -> Dict[str, np.ndarray]:
+        """
+        批量分析皮肤颜色, 返回与单张版本同名的特征数组
+        """
+        images = self._stack_at_level(images, 'color', level)
+        features = self._map_chunks(self._color_features, images, chunk_size)
+        
+        return dict(zip(COLOR_FEATURES, features.T))
+    
+    def _stack_at_level(self, images: np.ndarray, metric: str, level: Optional[int]) -> np.ndarray:
+        """
+        将整批图像取到指标声明的金字塔层级
+        """
+        if level is None:
+            level = self.metric_levels.get(metric, 0)
+        if level == 0:
+            return images
+        # 下采样按张进行, 保证与单张版本的金字塔完全一致
+        return np.stack([ImagePyramid(image).level(level) for image in images])
+    
+    @staticmethod
+    def _map_chunks(func, images: np.ndarray, chunk_size: int) -> np.ndarray:
+        """
+        分块计算, 限制中间数组的内存占用
+        """
+        return np.concatenate([
+            func(images[start:start + chunk_size])
+            for start in range(0, len(images), chunk_size)
+        ])
+    
+    @staticmethod
+    def _convert_stack(images: np.ndarray, code: int) -> np.ndarray:
+        """
+        对 N×H×W×C 数组做逐像素颜色转换: 纵向拼接为一张图, 一次调用完成
+        """
+        n, h, w = images.shape[:3]
+        converted = cv2.cvtColor(images.reshape(n * h, w, -1), code)
+        return converted.reshape(n, h, w, *converted.shape[2:])
+    
+    @staticmethod
+    def _filter_stack(stack: np.ndarray, pad: int, pad_mode: str, func) -> np.ndarray:
+        """
+        对 N×H×W 数组逐张做邻域滤波
+        
+        每张图按 OpenCV 的边界规则在上下补 pad 行后纵向拼接, 一次调用完成滤波,
+        结果与逐张调用完全一致, 左右边界仍由 OpenCV 自身处理。
+        """
+        n, h, w = stack.shape
+        padded = np.pad(stack, ((0, 0), (pad, pad), (0, 0)), mode=pad_mode)
+        filtered = func(padded.reshape(n * (h + 2 * pad), w))
+        return filtered.reshape(n, h + 2 * pad, w)[:, pad:pad + h]
+    
+    @staticmethod
+    def _moments(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        按张计算整数数组的均值和方差
+        
+        先做精确的整数求和, 结果与求和顺序及批大小无关
+        """
+        count = values.shape[1] * values.shape[2]
+        # uint8 与 int16 的平方分别在 uint16 / int32 内不会溢出
+        square_dtype = np.uint16 if values.dtype == np.uint8 else np.int32
+        total = values.sum(axis=(1, 2), dtype=np.int64)
+        total_sq = np.square(values, dtype=square_dtype).sum(axis=(1, 2), dtype=np.int64)
+        mean = total / count
+        variance = np.maximum(total_sq / count - mean * mean, 0.0)
+        return mean, variance
+    
+    def _texture_features(self, images: np.ndarray) -> np.ndarray:
+        # 转换为灰度图
+        gray = self._convert_stack(images, cv2.COLOR_BGR2GRAY)
+        
+        # 计算局部方差作为纹理特征(Laplacian 默认边界为 REFLECT_101)
+        laplacian = self._filter_stack(gray, 1, 'reflect', lambda x: cv2.Laplacian(x, cv2.CV_16S))
+        _, variance = self._moments(laplacian)
+        
+        return variance
+    
+    def _imperfection_features(self, images: np.ndarray) -> np.ndarray:
+        # 转换为灰度图
+        gray = self._convert_stack(images, cv2.COLOR_BGR2GRAY)
+        
+        # 使用自适应阈值检测瑕疵(内部高斯均值使用 REPLICATE 边界)
+        thresh = self._filter_stack(gray, 5, 'edge', lambda x: cv2.adaptiveThreshold(
+            x, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+            cv2.THRESH_BINARY_INV, 11, 2
+        ))
+        
+        # 计算瑕疵面积比例
+        total_pixels = thresh.shape[1] * thresh.shape[2]
+        return np.count_nonzero(thresh, axis=(1, 2)) / total_pixels
+    
+    def _color_features(self, images: np.ndarray) -> np.ndarray:
+        # 转换为LAB颜色空间
+        lab = self._convert_stack(images, cv2.COLOR_BGR2LAB)
+        
+        # 计算颜色统计信息, 列顺序与 COLOR_FEATURES 一致
+        l_mean, l_variance = self._moments(lab[..., 0])
+        a_mean, _ = self._moments(lab[..., 1])
+        b_mean, _ = self._moments(lab[..., 2])
+        
+        return np.stack([l_mean, a_mean, b_mean, np.sqrt(l_variance)], axis=1)
+    
     def enhance_image_quality(self, image: np.ndarray) -> np.ndarray:
         """
         增强图像质量
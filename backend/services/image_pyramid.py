@@ -0,0 +1,76 @@
+import os
+import json
+import cv2
+import numpy as np
+from typing import Dict, List, Optional, Union
+
+# 各项指标使用的金字塔层级, 0 为原始分辨率, 每升一级长宽各减半
+# 基于均值/分位数的指标在低分辨率下基本不变; 基于方差的指标对尺度敏感,
+# 默认保持原始分辨率, 可通过 pyramid_calibration 在真实样本上重新标定
+METRIC_LEVELS: Dict[str, int] = {
+    'texture': 0,
+    'imperfections': 0,
+    'color': 0,
+    'moisture': 2,
+    'oil': 2,
+    'sensitivity': 0
+}
+
+# 加载标定结果(pyramid_calibration 的输出)覆盖默认层级
+_levels_file = os.getenv('PYRAMID_LEVELS_FILE')
+if _levels_file and os.path.exists(_levels_file):
+    with open(_levels_file, 'r', encoding='utf-8') as f:
+        METRIC_LEVELS.update({
+            metric: int(entry['level']) if isinstance(entry, dict) else int(entry)
+            for metric, entry in json.load(f).items()
+        })
+
+
+class ImagePyramid:
+    """
+    高斯金字塔, 每张图像只构建一次, 各层按需生成并缓存
+    """
+
+    def __init__(self, image: np.ndarray, min_size: int = 16):
+        self.levels: List[np.ndarray] = [image]
+        self.min_size = min_size
+
+    @classmethod
+    def of(cls, image: Union[np.ndarray, 'ImagePyramid']) -> 'ImagePyramid':
+        """
+        将图像包装为金字塔, 已是金字塔时直接返回以便多个指标共用
+        """
+        if isinstance(image, ImagePyramid):
+            return image
+        return cls(image)
+
+    @property
+    def base(self) -> np.ndarray:
+        return self.levels[0]
+
+    def level(self, index: int) -> np.ndarray:
+        """
+        获取指定层级的图像, 图像过小时停在最粗的可用层级
+        """
+        while len(self.levels) <= index:
+            top = self.levels[-1]
+            if min(top.shape[:2]) < 2 * self.min_size:
+                break
+            self.levels.append(cv2.pyrDown(top))
+        return self.levels[min(index, len(self.levels) - 1)]
+
+
+def image_at_level(image: Union[np.ndarray, ImagePyramid], metric: str,
+                   level: Optional[int] = None,
+                   metric_levels: Optional[Dict[str, int]] = None) -> np.ndarray:
+    """
+    按指标声明的层级取图像
+
+    level 显式给出时优先使用, 否则查 metric_levels(默认 METRIC_LEVELS)。
+    传入普通数组时同样会下采样, 保证结果与共用金字塔时一致。
+    """
+    if level is None:
+        level = (metric_levels or METRIC_LEVELS).get(metric, 0)
+    if level == 0 and not isinstance(image, ImagePyramid):
+        return image
+    return ImagePyramid.of(image).level(level)
@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import argparse
+import cv2
+import numpy as np
+from typing import Callable, Dict, List
+from .image_processing import ImageProcessor
+from .image_pyramid import ImagePyramid
+from .skin_analysis import analyze_moisture_level, analyze_oil_level, analyze_sensitivity
+
+_processor = ImageProcessor()
+
+# 指标名 -> 在给定层级上计算指标值的函数
+METRICS: Dict[str, Callable[[ImagePyramid, int], np.ndarray]] = {
+    'texture': lambda p, level: _processor.analyze_skin_texture(p, level),
+    'imperfections': lambda p, level: _processor.detect_skin_imperfections(p, level)['imperfection_ratio'],
+    'color': lambda p, level: list(_processor.analyze_skin_color(p, level).values()),
+    'moisture': lambda p, level: analyze_moisture_level(p, level),
+    'oil': lambda p, level: analyze_oil_level(p, level),
+    'sensitivity': lambda p, level: analyze_sensitivity(p, level)
+}
+
+def _relative_error(value, reference) -> float:
+    """
+    相对误差, 多值指标取各分量中的最大值
+    """
+    value = np.atleast_1d(np.asarray(value, dtype=np.float64))
+    reference = np.atleast_1d(np.asarray(reference, dtype=np.float64))
+    return float(np.max(np.abs(value - reference) / np.maximum(np.abs(reference), 1e-6)))
+
+def calibrate_pyramid_levels(images: List[np.ndarray], tolerance: float = 0.05,
+                             max_level: int = 3) -> Dict[str, Dict]:
+    """
+    为每个指标选出误差不超过 tolerance 的最粗金字塔层级
+
+    图像按 analyze_skin 的方式先做肤色掩码; 每个层级记录所有样本中
+    相对原始分辨率的最大误差和平均耗时, 选中的层级要求其以下各层都满足容差。
+    """
+    errors = {metric: np.zeros(max_level + 1) for metric in METRICS}
+    times = {metric: np.zeros(max_level + 1) for metric in METRICS}
+
+    for image in images:
+        skin, _ = _processor.extract_skin_features(image)
+        pyramid = ImagePyramid(skin)
+        for metric, compute in METRICS.items():
+            reference = compute(pyramid, 0)
+            for level in range(max_level + 1):
+                start = time.perf_counter()
+                value = compute(pyramid, level)
+                times[metric][level] += time.perf_counter() - start
+                errors[metric][level] = max(errors[metric][level], _relative_error(value, reference))
+
+    results = {}
+    for metric in METRICS:
+        level = 0
+        while level < max_level and errors[metric][level + 1] <= tolerance:
+            level += 1
+        results[metric] = {
+            'level': level,
+            'max_relative_error': errors[metric].round(6).tolist(),
+            'mean_time_ms': (times[metric] / max(len(images), 1) * 1000).round(4).tolist()
+        }
+    return results
+
+def load_images(image_dir: str) -> List[np.ndarray]:
+    """
+    读取目录(含子目录)下的所有图片
+    """
+    images = []
+    for root, _, files in os.walk(image_dir):
+        for name in sorted(files):
+            if name.lower().endswith(('.jpg', '.jpeg', '.png')):
+                image = cv2.imread(os.path.join(root, name))
+                if image is not None:
+                    images.append(image)
+    return images
+
+def main():
+    parser = argparse.ArgumentParser(description='标定各皮肤指标的金字塔层级')
+    parser.add_argument('image_dir', help='标定用样本图片目录')
+    parser.add_argument('--tolerance', type=float, default=0.05, help='相对原始分辨率的最大允许误差')
+    parser.add_argument('--max-level', type=int, default=3)
+    parser.add_argument('--output', default='pyramid_levels.json', help='结果文件, 可通过 PYRAMID_LEVELS_FILE 加载')
+    args = parser.parse_args()
+
+    images = load_images(args.image_dir)
+    if not images:
+        raise ValueError(f"目录中没有可用图片: {args.image_dir}")
+
+    results = calibrate_pyramid_levels(images, args.tolerance, args.max_level)
+
+    print(f"样本数: {len(images)}, 容差: {args.tolerance:.1%}")
+    for metric, entry in results.items():
+        print(f"{metric:>14}: 层级 {entry['level']}  误差 {entry['max_relative_error']}  耗时(ms) {entry['mean_time_ms']}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
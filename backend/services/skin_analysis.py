@@ -1,28 +1,34 @@
 import cv2
 import numpy as np
-from .image_processing import extract_skin_features, analyze_skin_texture
+from .image_processing import ImageProcessor
+from .image_pyramid import ImagePyramid, image_at_level
+
+_processor = ImageProcessor()
 
 def analyze_skin(image):
     """
     分析皮肤状态并返回结果
     """
     # 提取皮肤特征
-    skin, skin_mask = extract_skin_features(image)
+    skin, skin_mask = _processor.extract_skin_features(image)
+    
+    # 构建一次高斯金字塔, 各指标在各自声明的层级上计算
+    pyramid = ImagePyramid(skin)
     
     # 分析皮肤纹理
-    texture = analyze_skin_texture(skin)
+    texture = _processor.analyze_skin_texture(pyramid)
     
     # 计算皮肤评分
     skin_score = calculate_skin_score(skin, texture)
     
     # 分析水分含量
-    moisture_level = analyze_moisture_level(skin)
+    moisture_level = analyze_moisture_level(pyramid)
     
     # 分析油脂含量
-    oil_level = analyze_oil_level(skin)
+    oil_level = analyze_oil_level(pyramid)
     
     # 分析敏感度
-    sensitivity = analyze_sensitivity(skin)
+    sensitivity = analyze_sensitivity(pyramid)
     
     # 生成建议
     recommendations = generate_recommendations(skin_score, moisture_level, oil_level, sensitivity)
@@ -44,10 +50,12 @@ def calculate_skin_score(skin, texture):
     score = min(100, max(0, texture / 1000 * 100))
     return round(score, 2)
 
-def analyze_moisture_level(skin):
+def analyze_moisture_level(skin, level=None):
     """
     分析皮肤水分含量
     """
+    skin = image_at_level(skin, 'moisture', level)
+    
     # 转换为HSV颜色空间
     hsv = cv2.cvtColor(skin, cv2.COLOR_BGR2HSV)
     
@@ -57,10 +65,12 @@ def analyze_moisture_level(skin):
     
     return round(moisture, 2)
 
-def analyze_oil_level(skin):
+def analyze_oil_level(skin, level=None):
     """
     分析皮肤油脂含量
     """
+    skin = image_at_level(skin, 'oil', level)
+    
     # 转换为灰度图
     gray = cv2.cvtColor(skin, cv2.COLOR_BGR2GRAY)
     
@@ -68,10 +78,12 @@ def analyze_oil_level(skin):
     oil_level = np.percentile(gray, 75) / 2.55
     return round(oil_level, 2)
 
-def analyze_sensitivity(skin):
+def analyze_sensitivity(skin, level=None):
     """
     分析皮肤敏感度
     """
+    skin = image_at_level(skin, 'sensitivity', level)
+    
     # 转换为LAB颜色空间
     lab = cv2.cvtColor(skin, cv2.COLOR_BGR2LAB)
     
@@ -0,0 +1,125 @@
+import cv2
+import time
+import threading
+import numpy as np
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+# 感知哈希的边长, 哈希共 HASH_SIZE * HASH_SIZE = 64 位
+HASH_SIZE = 8
+
+def _gray(image: np.ndarray) -> np.ndarray:
+    if image.ndim == 2:
+        return image
+    code = cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+    return cv2.cvtColor(image, code)
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int(''.join('1' if bit else '0' for bit in bits.ravel()), 2)
+
+def dhash(image: np.ndarray, hash_size: int = HASH_SIZE) -> int:
+    """
+    差值哈希: 缩成 (hash_size + 1) x hash_size 的灰度缩略图, 比较每行相邻像素的明暗
+    """
+    thumbnail = cv2.resize(_gray(image), (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    return _bits_to_int(thumbnail[:, 1:] > thumbnail[:, :-1])
+
+def phash(image: np.ndarray, hash_size: int = HASH_SIZE, highfreq_factor: int = 4) -> int:
+    """
+    DCT 感知哈希: 灰度缩略图做二维 DCT, 取左上角低频系数与其中位数比较(不含直流分量)
+    """
+    size = hash_size * highfreq_factor
+    thumbnail = cv2.resize(_gray(image), (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(thumbnail)[:hash_size, :hash_size]
+    return _bits_to_int(low > np.median(low.ravel()[1:]))
+
+HASH_METHODS = {'dhash': dhash, 'phash': phash}
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+def read_thumbnail(image_path: str) -> np.ndarray:
+    """
+    按 1/8 比例解码灰度图用于计算哈希, JPEG 解码时直接跳过高频系数, 比完整解码快得多
+    """
+    image = cv2.imread(image_path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        raise ValueError(f"无法读取图像: {image_path}")
+    return image
+
+class UploadDeduplicator:
+    """
+    按用户识别短时间内的近似重复上传
+
+    每个用户保留时间窗口 window_seconds 内最近 max_entries 次上传的感知哈希及分析结果;
+    新上传与其中某次的汉明距离不超过 threshold 时视为重复, 直接复用该次结果而不再推理。
+    窗口从该次分析的时间算起, 命中不会延长条目的有效期: 持续上传相似照片的用户
+    最迟在 window_seconds 之后得到新的分析结果。线程安全。
+    """
+
+    def __init__(self, threshold: int = 6, window_seconds: float = 300.0, max_entries: int = 8,
+                 method: str = 'dhash', clock: Callable[[], float] = time.monotonic):
+        if method not in HASH_METHODS:
+            raise ValueError(f"不支持的哈希方法: {method}")
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.method = method
+        self._hash = HASH_METHODS[method]
+        self._clock = clock
+        self._entries: Dict[object, deque] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.skipped = 0
+
+    def image_hash(self, image) -> int:
+        """image 可以是图像数组或图像文件路径"""
+        if isinstance(image, str):
+            image = read_thumbnail(image)
+        return self._hash(image)
+
+    def _recent(self, user_id, now: float) -> deque:
+        entries = self._entries.setdefault(user_id, deque(maxlen=self.max_entries))
+        while entries and now - entries[0]['time'] > self.window_seconds:
+            entries.popleft()
+        return entries
+
+    def lookup(self, user_id, image) -> Tuple[int, Optional[Dict]]:
+        """
+        计算上传图像的哈希并查找该用户窗口内最接近的近似重复, 返回 (哈希, 重复条目或 None)
+
+        条目中 result 为之前的分析结果, analysis_id 为其记录编号, distance 为汉明距离
+        """
+        image_hash = self.image_hash(image)
+        with self._lock:
+            now = self._clock()
+            entries = self._recent(user_id, now)
+            self.lookups += 1
+            if not entries:
+                # 窗口内没有上传的用户不再占用内存
+                del self._entries[user_id]
+                return image_hash, None
+            best = min(entries, key=lambda entry: hamming_distance(entry['hash'], image_hash))
+            if hamming_distance(best['hash'], image_hash) > self.threshold:
+                return image_hash, None
+            self.skipped += 1
+            return image_hash, dict(best, distance=hamming_distance(best['hash'], image_hash))
+
+    def record(self, user_id, image_hash: int, result: Dict, analysis_id=None):
+        """记录一次完整分析的结果, 供之后的近似重复上传复用"""
+        with self._lock:
+            now = self._clock()
+            self._recent(user_id, now).append({'hash': image_hash, 'time': now, 'result': dict(result),
+                                               'analysis_id': analysis_id})
+
+    def stats(self) -> Dict:
+        """查找次数、跳过推理次数与命中率"""
+        with self._lock:
+            return {
+                'lookups': self.lookups,
+                'skipped_inferences': self.skipped,
+                'hit_rate': self.skipped / self.lookups if self.lookups else 0.0,
+                'tracked_keys': len(self._entries),
+                'threshold': self.threshold,
+                'window_seconds': self.window_seconds
+            }
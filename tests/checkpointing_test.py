@@ -0,0 +1,115 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_model', 'training'))
+
+import tensorflow as tf
+from checkpointing import TrainingCheckpoint
+from model_trainer import SkinAnalysisModel
+from record_sequence import RecordSequence
+from record_shards import ShardDataset, ShardWriter
+
+
+class Interrupted(Exception):
+    pass
+
+
+class CheckpointingTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备
+        """
+        self.work_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        record_dir = os.path.join(self.work_dir, 'records')
+        with ShardWriter(record_dir, image_shape=(32, 32, 3), label_names=('a', 'b', 'c', 'd'), shard_size=8) as writer:
+            for i in range(24):
+                writer.add(f'img_{i}.jpg', rng.integers(0, 256, (32, 32, 3), dtype=np.uint8),
+                           rng.random(4, dtype=np.float32))
+        self.dataset = ShardDataset(record_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _train(self, checkpoint_dir, resume=False, overwrite=False):
+        tf.keras.utils.set_random_seed(0)
+        model = SkinAnalysisModel(input_shape=(32, 32, 3))
+        if resume:
+            # 恢复时模型重新初始化, 权重应全部来自检查点
+            tf.keras.utils.set_random_seed(123)
+        history = model.train(
+            RecordSequence(self.dataset, batch_size=4, shuffle=True, seed=7),
+            RecordSequence(self.dataset, batch_size=8),
+            epochs=3, checkpoint_dir=checkpoint_dir, resume=resume, save_every=2, overwrite=overwrite
+        )
+        return model, history
+
+    def test_sequence_order_depends_on_seed_and_epoch(self):
+        """
+        测试批次顺序由 (seed, 轮次) 决定, seek 定位到该轮剩余批次
+        """
+        sequence = RecordSequence(self.dataset, batch_size=4, shuffle=True, seed=7)
+        first = [sequence[i][1] for i in range(len(sequence))]
+        sequence.on_epoch_begin()
+        sequence.on_epoch_begin()
+        second = [sequence[i][1] for i in range(len(sequence))]
+        self.assertFalse(all(np.array_equal(a, b) for a, b in zip(first, second)))
+
+        resumed = sequence.seek(1, 4)
+        self.assertEqual(len(resumed), 2)
+        for i in range(2):
+            np.testing.assert_array_equal(resumed[i][1], second[4 + i])
+
+    def test_resume_matches_uninterrupted_training(self):
+        """
+        测试在轮次中间中断后恢复训练, 结果与不中断训练一致
+        """
+        reference, reference_history = self._train(os.path.join(self.work_dir, 'reference'))
+
+        checkpoint_dir = os.path.join(self.work_dir, 'interrupted')
+        original = TrainingCheckpoint.on_train_batch_end
+
+        def interrupt(callback, batch, logs=None):
+            original(callback, batch, logs)
+            # 第 2 轮第 4 批完成并保存检查点后中断
+            if callback.global_step == 10:
+                raise Interrupted()
+
+        with mock.patch.object(TrainingCheckpoint, 'on_train_batch_end', interrupt):
+            with self.assertRaises(Interrupted):
+                self._train(checkpoint_dir)
+        # 只保留最近的检查点
+        self.assertEqual(len(tf.train.get_checkpoint_state(checkpoint_dir).all_model_checkpoint_paths), 3)
+
+        resumed, resumed_history = self._train(checkpoint_dir, resume=True)
+        for expected, actual in zip(reference.model.get_weights(), resumed.model.get_weights()):
+            np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-6)
+        self.assertEqual(len(resumed_history.history['loss']), 3)
+        np.testing.assert_allclose(resumed_history.history['val_loss'], reference_history.history['val_loss'],
+                                   rtol=1e-5)
+
+
+    def test_existing_checkpoints_are_not_discarded(self):
+        """
+        测试已有检查点时不指定 resume 拒绝开始且保留检查点, 指定 overwrite 时重新训练
+        """
+        checkpoint_dir = os.path.join(self.work_dir, 'existing')
+        self._train(checkpoint_dir)
+        latest = tf.train.latest_checkpoint(checkpoint_dir)
+
+        with self.assertRaises(FileExistsError):
+            self._train(checkpoint_dir)
+        self.assertEqual(tf.train.latest_checkpoint(checkpoint_dir), latest)
+
+        _, history = self._train(checkpoint_dir, overwrite=True)
+        self.assertEqual(len(history.history['loss']), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
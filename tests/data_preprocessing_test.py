@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+import cv2
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRAINING_DIR = os.path.join(ROOT_DIR, 'ai_model', 'training')
+sys.path.insert(0, TRAINING_DIR)
+
+from record_shards import ShardDataset
+from data_preprocessing import DataPreprocessor
+
+# 在独立进程中运行预处理, 输出导入完成后与处理结束时的峰值RSS(KB)
+RSS_SCRIPT = """
+import sys, json, resource
+sys.path.insert(0, {training_dir!r})
+from data_preprocessing import DataPreprocessor
+preprocessor = DataPreprocessor({data_dir!r}, {output_dir!r}, workers={workers})
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+preprocessor.process_dataset('ffhq')
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'before': before, 'after': after}}))
+"""
+
+
+class DataPreprocessorTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备
+        """
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _create_ffhq_dataset(self, name: str, count: int) -> str:
+        """
+        创建 FFHQ 目录结构的合成数据集
+        """
+        data_dir = os.path.join(self.work_dir, name)
+        img_dir = os.path.join(data_dir, 'thumbnails128x128')
+        os.makedirs(img_dir)
+
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+        ok, encoded = cv2.imencode('.png', image)
+        self.assertTrue(ok)
+        for i in range(count):
+            with open(os.path.join(img_dir, f'{i:05d}.png'), 'wb') as f:
+                f.write(encoded.tobytes())
+        # 一张损坏的图片, 应被跳过
+        with open(os.path.join(img_dir, 'broken.png'), 'wb') as f:
+            f.write(b'not an image')
+        return data_dir
+
+    def _run_preprocessing(self, data_dir: str, workers: int = 1) -> dict:
+        """
+        在子进程中处理数据集并返回峰值RSS增量(KB)和输出目录
+        """
+        output_dir = f'{data_dir}_processed_{workers}'
+        script = RSS_SCRIPT.format(training_dir=TRAINING_DIR, data_dir=data_dir,
+                                   output_dir=output_dir, workers=workers)
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=self.work_dir,
+            capture_output=True, text=True, check=True
+        )
+        rss = json.loads(result.stdout.strip().splitlines()[-1])
+        return {'rss_growth_kb': rss['after'] - rss['before'], 'output_dir': output_dir}
+
+    def test_streaming_output_is_complete(self):
+        """
+        测试流式处理写出全部有效图片并跳过损坏图片
+        """
+        data_dir = self._create_ffhq_dataset('small', 50)
+        output_dir = self._run_preprocessing(data_dir)['output_dir']
+
+        counts = {split: len(ShardDataset(os.path.join(output_dir, split))) for split in ('train', 'val', 'test')}
+        self.assertEqual(sum(counts.values()), 50)
+        self.assertTrue(all(count > 0 for count in counts.values()))
+
+        with open(os.path.join(output_dir, 'dataset_info.csv')) as f:
+            header, values = f.read().split()
+        info = dict(zip(header.split(','), map(int, values.split(','))))
+        self.assertEqual(info['total_samples'], 50)
+        self.assertEqual(info['train_samples'], counts['train'])
+
+    def test_peak_rss_independent_of_dataset_size(self):
+        """
+        测试10k张图片的峰值内存与1k张时基本相同
+        """
+        small = self._run_preprocessing(self._create_ffhq_dataset('small', 1000))
+        large = self._run_preprocessing(self._create_ffhq_dataset('large', 10000))
+
+        # 全量驻留时 10k 张 224x224x3 图像至少需要约 1.4GB;
+        # 流式处理只保留文件元数据, 分片经 memmap 写出, 增量应在数十MB以内
+        growth_mb = (large['rss_growth_kb'] - small['rss_growth_kb']) / 1024
+        self.assertLess(growth_mb, 32, f'峰值RSS增量: 1k张 {small["rss_growth_kb"] / 1024:.1f}MB, '
+                                       f'10k张 {large["rss_growth_kb"] / 1024:.1f}MB')
+
+    def test_parallel_build_matches_sequential(self):
+        """
+        测试多进程构建与单进程结果一致, 失败图片写入错误清单
+        """
+        data_dir = self._create_ffhq_dataset('small', 200)
+        sequential = self._run_preprocessing(data_dir, workers=1)['output_dir']
+        parallel = self._run_preprocessing(data_dir, workers=3)['output_dir']
+
+        for split in ('train', 'val', 'test'):
+            expected = ShardDataset(os.path.join(sequential, split))
+            actual = ShardDataset(os.path.join(parallel, split))
+            self.assertEqual(actual.keys, expected.keys)
+            np.testing.assert_array_equal(actual.to_arrays()[0], expected.to_arrays()[0])
+
+        with open(os.path.join(parallel, 'errors.csv'), encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], 'filename,path,split,error')
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('broken.png,'))
+
+    def _create_celeba_dataset(self, count: int) -> str:
+        """
+        创建 CelebA 目录结构的合成数据集: 属性文件、官方划分文件, 其中一张图片缺失
+        """
+        data_dir = os.path.join(self.work_dir, 'celeba')
+        img_dir = os.path.join(data_dir, 'img_align_celeba')
+        os.makedirs(img_dir)
+
+        ok, encoded = cv2.imencode('.jpg', np.full((32, 24, 3), 128, dtype=np.uint8))
+        self.assertTrue(ok)
+        names = [f'{i:06d}.jpg' for i in range(1, count + 1)]
+        for name in names[:-1]:
+            with open(os.path.join(img_dir, name), 'wb') as f:
+                f.write(encoded.tobytes())
+
+        rng = np.random.default_rng(0)
+        values = rng.choice([-1, 1], size=(count, 3))
+        with open(os.path.join(data_dir, 'list_attr_celeba.txt'), 'w') as f:
+            f.write(f'{count}\n')
+            f.write('Smiling Young  Pale_Skin\n')
+            for name, row in zip(names, values):
+                f.write(f"{name} {' '.join(f'{v:2d}' for v in row)}\n")
+        with open(os.path.join(data_dir, 'list_eval_partition.txt'), 'w') as f:
+            for i, name in enumerate(names):
+                f.write(f'{name} {i % 3}\n')
+        return data_dir
+
+    def test_celeba_metadata(self):
+        """
+        测试 CelebA 按官方划分写出, 属性按划分写出 Parquet, 正样本比例一次算出
+        """
+        data_dir = self._create_celeba_dataset(30)
+        output_dir = os.path.join(self.work_dir, 'celeba_processed')
+        cwd = os.getcwd()
+        os.chdir(self.work_dir)
+        try:
+            DataPreprocessor(data_dir, output_dir).process_dataset('celeba')
+        finally:
+            os.chdir(cwd)
+
+        attributes = pd.read_csv(os.path.join(data_dir, 'list_attr_celeba.txt'), sep=r'\s+', skiprows=1)
+        for partition, split in enumerate(('train', 'val', 'test')):
+            expected = [f'{i:06d}.jpg' for i in range(1, 30) if (i - 1) % 3 == partition]
+            split_attributes = pd.read_parquet(os.path.join(output_dir, f'{split}_attributes.parquet'))
+            self.assertEqual(list(split_attributes['filename']), expected)
+            np.testing.assert_array_equal(split_attributes[attributes.columns].to_numpy(),
+                                          attributes.loc[expected].to_numpy())
+
+            records = ShardDataset(os.path.join(output_dir, split))
+            self.assertEqual(records.keys, expected)
+            self.assertEqual(records.label_names, list(attributes.columns))
+            np.testing.assert_array_equal(records.to_arrays()[1], attributes.loc[expected].to_numpy())
+
+        stats = pd.read_csv(os.path.join(output_dir, 'attribute_stats.csv')).iloc[0]
+        self.assertEqual(stats['total_samples'], 30)
+        self.assertAlmostEqual(stats['Young_positive_ratio'], (attributes['Young'] == 1).mean())
+
+
+if __name__ == '__main__':
+    unittest.main()
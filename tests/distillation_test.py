@@ -0,0 +1,75 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'ai_model', 'training'))
+
+import tensorflow as tf
+from ai_model.inference.model_inference import SkinAnalyzer
+from distillation import TABLE_COLUMNS, distill, latency_accuracy_table
+from evaluation import format_table
+from model_trainer import SkinAnalysisModel
+from record_shards import ShardDataset, ShardWriter
+
+
+class DistillationTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备: 教师模型、无标注图像与带标签的测试集
+        """
+        self.work_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.unlabeled_dir = os.path.join(self.work_dir, 'unlabeled')
+        with ShardWriter(self.unlabeled_dir, image_shape=(32, 32, 3)) as writer:
+            for i in range(24):
+                writer.add(f'user_{i}.jpg', rng.integers(0, 256, (32, 32, 3), dtype=np.uint8))
+        self.test_dir = os.path.join(self.work_dir, 'test')
+        with ShardWriter(self.test_dir, image_shape=(32, 32, 3), label_names=['a', 'b', 'c', 'd']) as writer:
+            for i in range(6):
+                writer.add(f'test_{i}.jpg', rng.integers(0, 256, (32, 32, 3), dtype=np.uint8),
+                           rng.random(4, dtype=np.float32))
+
+        tf.keras.utils.set_random_seed(0)
+        self.teacher_path = os.path.join(self.work_dir, 'teacher.h5')
+        SkinAnalysisModel(input_shape=(32, 32, 3)).save_model(self.teacher_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_distill_and_serve_student(self):
+        """
+        测试学生模型以教师输出为目标训练, 比教师小得多, 并可由 SkinAnalyzer 直接加载
+        """
+        output_dir = os.path.join(self.work_dir, 'distillation')
+        paths = distill(self.teacher_path, self.unlabeled_dir, output_dir, widths=(4, 8), epochs=2, batch_size=8)
+        self.assertEqual(list(paths), ['student_w4', 'student_w8'])
+
+        # 软标签即教师对每张无标注图像的输出
+        soft_labels = ShardDataset(os.path.join(output_dir, 'soft_labels'))
+        teacher = tf.keras.models.load_model(self.teacher_path, compile=False)
+        images, labels = soft_labels.read_range(0, 4)
+        np.testing.assert_allclose(labels, teacher.predict_on_batch(images), rtol=1e-4, atol=1e-5)
+        self.assertEqual(soft_labels.keys[:2], ['user_0.jpg', 'user_1.jpg'])
+
+        analyzer = SkinAnalyzer(paths['student_w8'])
+        result = analyzer.analyze_skin(np.zeros((60, 80, 3), dtype=np.uint8))
+        self.assertEqual(set(result) - {'recommendations'}, {'score', 'moisture', 'oil', 'sensitivity'})
+
+        rows = latency_accuracy_table({'teacher': self.teacher_path, **paths}, self.test_dir)
+        self.assertEqual([row['model'] for row in rows], ['teacher', 'student_w4', 'student_w8'])
+        self.assertLess(rows[2]['parameters'], rows[0]['parameters'] / 10)
+        self.assertLess(rows[1]['parameters'], rows[2]['parameters'])
+        for row in rows:
+            self.assertGreater(row['latency_p50_ms'], 0)
+            self.assertTrue(np.isfinite(row['mae']))
+        self.assertEqual(len(format_table(rows, TABLE_COLUMNS).splitlines()), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
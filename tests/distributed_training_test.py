@@ -0,0 +1,114 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_model', 'training'))
+
+from record_shards import ShardDataset, ShardWriter
+from distributed_training import _shard_batches, scale_hyperparameters, shard_range, train_distributed
+
+
+class DistributedTrainingTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备: 少量分片记录
+        """
+        self.work_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.record_dirs = {}
+        for split, count in (('train', 18), ('val', 9)):
+            record_dir = os.path.join(self.work_dir, split)
+            with ShardWriter(record_dir, image_shape=(32, 32, 3), label_names=['a', 'b', 'c', 'd'],
+                             shard_size=5) as writer:
+                for i in range(count):
+                    writer.add(f'{i}.jpg', rng.integers(0, 256, (32, 32, 3), dtype=np.uint8),
+                               np.full(4, i, dtype=np.float32))
+            self.record_dirs[split] = record_dir
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_shards_are_disjoint_and_equal(self):
+        """
+        测试各工作进程的记录分片互不重叠且大小相同, 每轮各读取一次
+        """
+        dataset = ShardDataset(self.record_dirs['train'])
+        ranges = [shard_range(len(dataset), index, 4) for index in range(4)]
+        self.assertEqual(ranges, [(0, 4), (4, 8), (8, 12), (12, 16)])
+
+        generate = _shard_batches(dataset, 4, 8, 3, shuffle=True, seed=0)
+        for _ in range(2):
+            labels = np.concatenate([labels for _, labels in generate()])
+            np.testing.assert_array_equal(np.sort(labels[:, 0]), [4, 5, 6, 7])
+
+    def test_eval_shards_cover_every_record(self):
+        """
+        测试评估分片覆盖全部记录, 较小的分片以权重为 0 的记录补齐到相同步数
+        """
+        dataset = ShardDataset(self.record_dirs['val'])
+        ranges = [shard_range(len(dataset), index, 4, drop_remainder=False) for index in range(4)]
+        self.assertEqual(ranges, [(0, 3), (3, 6), (6, 9), (9, 9)])
+
+        batches = list(_shard_batches(dataset, 6, 9, 2, shuffle=False, seed=0, steps=3)())
+        self.assertEqual(len(batches), 3)
+        np.testing.assert_array_equal(np.concatenate([labels for _, labels, _ in batches])[:3, 0], [6, 7, 8])
+        np.testing.assert_array_equal(np.concatenate([weights for _, _, weights in batches]), [1, 1, 1, 0])
+
+    def test_mixed_precision_training(self):
+        """
+        测试多进程训练使用指定的计算精度, mixed_float16 经损失缩放后损失仍为有限值
+        """
+        model_path = os.path.join(self.work_dir, 'model.h5')
+        result = train_distributed(self.record_dirs['train'], self.record_dirs['val'], workers=2,
+                                   epochs=1, batch_size=4, model_path=model_path, precision='mixed_float16')
+        self.assertTrue(np.all(np.isfinite(result['history']['loss'])))
+        import tensorflow as tf
+        model = tf.keras.models.load_model(model_path, compile=False)
+        conv = next(layer for layer in model.layers if isinstance(layer, tf.keras.layers.Conv2D))
+        self.assertEqual(conv.compute_dtype, 'float16')
+
+    def test_fewer_records_than_workers(self):
+        """
+        测试训练记录少于工作进程数时直接报错, 而不是在训练中除零
+        """
+        with self.assertRaisesRegex(ValueError, r'训练记录数\(18\)少于工作进程数\(20\)'):
+            train_distributed(self.record_dirs['train'], self.record_dirs['val'], workers=20)
+
+    def test_scale_hyperparameters(self):
+        """
+        测试全局批大小与学习率随工作进程数线性放大
+        """
+        self.assertEqual(scale_hyperparameters(32, 0.001, 1), (32, 0.001))
+        self.assertEqual(scale_hyperparameters(32, 0.001, 4), (128, 0.004))
+
+    def test_two_worker_training(self):
+        """
+        测试两个本地工作进程同步训练并由 0 号进程保存模型
+        """
+        model_path = os.path.join(self.work_dir, 'model.h5')
+        result = train_distributed(self.record_dirs['train'], self.record_dirs['val'], workers=2,
+                                   epochs=2, batch_size=4, model_path=model_path)
+
+        self.assertEqual(result['workers'], 2)
+        self.assertEqual(result['global_batch_size'], 8)
+        self.assertAlmostEqual(result['learning_rate'], 0.002)
+        self.assertEqual(result['steps_per_epoch'], 3)
+        self.assertEqual(len(result['history']['val_loss']), 2)
+        self.assertTrue(np.all(np.isfinite(result['history']['loss'])))
+        self.assertTrue(os.path.exists(model_path))
+
+        # 验证指标覆盖全部 9 条验证记录(不按工作进程数截断)
+        import tensorflow as tf
+        model = tf.keras.models.load_model(model_path, compile=False)
+        images, labels = ShardDataset(self.record_dirs['val']).to_arrays()
+        losses = np.mean((labels - model.predict(images, verbose=0)) ** 2, axis=-1)
+        self.assertAlmostEqual(result['history']['val_loss'][-1], losses.mean(), delta=0.01 * losses.mean())
+        self.assertGreater(abs(losses[:8].mean() - losses.mean()), 0.01 * losses.mean())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_model.inference.embedding_index import EmbeddingIndex, embed_files
+
+
+def clustered_vectors(count, dim=32, clusters=20, seed=0):
+    """在若干簇附近生成归一化向量, 近似图像嵌入的分布"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(0, clusters, count)] + 0.3 * rng.normal(size=(count, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+class EmbeddingIndexTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备
+        """
+        self.work_dir = tempfile.mkdtemp()
+        self.index_dir = os.path.join(self.work_dir, 'index')
+        self.vectors = clustered_vectors(3000)
+        self.queries = clustered_vectors(50, seed=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _exact_neighbors(self, vectors, query, k):
+        return np.argsort(((vectors - query) ** 2).sum(axis=1))[:k]
+
+    def test_search_recall(self):
+        """
+        测试近似检索的召回率: 真实最近邻基本都在返回的前 10 个结果中
+        """
+        index = EmbeddingIndex.create(self.index_dir, self.vectors, nlist=16, m=16)
+        index.add(self.vectors, np.arange(len(self.vectors)) + 1000)
+        hits = 0
+        for query in self.queries:
+            ids, distances = index.search(query, k=10, nprobe=4)
+            self.assertEqual(len(ids), 10)
+            self.assertTrue(np.all(np.diff(distances) >= 0))
+            hits += (self._exact_neighbors(self.vectors, query, 1)[0] + 1000) in ids
+        self.assertGreaterEqual(hits / len(self.queries), 0.9)
+
+    def test_incremental_persistence(self):
+        """
+        测试增量加入立即写盘, 合并后重新打开时主段以 memmap 加载, 检索结果不变
+        """
+        index = EmbeddingIndex.create(self.index_dir, self.vectors, nlist=16, m=16, compact_threshold=1000)
+        for start in range(0, 2500, 500):
+            index.add(self.vectors[start:start + 500], np.arange(start, start + 500))
+            index.wait_for_compaction()
+        # 前 2000 条已在后台合并进主段, 其余在增量段
+        self.assertEqual(index.meta['count'], 2000)
+        self.assertEqual(len(index), 2500)
+        expected = [index.search(query, k=5) for query in self.queries]
+
+        reopened = EmbeddingIndex(self.index_dir)
+        self.assertEqual(len(reopened), 2500)
+        self.assertIsInstance(reopened._codes, np.memmap)
+        for query, (ids, distances) in zip(self.queries, expected):
+            actual_ids, actual_distances = reopened.search(query, k=5)
+            np.testing.assert_array_equal(actual_ids, ids)
+            np.testing.assert_allclose(actual_distances, distances, rtol=1e-5)
+
+        reopened.compact()
+        self.assertEqual(reopened.meta['count'], 2500)
+        self.assertEqual(sorted(name for name in os.listdir(self.index_dir) if name.startswith('codes')),
+                         [f"codes-{reopened.meta['generation']}.npy"])
+        for query, (ids, _) in zip(self.queries, expected):
+            self.assertEqual(set(reopened.search(query, k=5)[0]), set(ids))
+
+
+    def test_reconstruct_from_codes(self):
+        """
+        测试由存储的编码重建向量: 主段与增量段都能重建, 用重建向量查询可找回原记录
+        """
+        index = EmbeddingIndex.create(self.index_dir, self.vectors, nlist=16, m=16)
+        index.add(self.vectors[:2000], np.arange(2000) * 3)
+        index.compact()
+        index.add(self.vectors[2000:], np.arange(2000, 3000) * 3)
+        self.assertIsNone(index.reconstruct(1))
+        for row in (5, 1999, 2500):
+            vector = index.reconstruct(row * 3)
+            self.assertEqual(vector.shape, (32,))
+            self.assertLess(np.linalg.norm(vector - self.vectors[row]), 0.3)
+            self.assertIn(row * 3, index.search(vector, k=3)[0])
+        self.assertEqual(len(index.search(self.queries[0], k=0)[0]), 0)
+
+    def test_background_compaction_does_not_block(self):
+        """
+        测试后台合并期间查询与追加照常进行, 合并开始后追加的记录转入新一代的增量段
+        """
+        import threading
+        from unittest import mock
+
+        index = EmbeddingIndex.create(self.index_dir, self.vectors, nlist=16, m=16, compact_threshold=1000)
+        started, release = threading.Event(), threading.Event()
+        write_main = EmbeddingIndex._write_main
+
+        def slow_write_main(instance, *args):
+            started.set()
+            release.wait(10)
+            write_main(instance, *args)
+
+        with mock.patch.object(EmbeddingIndex, '_write_main', slow_write_main):
+            index.add(self.vectors[:1000], np.arange(1000))
+            self.assertTrue(started.wait(10))
+            self.assertTrue(index.compacting)
+            # 合并进行中: 查询不被阻塞, 新记录照常写入
+            self.assertEqual(len(index.search(self.queries[0], k=5)[0]), 5)
+            index.add(self.vectors[1000:1200], np.arange(1000, 1200))
+            release.set()
+            index.wait_for_compaction()
+
+        self.assertEqual(index.meta['count'], 1000)
+        self.assertEqual(len(index), 1200)
+        reopened = EmbeddingIndex(self.index_dir)
+        self.assertEqual(len(reopened), 1200)
+        self.assertIsNotNone(reopened.reconstruct(1100))
+
+    def test_multiple_writers_share_directory(self):
+        """
+        测试多个实例(如多个服务进程)写同一目录: 互相看到对方的新记录, 一方合并后另一方切换到新一代文件继续写入
+        """
+        first = EmbeddingIndex.create(self.index_dir, self.vectors, nlist=16, m=16)
+        second = EmbeddingIndex(self.index_dir)
+        first.add(self.vectors[:300], np.arange(300))
+        second.add(self.vectors[300:600], np.arange(300, 600))
+        self.assertEqual(len(first), 600)
+        self.assertIn(450, first.search(self.vectors[450], k=5)[0])
+
+        first.compact()
+        second.add(self.vectors[600:700], np.arange(600, 700))
+        self.assertEqual(second.meta['generation'], first.meta['generation'])
+        self.assertEqual(len(first), 700)
+        self.assertIn(650, first.search(self.vectors[650], k=5)[0])
+        reopened = EmbeddingIndex(self.index_dir)
+        self.assertEqual((reopened.meta['count'], len(reopened)), (600, 700))
+
+    def test_kind_recorded_in_meta(self):
+        """
+        测试索引记录编号的含义, 重新打开后保持不变, 不支持的类型被拒绝
+        """
+        EmbeddingIndex.create(self.index_dir, self.vectors, nlist=16, m=16, kind='images')
+        self.assertEqual(EmbeddingIndex(self.index_dir).kind, 'images')
+        self.assertEqual(EmbeddingIndex.create(self.index_dir, self.vectors, nlist=16, m=16).kind, 'analyses')
+        with self.assertRaises(ValueError):
+            EmbeddingIndex.create(self.index_dir, self.vectors, nlist=16, m=16, kind='users')
+
+    def test_embed_files_skips_unreadable(self):
+        """
+        测试逐批计算嵌入时跳过无法读取的文件, 返回可读取文件的下标
+        """
+        import cv2
+        from unittest import mock
+
+        paths = []
+        for i in range(5):
+            path = os.path.join(self.work_dir, f'{i}.jpg')
+            if i != 2:
+                cv2.imwrite(path, np.full((40, 30, 3), i * 40, np.uint8))
+            paths.append(path)
+        analyzer = mock.Mock()
+        analyzer.embed_batch.side_effect = lambda images, bgr: np.array([[image.mean(), image.shape[0]]
+                                                                          for image in images])
+        batches = list(embed_files(analyzer, paths, roi_detector=lambda image: (0, 0, 30, 20), batch_size=3))
+        self.assertEqual([positions for positions, _ in batches], [[0, 1], [3, 4]])
+        np.testing.assert_array_equal(batches[1][1], [[120, 20], [160, 20]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_model', 'training'))
+
+from evaluation import StreamingRegressionMetrics, compare_reports, evaluate_stream, model_predictor
+
+
+class EvaluationTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备
+        """
+        self.work_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.names = ['a', 'b', 'c', 'd']
+        # 均值较大、方差较小的真实值, 检验累积统计量的数值稳定性
+        self.y_true = 1000.0 + rng.normal(0, 1, (1003, 4))
+        self.y_pred = self.y_true + rng.normal(0, 0.3, (1003, 4))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_streaming_metrics_match_full_computation(self):
+        """
+        测试按不等长批次累积的指标与整体计算一致
+        """
+        metrics = StreamingRegressionMetrics(self.names)
+        for start, stop in ((0, 1), (1, 100), (100, 512), (512, 1003)):
+            metrics.update(self.y_true[start:stop], self.y_pred[start:stop])
+
+        result = metrics.result()
+        for i, name in enumerate(self.names):
+            self.assertAlmostEqual(result[name]['mse'], mean_squared_error(self.y_true[:, i], self.y_pred[:, i]))
+            self.assertAlmostEqual(result[name]['mae'], mean_absolute_error(self.y_true[:, i], self.y_pred[:, i]))
+            self.assertAlmostEqual(result[name]['r2'], r2_score(self.y_true[:, i], self.y_pred[:, i]))
+
+    def test_model_predictor_matches_input_dtype(self):
+        """
+        测试 uint8 输入的模型直接推理, 浮点输入的旧模型先把 uint8 图像换算到 [0, 1]
+        """
+        import tensorflow as tf
+
+        batch = np.random.default_rng(0).integers(0, 256, (3, 4), dtype=np.uint8)
+        current = tf.keras.Sequential([tf.keras.Input((4,), dtype='uint8'), tf.keras.layers.Rescaling(1.0 / 255),
+                                       tf.keras.layers.Dense(2)])
+        legacy = tf.keras.Sequential([tf.keras.Input((4,)), tf.keras.layers.Dense(2)])
+        legacy.set_weights(current.get_weights())
+
+        self.assertEqual(model_predictor(current), current.predict_on_batch)
+        np.testing.assert_allclose(model_predictor(legacy)(batch), current.predict_on_batch(batch), rtol=1e-5)
+
+    def test_report_and_comparison(self):
+        """
+        测试评估报告包含指标、延迟与吞吐, 两份报告可逐项比较
+        """
+        batches = [(self.y_pred[i:i + 100], self.y_true[i:i + 100]) for i in range(0, 1003, 100)]
+        report = evaluate_stream(lambda x: x, batches, self.names)
+
+        self.assertEqual(report['samples'], 1003)
+        self.assertEqual(report['batch_size'], 100)
+        self.assertEqual(set(report['latency_ms']), {'mean', 'p50', 'p95', 'max'})
+        self.assertGreater(report['throughput'], 0)
+
+        worse = evaluate_stream(lambda x: x + 0.1, batches, self.names)
+        diff = compare_reports(report, worse)
+        self.assertGreater(diff['metrics.a.mse']['delta'], 0)
+        self.assertLess(diff['metrics.a.r2']['delta'], 0)
+        self.assertEqual(diff['samples']['delta'], 0)
+
+    def test_evaluation_charts_with_nested_metrics(self):
+        """
+        测试评估图表支持按输出嵌套的指标
+        """
+        from train_and_evaluate import ModelTrainer
+
+        metrics = {name: {'mse': 0.1, 'mae': 0.2, 'r2': 0.9} for name in self.names}
+        cwd = os.getcwd()
+        os.chdir(self.work_dir)
+        try:
+            os.makedirs('reports')
+            ModelTrainer._plot_evaluation_charts(None, metrics)
+            self.assertTrue(os.path.exists('reports/evaluation_charts.png'))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_model', 'training'))
+
+from record_shards import ShardWriter
+from hyperparameter_search import SuccessiveHalvingSearch
+
+
+class SuccessiveHalvingSearchTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备: 少量分片记录
+        """
+        self.work_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.record_dirs = {}
+        for split, count in (('train', 8), ('val', 4)):
+            record_dir = os.path.join(self.work_dir, split)
+            with ShardWriter(record_dir, label_names=['a', 'b', 'c', 'd']) as writer:
+                for i in range(count):
+                    writer.add(f'{i}.jpg', rng.integers(0, 256, (224, 224, 3), dtype=np.uint8),
+                               rng.random(4, dtype=np.float32))
+            self.record_dirs[split] = record_dir
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _search(self, **kwargs):
+        return SuccessiveHalvingSearch(
+            self.record_dirs['train'], self.record_dirs['val'],
+            output_dir=os.path.join(self.work_dir, 'search'),
+            search_space={'learning_rate': [0.01, 0.001, 0.0001], 'dropout_rate': [0.5], 'batch_size': [4]},
+            **kwargs
+        )
+
+    def test_rungs(self):
+        """
+        测试各级别的训练轮数与配置枚举
+        """
+        self.assertEqual(self._search(min_epochs=1, max_epochs=27, eta=3).rungs(), [1, 3, 9, 27])
+        self.assertEqual(self._search(min_epochs=1, max_epochs=10, eta=3).rungs(), [1, 3, 9, 10])
+        configs = self._search().configurations()
+        self.assertEqual(len(configs), 3)
+        self.assertEqual(configs[0], {'batch_size': 4, 'dropout_rate': 0.5, 'learning_rate': 0.01})
+
+    def test_search_and_resume(self):
+        """
+        测试搜索只让最佳配置训练完整轮数, 重新运行时从试验日志恢复
+        """
+        search = self._search(max_epochs=3, eta=3, workers=2)
+        summary = search.run()
+
+        self.assertEqual(summary['rungs'], [1, 3])
+        self.assertEqual(summary['epochs_trained'], 3 * 1 + 1 * 2)
+        self.assertEqual(summary['exhaustive_epochs'], 9)
+        self.assertEqual(os.listdir(os.path.join(self.work_dir, 'search', 'models')),
+                         [os.path.basename(summary['best_model'])])
+        with open(search.log_path) as f:
+            self.assertEqual(len(f.readlines()), 4)
+
+        # 日志已完整, 再次运行不会重新训练
+        self.assertEqual(self._search(max_epochs=3, eta=3, workers=2).run(), summary)
+        with open(search.log_path) as f:
+            self.assertEqual(len(f.readlines()), 4)
+
+
+    def test_promoted_trial_continues_epoch_order(self):
+        """
+        测试晋级的试验接着上一级的轮次编号取样本顺序, 不重放已训练轮次的顺序
+        """
+        from unittest import mock
+        from record_sequence import RecordSequence
+        from hyperparameter_search import _run_trial
+
+        epochs = []
+        original = RecordSequence.set_epoch
+
+        def record_epoch(sequence, epoch):
+            if sequence.shuffle:
+                epochs.append(epoch)
+            original(sequence, epoch)
+
+        model_path = os.path.join(self.work_dir, 'trial.keras')
+        task = {'trial_id': 0, 'rung': 0, 'params': {'learning_rate': 0.001, 'dropout_rate': 0.5, 'batch_size': 4},
+                'train_dir': self.record_dirs['train'], 'val_dir': self.record_dirs['val'],
+                'model_path': model_path, 'start_epoch': 0, 'end_epoch': 1}
+        with mock.patch.object(RecordSequence, 'set_epoch', record_epoch):
+            _run_trial(task)
+            self.assertEqual(sorted(set(epochs)), [0])
+            epochs.clear()
+            _run_trial(dict(task, rung=1, start_epoch=1, end_epoch=3, resume_path=model_path))
+        self.assertEqual(sorted(set(epochs)), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
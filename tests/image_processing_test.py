@@ -0,0 +1,146 @@
+import os
+import sys
+import unittest
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.image_processing import ImageProcessor
+from backend.services.image_pyramid import ImagePyramid
+from backend.services.pyramid_calibration import calibrate_pyramid_levels
+
+
+class ImageProcessorTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备
+        """
+        self.processor = ImageProcessor()
+        self.image = self._create_test_image()
+
+    def _create_test_image(self) -> np.ndarray:
+        """
+        创建测试图像: 深色背景上的一块肤色椭圆区域
+        """
+        rng = np.random.default_rng(0)
+        img = rng.integers(0, 40, (1080, 720, 3), dtype=np.uint8)
+        cv2.ellipse(img, (400, 500), (180, 240), 0, 0, 360, (120, 160, 220), -1)
+        noise = rng.integers(0, 20, img.shape, dtype=np.uint8)
+        return cv2.add(img, noise)
+
+    def test_detect_skin_roi(self):
+        """
+        测试皮肤区域检测返回包含肤色区域的裁剪框
+        """
+        x, y, w, h = self.processor.detect_skin_roi(self.image)
+
+        self.assertLessEqual(x, 400 - 180)
+        self.assertLessEqual(y, 500 - 240)
+        self.assertGreaterEqual(x + w, 400 + 180)
+        self.assertGreaterEqual(y + h, 500 + 240)
+        # 裁剪后像素数明显少于整幅图像
+        self.assertLess(w * h, 0.6 * self.image.shape[0] * self.image.shape[1])
+
+    def test_detect_skin_roi_without_skin(self):
+        """
+        测试没有肤色区域时返回整幅图像
+        """
+        image = np.zeros((480, 640, 3), dtype=np.uint8)
+        self.assertEqual(self.processor.detect_skin_roi(image), (0, 0, 640, 480))
+
+    def test_crop_to_roi(self):
+        """
+        测试裁剪返回原图视图
+        """
+        crop = self.processor.crop_to_roi(self.image, (10, 20, 30, 40))
+        self.assertEqual(crop.shape, (40, 30, 3))
+        self.assertTrue(np.shares_memory(crop, self.image))
+
+    def test_pyramid_levels_are_cached(self):
+        """
+        测试金字塔逐级减半且每层只生成一次
+        """
+        pyramid = ImagePyramid(self.image)
+        level2 = pyramid.level(2)
+        self.assertEqual(level2.shape, (270, 180, 3))
+        self.assertIs(pyramid.level(2), level2)
+        self.assertIs(ImagePyramid.of(pyramid), pyramid)
+
+    def test_shared_pyramid_matches_array_input(self):
+        """
+        测试共用金字塔与直接传入数组的结果一致
+        """
+        pyramid = ImagePyramid(self.image)
+        for level in range(3):
+            self.assertEqual(
+                self.processor.analyze_skin_texture(pyramid, level),
+                self.processor.analyze_skin_texture(self.image, level)
+            )
+        self.assertEqual(self.processor.analyze_skin_color(pyramid),
+                         self.processor.analyze_skin_color(self.image))
+
+    def test_calibrate_pyramid_levels(self):
+        """
+        测试层级标定: 原始分辨率误差为0, 选中层级满足容差
+        """
+        results = calibrate_pyramid_levels([self.image], tolerance=0.05, max_level=2)
+        for entry in results.values():
+            self.assertEqual(entry['max_relative_error'][0], 0.0)
+            self.assertLessEqual(max(entry['max_relative_error'][:entry['level'] + 1]), 0.05)
+            self.assertEqual(len(entry['mean_time_ms']), 3)
+
+    def _create_test_batch(self, count=12, shape=(97, 131)) -> np.ndarray:
+        """
+        创建批量测试图像(奇数尺寸以覆盖边界处理)
+        """
+        rng = np.random.default_rng(1)
+        images = rng.integers(0, 256, (count, *shape, 3), dtype=np.uint8)
+        return np.stack([cv2.GaussianBlur(image, (0, 0), 1.5) for image in images])
+
+    def test_batch_features_match_single_image(self):
+        """
+        测试批量特征与单张版本完全一致
+        """
+        images = self._create_test_batch()
+        for level in (0, 1):
+            texture = self.processor.analyze_skin_texture_batch(images, level, chunk_size=5)
+            imperfections = self.processor.detect_skin_imperfections_batch(images, level, chunk_size=5)
+            color = self.processor.analyze_skin_color_batch(images, level, chunk_size=5)
+
+            self.assertEqual(texture.shape, (len(images),))
+            for i, image in enumerate(images):
+                self.assertEqual(texture[i], self.processor.analyze_skin_texture(image, level))
+                single = self.processor.detect_skin_imperfections(image, level)
+                self.assertEqual({name: values[i] for name, values in imperfections.items()}, single)
+                single = self.processor.analyze_skin_color(image, level)
+                self.assertEqual({name: values[i] for name, values in color.items()}, single)
+
+    def test_batch_features_match_opencv_reference(self):
+        """
+        测试批量特征与逐张调用OpenCV的原始实现一致
+        """
+        images = self._create_test_batch()
+        texture = self.processor.analyze_skin_texture_batch(images, 0)
+        ratios = self.processor.detect_skin_imperfections_batch(images, 0)['imperfection_ratio']
+        color = self.processor.analyze_skin_color_batch(images, 0)
+
+        for i, image in enumerate(images):
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            self.assertAlmostEqual(texture[i], cv2.Laplacian(gray, cv2.CV_64F).var(), places=8)
+
+            thresh = cv2.adaptiveThreshold(
+                gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2
+            )
+            self.assertEqual(ratios[i], np.sum(thresh > 0) / thresh.size)
+
+            l, a, b = cv2.split(cv2.cvtColor(image, cv2.COLOR_BGR2LAB))
+            self.assertEqual(color['brightness'][i], np.mean(l))
+            self.assertEqual(color['red_green'][i], np.mean(a))
+            self.assertEqual(color['blue_yellow'][i], np.mean(b))
+            self.assertAlmostEqual(color['color_variance'][i], np.std(l), places=8)
+
+
+if __name__ == '__main__':
+    unittest.main()
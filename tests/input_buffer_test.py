@@ -0,0 +1,126 @@
+import os
+import sys
+import tracemalloc
+import unittest
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_model.inference.input_buffer import InputBuffer
+
+
+def legacy_preprocess(image):
+    """原有的预处理路径, 作为数值与性能对照"""
+    image = cv2.resize(image, (224, 224))
+    image = image.astype(np.float32)
+    image = image / 255.0
+    return np.expand_dims(image, axis=0)
+
+
+class InputBufferTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备
+        """
+        rng = np.random.default_rng(0)
+        self.image = rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+        self.buffer = InputBuffer(batch_size=4)
+
+    def _traced_peak(self, func, repeat=5):
+        """返回多次调用过程中tracemalloc记录的峰值分配字节数"""
+        func()  # 预热
+        tracemalloc.start()
+        try:
+            for _ in range(repeat):
+                func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return peak
+
+    def test_matches_legacy_preprocessing(self):
+        """
+        测试结果与原有预处理一致
+        """
+        result = self.buffer.fill(0, self.image)
+        self.assertEqual(result.dtype, np.float32)
+        np.testing.assert_allclose(result, legacy_preprocess(self.image)[0], atol=1e-6)
+
+    def test_bgr_conversion_after_resize(self):
+        """
+        测试BGR输入在缩放后转换的结果与先转换再缩放一致
+        """
+        rgb = cv2.cvtColor(self.image, cv2.COLOR_BGR2RGB)
+        expected = legacy_preprocess(rgb)[0]
+        result = self.buffer.fill(0, self.image, bgr=True)
+        np.testing.assert_allclose(result, expected, atol=1e-6)
+
+    def test_uint8_buffer_skips_normalization(self):
+        """
+        测试图内归一化模型使用的 uint8 缓冲区
+        """
+        buffer = InputBuffer(dtype=np.uint8)
+        result = buffer.fill(0, self.image, bgr=True)
+        self.assertEqual(result.dtype, np.uint8)
+        expected = cv2.cvtColor(cv2.resize(self.image, (224, 224)), cv2.COLOR_BGR2RGB)
+        np.testing.assert_array_equal(result, expected)
+
+    def test_gray_and_alpha_inputs(self):
+        """
+        测试灰度与带透明通道的输入
+        """
+        gray = self.image[:, :, 0].copy()
+        self.assertEqual(self.buffer.fill(0, gray).shape, (224, 224, 3))
+
+        rgba = np.dstack([self.image, np.full(gray.shape, 255, np.uint8)])
+        expected = legacy_preprocess(self.image)[0]
+        np.testing.assert_allclose(self.buffer.fill(1, rgba), expected, atol=1e-6)
+
+    def test_fill_reuses_preallocated_memory(self):
+        """
+        测试预处理不再产生整图大小的分配
+        """
+        batch_address = self.buffer.batch.ctypes.data
+        peak = self._traced_peak(lambda: self.buffer.fill(0, self.image))
+        legacy_peak = self._traced_peak(lambda: legacy_preprocess(self.image))
+
+        # 单张 224x224x3 float32 输入约 600KB, 预分配路径应远低于此
+        input_bytes = 224 * 224 * 3 * 4
+        self.assertLess(peak, input_bytes // 10)
+        self.assertGreater(legacy_peak, input_bytes)
+        self.assertEqual(self.buffer.batch.ctypes.data, batch_address)
+
+    def test_fill_batch_uses_slots(self):
+        """
+        测试批量预处理写入各个槽位
+        """
+        images = [self.image, self.image[::-1].copy(), self.image[:, ::-1].copy()]
+        batch = self.buffer.fill_batch(images)
+        self.assertEqual(batch.shape, (3, 224, 224, 3))
+        for slot, image in enumerate(images):
+            np.testing.assert_allclose(batch[slot], legacy_preprocess(image)[0], atol=1e-6)
+
+        peak = self._traced_peak(lambda: self.buffer.fill_batch(images))
+        self.assertLess(peak, 224 * 224 * 3 * 4 // 10)
+
+    def test_fill_reuses_buffers(self):
+        """
+        测试重复预处理始终写入同一块槽位内存与中转区, 不随调用重新分配
+        """
+        staging = (self.buffer._rgb.ctypes.data, self.buffer._resized.ctypes.data)
+        first = self.buffer.fill(0, self.image, bgr=True)
+        second = self.buffer.fill(0, self.image[::-1].copy(), bgr=True)
+        self.assertTrue(np.shares_memory(first, self.buffer.batch))
+        self.assertEqual(first.ctypes.data, second.ctypes.data)
+        self.assertEqual((self.buffer._rgb.ctypes.data, self.buffer._resized.ctypes.data), staging)
+
+        # 容量足够时调整批次大小不重新分配
+        batch = self.buffer.batch
+        self.buffer.resize(2)
+        self.assertIs(self.buffer.batch, batch)
+
+
+if __name__ == '__main__':
+    unittest.main()
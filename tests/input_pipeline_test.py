@@ -0,0 +1,70 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_model', 'training'))
+
+from input_pipeline import build_dataset, load_numpy_arrays
+
+LABELS = ['skin_score', 'moisture_level', 'oil_level', 'sensitivity']
+
+
+class InputPipelineTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备: 不同尺寸的图片与一张损坏图片
+        """
+        self.work_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        for i in range(10):
+            image = rng.integers(0, 256, (200 + 10 * i, 180, 3), dtype=np.uint8)
+            cv2.imwrite(os.path.join(self.work_dir, f'{i}.png'), image)
+        with open(os.path.join(self.work_dir, 'broken.png'), 'wb') as f:
+            f.write(b'not an image')
+
+        paths = [f'{i}.png' for i in range(10)] + ['broken.png']
+        self.data = pd.DataFrame({'image_path': paths})
+        for j, name in enumerate(LABELS):
+            self.data[name] = np.arange(len(paths), dtype=np.float32) + j
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_matches_numpy_feed(self):
+        """
+        测试管道输出与逐张读取的 NumPy 数组一致, 并跳过损坏图片
+        """
+        dataset = build_dataset(self.data, LABELS, self.work_dir, batch_size=4)
+        batches = list(dataset.as_numpy_iterator())
+        self.assertEqual([len(images) for images, _ in batches], [4, 4, 2])
+
+        images = np.concatenate([images for images, _ in batches])
+        labels = np.concatenate([labels for _, labels in batches])
+        expected_images, expected_labels = load_numpy_arrays(self.data, LABELS, self.work_dir)
+        self.assertEqual(images.dtype, np.uint8)
+        self.assertEqual(images.shape, (10, 224, 224, 3))
+        np.testing.assert_array_equal(labels, expected_labels)
+        # 两种实现的双线性插值仅有舍入差异
+        self.assertLessEqual(np.abs(images.astype(int) - expected_images).max(), 1)
+
+    def test_disk_cache_with_shuffle(self):
+        """
+        测试磁盘缓存后每轮仍覆盖全部样本
+        """
+        cache = os.path.join(self.work_dir, 'cache', 'train')
+        dataset = build_dataset(self.data, LABELS, self.work_dir, batch_size=3,
+                                shuffle=True, cache=cache, seed=0)
+        for _ in range(2):
+            labels = np.concatenate([labels for _, labels in dataset.as_numpy_iterator()])
+            self.assertEqual(sorted(labels[:, 0]), list(range(10)))
+        self.assertTrue(os.path.exists(cache + '.index'))
+
+
+if __name__ == '__main__':
+    unittest.main()
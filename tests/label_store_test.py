@@ -0,0 +1,221 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+TRAINING_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_model', 'training')
+sys.path.insert(0, TRAINING_DIR)
+
+from label_store import LabelStore
+from data_collection import SkinDataCollector
+from data_collection_script import split_for
+
+
+def _append_worker(db_path: str, worker: int, count: int):
+    """
+    并发写入进程: 逐条追加记录
+    """
+    store = LabelStore(db_path)
+    for i in range(count):
+        store.append('annotations', {'image_path': f'{worker}_{i}.jpg', 'skin_score': i})
+
+
+class LabelStoreTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备
+        """
+        self.work_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.work_dir, 'labels.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_append_and_read_since(self):
+        """
+        测试单条与批量追加, 以及按高水位增量读取
+        """
+        store = LabelStore(self.db_path)
+        first = store.append('annotations', {'image_path': 'a.jpg', 'skin_score': np.float32(0.5)})
+        self.assertEqual(store.append_many('annotations', [
+            {'image_path': 'b.jpg', 'skin_score': 0.7, 'is_valid': True},
+            {'image_path': 'c.jpg', 'skin_score': 0.9}
+        ]), 2)
+
+        df = store.read('annotations')
+        self.assertEqual(list(df['image_path']), ['a.jpg', 'b.jpg', 'c.jpg'])
+        self.assertEqual(df['skin_score'].iloc[0], 0.5)
+        self.assertEqual(store.max_id('annotations'), df['id'].max())
+        self.assertEqual(list(store.read('annotations', since_id=first)['image_path']), ['b.jpg', 'c.jpg'])
+        self.assertTrue(store.read('validations').empty)
+
+        with self.assertRaises(ValueError):
+            store.append('unknown', {})
+
+    def test_concurrent_writers(self):
+        """
+        测试多个进程同时写入不丢失记录
+        """
+        LabelStore(self.db_path)
+        processes = [
+            multiprocessing.Process(target=_append_worker, args=(self.db_path, worker, 100))
+            for worker in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+        df = LabelStore(self.db_path).read('annotations')
+        self.assertEqual(len(df), 400)
+        self.assertEqual(df['image_path'].nunique(), 400)
+        self.assertTrue(df['id'].is_unique)
+
+    def test_migrate_csv_once(self):
+        """
+        测试旧 CSV 只导入一次, 缺失值不写入
+        """
+        csv_path = os.path.join(self.work_dir, 'validation.csv')
+        pd.DataFrame({
+            'image_path': ['a.jpg', 'b.jpg'],
+            'is_valid': [True, False],
+            'validation_notes': ['ok', None]
+        }).to_csv(csv_path, index=False)
+
+        store = LabelStore(self.db_path)
+        self.assertEqual(store.migrate_csv('validations', csv_path), 2)
+        self.assertEqual(store.migrate_csv('validations', csv_path), 0)
+        self.assertEqual(store.migrate_csv('validations', os.path.join(self.work_dir, 'missing.csv')), 0)
+
+        df = store.read('validations')
+        self.assertEqual(list(df['is_valid']), [True, False])
+        self.assertTrue(pd.isna(df['validation_notes'].iloc[1]))
+
+    def test_collector_unique_filenames(self):
+        """
+        测试采集图像使用唯一文件名并写入标签
+        """
+        pd.DataFrame({'image_path': ['skin_0.jpg'], 'skin_score': [1.0]}).to_csv(
+            os.path.join(self.work_dir, 'labels.csv'), index=False
+        )
+        collector = SkinDataCollector(self.work_dir)
+        image = np.zeros((8, 8, 3), dtype=np.uint8)
+        names = [collector.collect_image(image, {'skin_score': 2.0})]
+        names += collector.collect_images([image, image], [{'skin_score': 3.0}, {'skin_score': 4.0}])
+
+        self.assertEqual(len(set(names)), 3)
+        for name in names:
+            self.assertTrue(os.path.exists(os.path.join(collector.image_dir, name)))
+        labels = collector.store.read('labels')
+        self.assertEqual(list(labels['image_path']), ['skin_0.jpg'] + names)
+        self.assertEqual(list(labels['skin_score']), [1.0, 2.0, 3.0, 4.0])
+
+    def test_failed_image_write_adds_no_labels(self):
+        """
+        测试图像写入失败时报错, 标签不入库, 同批已写入的图像被删除
+        """
+        from unittest import mock
+        import cv2
+
+        collector = SkinDataCollector(self.work_dir)
+        image = np.zeros((8, 8, 3), dtype=np.uint8)
+        # 第一张正常写入, 第二张写入失败
+        outcomes = iter([cv2.imwrite, lambda *args: False])
+        with mock.patch('data_collection.cv2.imwrite', side_effect=lambda *args: next(outcomes)(*args)):
+            with self.assertRaisesRegex(IOError, '无法写入图片'):
+                collector.collect_images([image, image], [{'skin_score': 3.0}, {'skin_score': 4.0}])
+        with mock.patch('data_collection.cv2.imwrite', return_value=False):
+            with self.assertRaisesRegex(IOError, '无法写入图片'):
+                collector.collect_image(image, {'skin_score': 2.0})
+        self.assertEqual(os.listdir(collector.image_dir), [])
+        self.assertTrue(collector.store.read('labels').empty)
+
+    def test_incremental_training_set_build(self):
+        """
+        测试增量构建只加入新通过验证的标注, 已有样本的划分保持不变
+        """
+        store = LabelStore(self.db_path)
+        assign = lambda image_path: split_for(image_path, 0.2)
+        store.append_many('annotations', [{'image_path': f'{i}.jpg', 'skin_score': i} for i in range(100)])
+        store.append_many('validations', [{'image_path': f'{i}.jpg', 'is_valid': i % 10 != 0} for i in range(80)])
+
+        self.assertEqual(store.build_training_samples(assign), 72)
+        self.assertEqual(store.build_training_samples(assign), 0)
+        before = store.read_training_samples().set_index('image_path')['split']
+
+        # 新验证结果与旧标注连接, 新标注与旧验证结果连接, 未通过验证的不加入
+        store.append_many('validations', [{'image_path': f'{i}.jpg', 'is_valid': True} for i in range(80, 90)])
+        store.append_many('annotations', [{'image_path': f'{i}.jpg', 'skin_score': -i} for i in range(5)])
+        store.append('validations', {'image_path': '95.jpg', 'is_valid': False})
+        self.assertEqual(store.build_training_samples(assign), 14)
+
+        samples = store.read_training_samples()
+        self.assertEqual(len(samples), 86)
+        self.assertEqual(store.count_training_samples(), 86)
+        self.assertNotIn('95.jpg', set(samples['image_path']))
+        after = samples.drop_duplicates('image_path').set_index('image_path')['split']
+        self.assertTrue((after[before.index] == before).all())
+        for image_path, split in after.items():
+            self.assertEqual(split, assign(image_path))
+        self.assertEqual(len(store.read_training_samples('val')), (samples['split'] == 'val').sum())
+
+    def test_empty_tables_have_columns(self):
+        """
+        测试空表读取结果带有基本字段, 数据准备与报告不因缺列出错
+        """
+        store = LabelStore(self.db_path)
+        self.assertIn('is_valid', store.read('validations').columns)
+        self.assertIn('skin_score', store.read_training_samples().columns)
+
+        from data_collection_script import DataCollectionScript
+        cwd = os.getcwd()
+        os.chdir(self.work_dir)
+        try:
+            script = DataCollectionScript()
+            report = script.generate_data_report()
+            train_data, val_data = script.prepare_training_dataset()
+        finally:
+            script.store.close()
+            os.chdir(cwd)
+        self.assertEqual((report['total_samples'], report['valid_samples']), (0, 0))
+        self.assertTrue(train_data.empty and val_data.empty)
+        self.assertIn('skin_score', train_data.columns)
+
+    def test_latest_validation_decides_membership(self):
+        """
+        测试以每张图片最新的验证结果为准: 之后判为不通过的图片从训练集移除, 重新通过后再加入
+        """
+        store = LabelStore(self.db_path)
+        assign = lambda image_path: 'train'
+        store.append_many('annotations', [{'image_path': f'{i}.jpg', 'skin_score': i} for i in range(4)])
+        store.append_many('validations', [{'image_path': f'{i}.jpg', 'is_valid': True} for i in range(4)])
+        # 同一批中先通过后不通过, 以后者为准
+        store.append_many('validations', [{'image_path': '3.jpg', 'is_valid': False}])
+        self.assertEqual(store.build_training_samples(assign), 3)
+
+        store.append('validations', {'image_path': '1.jpg', 'is_valid': False})
+        store.append('annotations', {'image_path': '1.jpg', 'skin_score': 10})
+        self.assertEqual(store.build_training_samples(assign), 0)
+        self.assertEqual(sorted(store.read_training_samples()['image_path']), ['0.jpg', '2.jpg'])
+
+        store.append('validations', {'image_path': '1.jpg', 'is_valid': True})
+        self.assertEqual(store.build_training_samples(assign), 2)
+        self.assertEqual(sorted(store.read_training_samples()['image_path']), ['0.jpg', '1.jpg', '1.jpg', '2.jpg'])
+
+    def test_split_for_is_stable(self):
+        """
+        测试哈希划分确定且比例接近设定值
+        """
+        splits = [split_for(f'skin_{i}.jpg') for i in range(5000)]
+        self.assertEqual(splits, [split_for(f'skin_{i}.jpg') for i in range(5000)])
+        self.assertAlmostEqual(splits.count('val') / len(splits), 0.2, delta=0.02)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'ai_model', 'training'))
+
+import tensorflow as tf
+from ai_model.inference.model_inference import FACE_ZONES, FEATURE_LAYER, SkinAnalyzer, face_zones, feature_output
+from model_trainer import SkinAnalysisModel
+
+
+class RegionInferenceTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备
+        """
+        self.work_dir = tempfile.mkdtemp()
+        tf.keras.utils.set_random_seed(0)
+        model_path = os.path.join(self.work_dir, 'model.h5')
+        SkinAnalysisModel(input_shape=(32, 32, 3)).save_model(model_path)
+        self.analyzer = SkinAnalyzer(model_path)
+        self.image = np.random.default_rng(0).integers(0, 256, (480, 640, 3), dtype=np.uint8)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_face_zones_inside_roi(self):
+        """
+        测试各分区裁剪框位于人脸区域内
+        """
+        roi = (100, 50, 300, 400)
+        boxes = face_zones(self.image.shape, roi)
+        self.assertEqual(list(boxes), list(FACE_ZONES))
+        self.assertEqual(boxes['forehead'], (175, 70, 150, 92))
+        for x, y, w, h in boxes.values():
+            self.assertTrue(100 <= x and x + w <= 400 and 50 <= y and y + h <= 450)
+
+    def test_regions_single_forward_pass(self):
+        """
+        测试所有分区在一次前向计算中完成, 分区结果与逐个裁剪单独分析一致, 综合结果为分区平均
+        """
+        roi = (100, 50, 300, 400)
+        with mock.patch.object(self.analyzer._outputs_model, 'predict_on_batch',
+                               wraps=self.analyzer._outputs_model.predict_on_batch) as predict:
+            result = self.analyzer.analyze_regions(self.image, bgr=True, roi=roi)
+        self.assertEqual(predict.call_count, 1)
+        self.assertEqual(len(predict.call_args[0][0]), len(FACE_ZONES))
+
+        for name, (x, y, w, h) in face_zones(self.image.shape, roi).items():
+            expected = self.analyzer.analyze_skin(self.image, bgr=True, roi=(x, y, w, h))
+            zone = result['zones'][name]
+            self.assertEqual(zone['box'], expected['roi'])
+            for key in ('score', 'moisture', 'oil', 'sensitivity'):
+                self.assertAlmostEqual(zone[key], expected[key], places=3)
+
+        for key in ('score', 'moisture', 'oil', 'sensitivity'):
+            self.assertAlmostEqual(result[key], np.mean([zone[key] for zone in result['zones'].values()]), places=3)
+        self.assertIn('recommendations', result)
+        self.assertEqual(result['roi'], {'x': 100, 'y': 50, 'width': 300, 'height': 400})
+
+    def test_embedding(self):
+        """
+        测试图像嵌入取自特征层, 已归一化, 且与分析结果来自同一次前向计算
+        """
+        crop = self.image[50:450, 100:400]
+        embedding = self.analyzer.embed_batch([crop], bgr=True)[0]
+        self.assertEqual(embedding.shape, (256,))
+        self.assertAlmostEqual(float(np.linalg.norm(embedding)), 1.0, places=5)
+
+        result = self.analyzer.analyze_skin(self.image, bgr=True, roi=(100, 50, 300, 400), with_embedding=True)
+        np.testing.assert_allclose(result['embedding'], embedding, rtol=1e-5, atol=1e-6)
+        self.assertNotIn('embedding', self.analyzer.analyze_skin(crop, bgr=True))
+
+    def test_feature_layer_selection(self):
+        """
+        测试按名称选取特征层; 未命名特征层的旧模型取输出全连接层的输入, 两者都没有时报错
+        """
+        model = self.analyzer.model
+        self.assertIs(feature_output(model), model.get_layer(FEATURE_LAYER).output)
+
+        inputs = tf.keras.Input((8,))
+        hidden = tf.keras.layers.Dense(6, activation='relu')(inputs)
+        legacy = tf.keras.Model(inputs, tf.keras.layers.Dense(4)(tf.keras.layers.Dropout(0.5)(hidden)))
+        self.assertIs(feature_output(legacy), legacy.layers[-1].input)
+
+        headless = tf.keras.Model(inputs, tf.keras.layers.Activation('sigmoid')(tf.keras.layers.Dense(4)(hidden)))
+        with self.assertRaises(ValueError):
+            feature_output(headless)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_model', 'training'))
+
+import tensorflow as tf
+from model_trainer import SkinAnalysisModel
+from precision import ThroughputCallback, check_precision, compare_precisions
+from record_shards import ShardWriter
+
+
+class PrecisionTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备: 少量分片记录
+        """
+        self.work_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.record_dirs = {}
+        for split, count in (('train', 16), ('val', 8)):
+            record_dir = os.path.join(self.work_dir, split)
+            with ShardWriter(record_dir, image_shape=(32, 32, 3), label_names=['a', 'b', 'c', 'd']) as writer:
+                for i in range(count):
+                    writer.add(f'{i}.jpg', rng.integers(0, 256, (32, 32, 3), dtype=np.uint8),
+                               rng.random(4, dtype=np.float32))
+            self.record_dirs[split] = record_dir
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_mixed_precision_model(self):
+        """
+        测试混合精度模型: 隐藏层半精度计算, 变量与输出层保持 float32, 仅 float16 使用损失缩放
+        """
+        for precision, compute_dtype in (('mixed_bfloat16', 'bfloat16'), ('mixed_float16', 'float16')):
+            model = SkinAnalysisModel(input_shape=(32, 32, 3), precision=precision).model
+            conv = next(layer for layer in model.layers if isinstance(layer, tf.keras.layers.Conv2D))
+            self.assertEqual(conv.compute_dtype, compute_dtype)
+            self.assertEqual(conv.kernel.dtype, 'float32')
+            self.assertEqual(model.layers[-1].compute_dtype, 'float32')
+            self.assertEqual(isinstance(model.optimizer, tf.keras.mixed_precision.LossScaleOptimizer),
+                             precision == 'mixed_float16')
+
+            predictions = model.predict_on_batch(np.zeros((2, 32, 32, 3), dtype=np.uint8))
+            self.assertEqual(predictions.dtype, np.float32)
+        # 全局策略在构建后恢复, 不影响之后构建的模型
+        self.assertEqual(tf.keras.mixed_precision.global_policy().name, 'float32')
+
+        with self.assertRaises(ValueError):
+            check_precision('float64')
+
+    def test_throughput_counts_partial_batches(self):
+        """
+        测试吞吐按实际批大小计数: 每轮 10 个样本、批大小 4 时最后一批只计 2 个, 每轮第一批不计
+        """
+        model = tf.keras.Sequential([tf.keras.Input((3,)), tf.keras.layers.Dense(1)])
+        model.compile(optimizer='sgd', loss='mse')
+        throughput = ThroughputCallback(4, num_samples=10)
+        model.fit(np.zeros((10, 3), dtype=np.float32), np.zeros((10, 1), dtype=np.float32), batch_size=4,
+                  epochs=2, shuffle=False, callbacks=[throughput], verbose=0)
+        self.assertEqual(throughput.samples, 2 * (4 + 2))
+
+    def test_compare_precisions(self):
+        """
+        测试精度比较报告: 各精度的训练吞吐、评估指标及相对 float32 基线的差值
+        """
+        results = compare_precisions(self.record_dirs['train'], self.record_dirs['val'],
+                                     epochs=1, batch_size=4)
+
+        self.assertEqual(set(results), {'float32', 'mixed_bfloat16'})
+        self.assertIn('onednn', results['float32']['environment'])
+        self.assertGreater(results['float32']['train_samples_per_second'], 0)
+        differences = results['mixed_bfloat16']['metric_differences']
+        self.assertEqual(set(differences), {f'{name}.{metric}' for name in
+                                            ('skin_score', 'moisture', 'oil', 'sensitivity')
+                                            for metric in ('mse', 'mae', 'r2')})
+        self.assertTrue(np.isfinite(differences['oil.mae']['candidate']))
+        self.assertGreater(results['mixed_bfloat16']['speedup'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
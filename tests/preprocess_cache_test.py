@@ -0,0 +1,124 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_model', 'training'))
+
+from preprocess_cache import PreprocessCache, load_image
+from preprocess_data import prepare_dataset
+
+
+class PreprocessCacheTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备
+        """
+        self.work_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.work_dir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _entries(self):
+        return sorted(
+            name for _, _, files in os.walk(self.cache_dir) for name in files if name.endswith('.npy')
+        )
+
+    def test_hit_skips_decode(self):
+        """
+        测试相同内容与参数命中缓存, 参数变化时重新处理
+        """
+        path = os.path.join(self.work_dir, 'a.bin')
+        with open(path, 'wb') as f:
+            f.write(b'source bytes')
+        cache = PreprocessCache(self.cache_dir)
+        calls = []
+
+        def decode(data):
+            calls.append(data)
+            return np.frombuffer(data, dtype=np.uint8).copy()
+
+        first = cache.load(path, {'size': 1}, decode)
+        second = cache.load(path, {'size': 1}, decode)
+        np.testing.assert_array_equal(first, second)
+        self.assertEqual(len(calls), 1)
+
+        cache.load(path, {'size': 2}, decode)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(self._entries()), 2)
+
+    def test_preprocessing_paths_share_cache_entries(self):
+        """
+        测试两条预处理路径使用同一套参数与解码, 同一图片只产生一个缓存条目
+        """
+        from data_preprocessing import DataPreprocessor
+
+        path = os.path.join(self.work_dir, 'face.jpg')
+        cv2.imwrite(path, np.random.default_rng(0).integers(0, 256, (300, 260, 3), dtype=np.uint8))
+        preprocessor = DataPreprocessor(self.work_dir, os.path.join(self.work_dir, 'out'), cache_dir=self.cache_dir)
+        first = preprocessor.load_image(path)
+        second = load_image(path, cache=PreprocessCache(self.cache_dir))
+        np.testing.assert_array_equal(first, second)
+        self.assertEqual(first.shape, (224, 224, 3))
+        self.assertEqual(len(self._entries()), 1)
+
+    def test_prune_evicts_least_recently_used(self):
+        """
+        测试超出大小上限时淘汰最久未使用的条目
+        """
+        cache = PreprocessCache(self.cache_dir, max_bytes=10 ** 9)
+        keys = [cache.key(bytes([i]), {}) for i in range(4)]
+        for i, key in enumerate(keys):
+            cache.put(key, np.full(1000, i, dtype=np.uint8))
+            os.utime(cache._path(key), (i, i))
+        # 读取最早写入的条目, 使其成为最近使用
+        cache.get(keys[0])
+
+        entry_size = os.path.getsize(cache._path(keys[0]))
+        cache.max_bytes = 2 * entry_size
+        stats = cache.prune()
+
+        self.assertEqual(stats['evicted'], 2)
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNotNone(cache.get(keys[3]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNone(cache.get(keys[2]))
+
+    def test_rebuild_only_processes_changed_images(self):
+        """
+        测试重新构建数据集时只处理新增或变化的图片, 输出保持一致
+        """
+        data_dir = os.path.join(self.work_dir, 'source')
+        os.makedirs(data_dir)
+        rng = np.random.default_rng(0)
+        for i in range(6):
+            cv2.imwrite(os.path.join(data_dir, f'{i}.png'), rng.integers(0, 256, (40, 30, 3), dtype=np.uint8))
+
+        output_dir = os.path.join(self.work_dir, 'output')
+        prepare_dataset(data_dir, output_dir, workers=1, cache_dir=self.cache_dir)
+        first_entries = self._entries()
+        first_output = cv2.imread(os.path.join(output_dir, 'images', '0.png'))
+        self.assertEqual(len(first_entries), 6)
+
+        # 修改一张图片并新增一张: 只新增两个条目
+        time.sleep(0.01)
+        cv2.imwrite(os.path.join(data_dir, '1.png'), np.zeros((40, 30, 3), dtype=np.uint8))
+        cv2.imwrite(os.path.join(data_dir, '6.png'), np.ones((40, 30, 3), dtype=np.uint8))
+        stats = prepare_dataset(data_dir, output_dir, workers=1, cache_dir=self.cache_dir)
+        self.assertEqual(len(self._entries()), 8)
+        self.assertEqual(stats['cache']['entries'], 8)
+        np.testing.assert_array_equal(cv2.imread(os.path.join(output_dir, 'images', '0.png')), first_output)
+
+        # 预处理参数变化时生成新的条目
+        prepare_dataset(data_dir, output_dir, workers=1, target_size=(64, 64), cache_dir=self.cache_dir)
+        self.assertEqual(len(self._entries()), 15)
+
+
+if __name__ == '__main__':
+    unittest.main()
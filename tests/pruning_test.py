@@ -0,0 +1,121 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_model', 'training'))
+
+import tensorflow as tf
+from model_trainer import FEATURE_LAYER, SkinAnalysisModel
+from pruning import cluster_weights, prune_and_benchmark, prune_model
+from record_shards import ShardWriter
+
+
+def disconnect_second_half(model):
+    """把每个卷积层与隐藏全连接层的后一半通道置零并断开其下游连接, 剪枝 50% 时恰好去掉这些通道"""
+    conv_layers = [layer for layer in model.layers if isinstance(layer, tf.keras.layers.Conv2D)]
+    dense_layers = [layer for layer in model.layers if isinstance(layer, tf.keras.layers.Dense)]
+    previous = None
+    for layer in conv_layers + dense_layers:
+        kernel, bias = layer.get_weights()
+        if previous is not None:
+            if layer is dense_layers[0]:
+                # Flatten 之后每个空间位置依次排列全部通道
+                view = kernel.reshape(-1, previous, kernel.shape[-1])
+                view[:, previous // 2:, :] = 0
+            elif isinstance(layer, tf.keras.layers.Dense):
+                kernel[previous // 2:] = 0
+            else:
+                kernel[:, :, previous // 2:, :] = 0
+        if layer is not dense_layers[-1]:
+            kernel[..., kernel.shape[-1] // 2:] = 0
+            previous = kernel.shape[-1]
+        layer.set_weights([kernel, bias])
+
+
+class PruningTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备
+        """
+        self.work_dir = tempfile.mkdtemp()
+        tf.keras.utils.set_random_seed(0)
+        self.model = SkinAnalysisModel(input_shape=(32, 32, 3)).model
+        self.images = np.random.default_rng(0).integers(0, 256, (4, 48, 40, 3), dtype=np.uint8)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_prune_model_removes_channels(self):
+        """
+        测试剪枝后各层通道数减少, 且去掉的通道不影响输出
+        """
+        unchanged = prune_model(self.model, 0.0)
+        np.testing.assert_allclose(unchanged.predict_on_batch(self.images), self.model.predict_on_batch(self.images),
+                                   rtol=1e-5, atol=1e-5)
+
+        disconnect_second_half(self.model)
+        pruned = prune_model(self.model, 0.5)
+        widths = [layer.filters if isinstance(layer, tf.keras.layers.Conv2D) else layer.units
+                  for layer in pruned.layers if isinstance(layer, (tf.keras.layers.Conv2D, tf.keras.layers.Dense))]
+        self.assertEqual(widths, [16, 32, 64, 128, 4])
+        # 特征层名称保留, SkinAnalyzer 仍按名称取图像嵌入
+        self.assertEqual(pruned.get_layer(FEATURE_LAYER).units, 128)
+        self.assertLess(pruned.count_params(), self.model.count_params() / 3)
+        np.testing.assert_allclose(pruned.predict_on_batch(self.images), self.model.predict_on_batch(self.images),
+                                   rtol=1e-4, atol=1e-5)
+
+    def test_cluster_weights(self):
+        """
+        测试权重聚类后每个核只剩 2**bits 个不同取值
+        """
+        cluster_weights(self.model, bits=3)
+        for layer in self.model.layers:
+            if isinstance(layer, (tf.keras.layers.Conv2D, tf.keras.layers.Dense)):
+                self.assertLessEqual(len(np.unique(layer.get_weights()[0])), 8)
+
+    def test_prune_and_benchmark(self):
+        """
+        测试剪枝流水线: 微调、聚类、导出并给出每个剪枝比例的延迟/大小/精度
+        """
+        rng = np.random.default_rng(0)
+        record_dir = os.path.join(self.work_dir, 'records')
+        with ShardWriter(record_dir, image_shape=(32, 32, 3), label_names=['a', 'b', 'c', 'd']) as writer:
+            for i in range(12):
+                writer.add(f'{i}.jpg', rng.integers(0, 256, (32, 32, 3), dtype=np.uint8),
+                           rng.random(4, dtype=np.float32))
+        model_path = os.path.join(self.work_dir, 'model.h5')
+        self.model.save(model_path)
+
+        output_dir = os.path.join(self.work_dir, 'pruning')
+        rows = prune_and_benchmark(model_path, record_dir, record_dir, record_dir, output_dir,
+                                   sparsities=(0.5, 0.75), fine_tune_epochs=1, batch_size=4, cluster_bits=4)
+        self.assertEqual([row['model'] for row in rows], ['original', 'pruned_50', 'pruned_75'])
+        self.assertEqual([row['sparsity'] for row in rows], [0.0, 0.5, 0.75])
+        self.assertTrue(rows[0]['parameters'] > rows[1]['parameters'] > rows[2]['parameters'])
+        self.assertTrue(rows[0]['size_mb'] > rows[1]['size_mb'] > rows[2]['size_mb'])
+        self.assertLess(rows[1]['compressed_mb'], rows[1]['size_mb'])
+        self.assertTrue(os.path.exists(os.path.join(output_dir, 'pruned_75.h5')))
+        for row in rows:
+            self.assertGreater(row['load_ms'], 0)
+            self.assertTrue(np.isfinite(row['mae']))
+
+
+    def test_legacy_float_input_model_rejected(self):
+        """
+        测试接收浮点输入的旧模型被拒绝, 而不是用 0-255 的 uint8 图像微调
+        """
+        legacy = tf.keras.Sequential([tf.keras.Input((32, 32, 3)), tf.keras.layers.Flatten(),
+                                      tf.keras.layers.Dense(4)])
+        model_path = os.path.join(self.work_dir, 'legacy.h5')
+        legacy.save(model_path)
+        with self.assertRaisesRegex(ValueError, 'uint8'):
+            prune_and_benchmark(model_path, self.work_dir, self.work_dir, self.work_dir,
+                                os.path.join(self.work_dir, 'pruning'))
+        self.assertFalse(os.path.exists(os.path.join(self.work_dir, 'pruning')))
+
+if __name__ == '__main__':
+    unittest.main()
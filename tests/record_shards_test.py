@@ -0,0 +1,133 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_model', 'training'))
+
+from record_shards import ShardDataset, ShardWriter
+
+
+class RecordShardsTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备
+        """
+        self.work_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.images = rng.integers(0, 256, (23, 8, 6, 3), dtype=np.uint8)
+        self.labels = rng.random((23, 4), dtype=np.float32)
+        self.keys = [f'img_{i}.jpg' for i in range(23)]
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _write(self, label_names=('a', 'b', 'c', 'd')):
+        with ShardWriter(self.work_dir, image_shape=(8, 6, 3),
+                         label_names=label_names, shard_size=5, metadata={'source': 'test'}) as writer:
+            for key, image, label in zip(self.keys, self.images, self.labels):
+                writer.add(key, image, label)
+        return ShardDataset(self.work_dir)
+
+    def test_roundtrip(self):
+        """
+        测试写入后顺序读取与随机访问的结果一致
+        """
+        dataset = self._write()
+        self.assertEqual(len(dataset), 23)
+        self.assertEqual(len(dataset.index['shards']), 5)
+        self.assertEqual(dataset.keys, self.keys)
+        self.assertEqual(dataset.metadata, {'source': 'test'})
+
+        images, labels = dataset.to_arrays()
+        np.testing.assert_array_equal(images, self.images)
+        np.testing.assert_array_equal(labels, self.labels)
+
+        image, label = dataset[dataset.index_of('img_17.jpg')]
+        np.testing.assert_array_equal(image, self.images[17])
+        np.testing.assert_array_equal(label, self.labels[17])
+
+        indices = [22, 0, 9, 5, 4]
+        images, labels = dataset.get_batch(indices)
+        np.testing.assert_array_equal(images, self.images[indices])
+        np.testing.assert_array_equal(labels, self.labels[indices])
+
+    def test_iter_batches_across_shards(self):
+        """
+        测试跨分片的顺序批次读取
+        """
+        dataset = self._write()
+        batches = list(dataset.iter_batches(batch_size=7))
+        self.assertEqual([len(images) for images, _ in batches], [7, 7, 7, 2])
+        np.testing.assert_array_equal(np.concatenate([images for images, _ in batches]), self.images)
+
+    def test_without_labels(self):
+        """
+        测试没有标签的记录
+        """
+        dataset = self._write(label_names=None)
+        self.assertEqual(len(dataset), 23)
+        images, labels = dataset.to_arrays()
+        self.assertIsNone(labels)
+        np.testing.assert_array_equal(images, self.images)
+
+    def test_rejects_mismatched_image_shape(self):
+        """
+        测试尺寸不一致的图像被拒绝
+        """
+        with ShardWriter(self.work_dir, image_shape=(8, 6, 3)) as writer:
+            with self.assertRaises(ValueError):
+                writer.add('bad.jpg', np.zeros((6, 8, 3), np.uint8))
+
+    def test_interrupted_write_leaves_no_index(self):
+        """
+        测试写入中途出错时不写索引并清理部分分片, 不会被当作完整记录
+        """
+        self._write()
+        with self.assertRaises(RuntimeError):
+            with ShardWriter(self.work_dir, image_shape=(8, 6, 3), shard_size=5) as writer:
+                for key, image in zip(self.keys[:7], self.images):
+                    writer.add(key, image)
+                raise RuntimeError('interrupted')
+        self.assertFalse(ShardDataset.exists(self.work_dir))
+        self.assertEqual(os.listdir(self.work_dir), [])
+
+    def test_record_sequence_covers_every_record_once(self):
+        """
+        测试训练数据源每轮按批次读取全部记录且各只一次
+        """
+        from record_sequence import RecordSequence
+
+        sequence = RecordSequence(self._write(), batch_size=4, shuffle=True, seed=0)
+        self.assertEqual(len(sequence), 6)
+        for _ in range(2):
+            batches = [sequence[i] for i in range(len(sequence))]
+            images = np.concatenate([images for images, _ in batches])
+            labels = np.concatenate([labels for _, labels in batches])
+            order = np.argsort(labels[:, 0])
+            np.testing.assert_array_equal(images[order], self.images[np.argsort(self.labels[:, 0])])
+            sequence.on_epoch_end()
+
+    def test_record_sequence_reshuffles_batch_composition(self):
+        """
+        测试打乱在样本级进行: 各轮的批次组成不同, 不打乱时批次为连续记录
+        """
+        from record_sequence import RecordSequence
+
+        sequence = RecordSequence(self._write(), batch_size=4, shuffle=True, seed=0)
+        compositions = []
+        for epoch in range(2):
+            sequence.set_epoch(epoch)
+            compositions.append({tuple(sorted(labels[:, 0])) for _, labels in
+                                 (sequence[i] for i in range(len(sequence)))})
+        self.assertNotEqual(compositions[0], compositions[1])
+
+        ordered = RecordSequence(self._write(), batch_size=4)
+        np.testing.assert_array_equal(ordered[1][0], self.images[4:8])
+
+
+if __name__ == '__main__':
+    unittest.main()
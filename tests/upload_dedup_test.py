@@ -0,0 +1,108 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.upload_dedup import UploadDeduplicator, dhash, hamming_distance, phash
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class UploadDedupTest(unittest.TestCase):
+    def setUp(self):
+        """
+        测试前准备: 一张照片, 一张轻微变化的连拍, 一张不同的照片
+        """
+        self.work_dir = tempfile.mkdtemp()
+        self.image = self._create_test_image(0)
+        # 连拍: 轻微平移、亮度变化与噪声
+        rng = np.random.default_rng(5)
+        shifted = np.roll(self.image, 3, axis=1).astype(np.int16) + 6
+        self.burst = np.clip(shifted + rng.integers(-4, 5, shifted.shape), 0, 255).astype(np.uint8)
+        self.other = self._create_test_image(1)
+
+    def _create_test_image(self, seed: int) -> np.ndarray:
+        """
+        创建测试图像: 渐变背景上若干随机色块
+        """
+        rng = np.random.default_rng(seed)
+        y, x = np.mgrid[0:480, 0:360]
+        image = np.stack([x * 0.3 + y * 0.1, y * 0.25, 200 - x * 0.2], axis=-1).astype(np.uint8)
+        for _ in range(6):
+            center = (int(rng.integers(0, 360)), int(rng.integers(0, 480)))
+            axes = (int(rng.integers(30, 120)), int(rng.integers(30, 120)))
+            color = tuple(int(value) for value in rng.integers(0, 256, 3))
+            cv2.ellipse(image, center, axes, 0, 0, 360, color, -1)
+        return image
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_hashes_separate_near_duplicates(self):
+        """
+        测试连拍照片的哈希距离小, 不同照片的哈希距离大
+        """
+        for method in (dhash, phash):
+            self.assertLessEqual(hamming_distance(method(self.image), method(self.burst)), 6)
+            self.assertGreater(hamming_distance(method(self.image), method(self.other)), 16)
+            self.assertLess(method(self.image), 2 ** 64)
+
+    def test_window_threshold_and_counters(self):
+        """
+        测试窗口内的近似重复复用结果, 不同用户、不同照片与过期条目不命中, 并统计跳过的推理次数
+        """
+        clock = FakeClock()
+        dedup = UploadDeduplicator(threshold=6, window_seconds=60, clock=clock)
+        image_hash, duplicate = dedup.lookup(1, self.image)
+        self.assertIsNone(duplicate)
+        dedup.record(1, image_hash, {'score': 80.0}, analysis_id=7)
+
+        clock.now = 30
+        _, duplicate = dedup.lookup(1, self.burst)
+        self.assertEqual(duplicate['result'], {'score': 80.0})
+        self.assertEqual(duplicate['analysis_id'], 7)
+        self.assertIsNone(dedup.lookup(2, self.burst)[1])
+        self.assertIsNone(dedup.lookup(1, self.other)[1])
+
+        # 窗口从首次分析算起, 命中不延长有效期: 即使 30 秒时命中过, 61 秒时也已过期
+        clock.now = 55
+        self.assertIsNotNone(dedup.lookup(1, self.image)[1])
+        clock.now = 61
+        self.assertIsNone(dedup.lookup(1, self.image)[1])
+
+        stats = dedup.stats()
+        self.assertEqual(stats['lookups'], 6)
+        self.assertEqual(stats['skipped_inferences'], 2)
+        self.assertAlmostEqual(stats['hit_rate'], 2 / 6)
+        self.assertEqual(stats['tracked_keys'], 0)
+
+        strict = UploadDeduplicator(threshold=0, clock=clock)
+        strict.record(1, strict.image_hash(self.image), {})
+        self.assertIsNone(strict.lookup(1, self.burst)[1])
+
+    def test_hash_from_file(self):
+        """
+        测试从文件按缩小比例解码计算哈希, 与内存中图像的哈希一致
+        """
+        path = os.path.join(self.work_dir, 'upload.jpg')
+        cv2.imwrite(path, self.image)
+        dedup = UploadDeduplicator(method='phash')
+        self.assertLessEqual(hamming_distance(dedup.image_hash(path), dedup.image_hash(self.image)), 4)
+        with self.assertRaises(ValueError):
+            UploadDeduplicator(method='md5')
+
+
+if __name__ == '__main__':
+    unittest.main()